@@ -1,57 +1,303 @@
 import logging
-logging.basicConfig(level=logging.DEBUG)
+import os
 logger = logging.getLogger(__name__)
-logger.debug("Starting Flask application")
 
-from flask import Flask, request
-from flask_restx import Api, Resource, fields
-from flask_sqlalchemy import SQLAlchemy
+import json
+import threading
+from datetime import timezone
+from functools import wraps
+import click
+from flask import Blueprint, Flask, Response, abort, current_app, request, make_response, send_file, stream_with_context
+from werkzeug.http import http_date, quote_etag
+from flask_restx import Api, Resource, fields, marshal
 from flask_cors import CORS
-from flask_migrate import Migrate
-from sqlalchemy import func
-logger.debug("Initializing Flask app")
-app = Flask(__name__)
-logger.debug("Flask app initialized")
-CORS(app, resources={r"/*": {"origins": "*", "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"], "allow_headers": ["Content-Type"]}}, support_credentials=True)
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///ranobe.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-db = SQLAlchemy(app)
-
-api = Api(app, version='1.0', title='Ranobe Reader API',
+from flask_migrate import Migrate, stamp
+from sqlalchemy import LargeBinary, func, inspect, or_, select, text, type_coerce
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import undefer
+import search
+from books import FORMATS as BOOK_FORMATS, BookCache, count_book_chapters, iter_book_chapters, load_book, stream_book
+from cache import RANOBE_LIST_CACHE_KEY, cached, create_cache, ranobe_cache_key
+import compression
+from compression import codec
+from jobs import job_stats
+from metrics import Metrics
+from paragraphs import iter_paragraphs, paragraph_offsets, paragraph_range, range_size
+from progress import ProgressBuffer
+from models import (
+    db, Ranobe, Chapter, CompressionDictionary, Bookmark,
+    CONTENT_LANGS, PREVIEW_LENGTH, TRANSLATION_IN_PROGRESS, TRANSLATION_COMPLETE,
+    create_schema, iter_ndjson, ranobe_version_bump, write_chapter_batch,
+)
+from storage import retry_on_busy, storage, use_writer
+
+# Импорт модуля не открывает базу и файлы и не создаёт приложение: его собирает create_app(),
+# таблицы создаёт `flask --app app init-db` или миграции
+
+def load_config(app):
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('RANOBE_DATABASE_URI', 'sqlite:///ranobe.db')
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['LOG_LEVEL'] = os.getenv('RANOBE_LOG_LEVEL', 'INFO').upper()
+    app.config['RESPONSE_CACHE'] = os.getenv('RANOBE_RESPONSE_CACHE', 'lru')  # lru, sqlite или none
+    app.config['RESPONSE_CACHE_MAX_BYTES'] = int(os.getenv('RANOBE_RESPONSE_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+    app.config['RESPONSE_CACHE_PATH'] = os.getenv('RANOBE_RESPONSE_CACHE_PATH', os.path.join(app.instance_path, 'response_cache.db'))
+    # Переопределения storage.DEFAULT_PROFILE
+    app.config['SQLITE_PROFILE'] = {'enabled': os.getenv('RANOBE_SQLITE_PROFILE', 'on') != 'off'}
+    # Позиции чтения копятся в памяти и пишутся в базу раз в столько секунд (0 - сразу)
+    app.config['PROGRESS_FLUSH_INTERVAL'] = float(os.getenv('RANOBE_PROGRESS_FLUSH_INTERVAL', 2))
+    # Предел текста глав в одном ответе /bundle; глава, с которой начинается пачка, отдаётся всегда
+    app.config['BUNDLE_MAX_BYTES'] = int(os.getenv('RANOBE_BUNDLE_MAX_BYTES', 1024 * 1024))
+    # Сколько следующих глав подсказывать в заголовке Link ответа одной главы
+    app.config['PREFETCH_LINKS'] = int(os.getenv('RANOBE_PREFETCH_LINKS', 1))
+    # Абзацев в одном JSON-ответе /paragraphs по умолчанию и максимум
+    app.config['PARAGRAPH_PAGE_SIZE'] = int(os.getenv('RANOBE_PARAGRAPH_PAGE_SIZE', 50))
+    app.config['PARAGRAPH_MAX_LIMIT'] = int(os.getenv('RANOBE_PARAGRAPH_MAX_LIMIT', 1000))
+    # Собранные EPUB/ZIP (books.py); 0 - не хранить
+    app.config['BOOK_CACHE_DIR'] = os.getenv('RANOBE_BOOK_CACHE_DIR', os.path.join(app.instance_path, 'books'))
+    app.config['BOOK_CACHE_MAX_BYTES'] = int(os.getenv('RANOBE_BOOK_CACHE_MAX_BYTES', 512 * 1024 * 1024))
+    # Метрики для /metrics (metrics.py); пороги медленных запросов и SQL-операторов в секундах
+    app.config['METRICS_ENABLED'] = os.getenv('RANOBE_METRICS', 'on') != 'off'
+    app.config['METRICS_PATH'] = os.getenv('RANOBE_METRICS_PATH', os.path.join(app.instance_path, 'metrics.db'))
+    app.config['METRICS_FLUSH_INTERVAL'] = float(os.getenv('RANOBE_METRICS_FLUSH_INTERVAL', 5))
+    app.config['SLOW_REQUEST_SECONDS'] = float(os.getenv('RANOBE_SLOW_REQUEST_SECONDS', 1.0))
+    app.config['SLOW_QUERY_SECONDS'] = float(os.getenv('RANOBE_SLOW_QUERY_SECONDS', 0.25))
+
+api = Api(version='1.0', title='Ranobe Reader API',
     description='A simple Ranobe Reader API',
 )
-migrate = Migrate(app, db)
-
-# Модели базы данных
-class Ranobe(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    title = db.Column(db.String(100), nullable=False)
-    chapters = db.relationship('Chapter', backref='ranobe', lazy=True)
-
-class Chapter(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    ranobe_id = db.Column(db.Integer, db.ForeignKey('ranobe.id'), nullable=False)
-    chapter_id = db.Column(db.Integer, nullable=False)  # New field
-    chapter_number_origin = db.Column(db.Integer, nullable=False)  # Renamed from chapter_number
-    title_ru = db.Column(db.String(200))
-    title_en = db.Column(db.String(200))
-    content_ru = db.Column(db.Text)
-    content_en = db.Column(db.Text)
-
-class Bookmark(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    ranobe_id = db.Column(db.Integer, db.ForeignKey('ranobe.id'), nullable=False)
-    chapter_id = db.Column(db.Integer, nullable=False)
-    created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
-    updated_at = db.Column(db.DateTime, default=db.func.current_timestamp(), onupdate=db.func.current_timestamp())
-
-    ranobe = db.relationship('Ranobe', backref=db.backref('bookmarks', lazy=True))
-
-    __table_args__ = (db.UniqueConstraint('ranobe_id', name='uix_1'),)
-
-# Создание таблиц
-with app.app_context():
-    db.create_all()
+# Маршруты вне API и команды flask
+blueprint = Blueprint('ranobe', __name__, cli_group=None)
+
+def include_object(object, name, type_, reflected, compare_to):
+    # FTS5-таблицы поиска создаются вне моделей, autogenerate их не трогает
+    return not (type_ == 'table' and reflected and name.startswith(search.FTS_TABLE))
+
+migrate = Migrate(db=db, render_as_batch=True, include_object=include_object)
+
+def create_app(config=None):
+    '''Build the app; the database and instance files are first touched by a request or a command'''
+    app = Flask(__name__)
+    load_config(app)
+    app.config.update(config or {})
+    # Ничего не меняет, если логирование уже настроено (gunicorn, вызывающий скрипт)
+    logging.basicConfig(level=app.config['LOG_LEVEL'])
+    logger.debug("Initializing Flask app")
+    CORS(app, resources={r"/*": {"origins": "*", "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"], "allow_headers": ["Content-Type"], "expose_headers": ["Link", "ETag"]}}, support_credentials=True)
+    db.init_app(app)
+    storage.init_app(app, db)
+    api.init_app(app)
+    migrate.init_app(app, db)
+    app.register_blueprint(blueprint)
+    if app.config['METRICS_ENABLED']:
+        Metrics(app.config['METRICS_PATH'], app.config['METRICS_FLUSH_INTERVAL'],
+                app.config['SLOW_REQUEST_SECONDS'], app.config['SLOW_QUERY_SECONDS']).init_app(app, db)
+    codec.fetch = fetch_compression_dictionaries
+    return app
+
+# Кеши и буфер позиции чтения создаются при первом обращении, в том процессе, который ими пользуется
+_extensions_lock = threading.Lock()
+
+def extension(name, factory):
+    '''Object kept in current_app.extensions, built by factory(app) on first use'''
+    app = current_app._get_current_object()
+    value = app.extensions.get(name)
+    if value is None:
+        with _extensions_lock:
+            value = app.extensions.get(name)
+            if value is None:
+                value = app.extensions[name] = factory(app)
+    return value
+
+def response_cache():
+    def factory(app):
+        os.makedirs(app.instance_path, exist_ok=True)
+        return create_cache(
+            app.config['RESPONSE_CACHE'],
+            app.config['RESPONSE_CACHE_MAX_BYTES'],
+            app.config['RESPONSE_CACHE_PATH']
+        )
+    return extension('response_cache', factory)
+
+def book_cache():
+    return extension('book_cache', lambda app: BookCache(app.config['BOOK_CACHE_DIR'], app.config['BOOK_CACHE_MAX_BYTES']))
+
+def progress_buffer():
+    return extension('progress_buffer', lambda app: ProgressBuffer(db.engine, app.config['PROGRESS_FLUSH_INTERVAL']))
+
+def invalidate_ranobe(ranobe_id=None, listing=False):
+    '''Drop cached responses touched by a committed write'''
+    keys = [RANOBE_LIST_CACHE_KEY] if listing else []
+    if ranobe_id is not None:
+        keys.append(ranobe_cache_key(ranobe_id))
+    response_cache().delete(*keys)
+
+# Сжатие текстов глав
+def fetch_compression_dictionaries():
+    with storage.read_engine(db.engine).connect() as connection:
+        return connection.execute(
+            select(CompressionDictionary.id, CompressionDictionary.lang, CompressionDictionary.data)
+            .order_by(CompressionDictionary.created_at, CompressionDictionary.id)
+        ).all()
+
+def format_preview(content, max_length=PREVIEW_LENGTH):
+    if content:
+        return content[:max_length] + ('...' if len(content) > max_length else '')
+    return None
+
+def chapter_toc_query(ranobe_id):
+    '''Table of contents of a ranobe without loading chapter bodies'''
+    return db.session.query(
+        Chapter.id,
+        Chapter.chapter_id,
+        Chapter.chapter_number_origin,
+        Chapter.title_ru,
+        Chapter.title_en,
+        Chapter.content_preview_ru,
+        Chapter.content_preview_en,
+        Chapter.translation_status
+    ).filter(Chapter.ranobe_id == ranobe_id).order_by(Chapter.chapter_number_origin)
+
+def bump_ranobe_version(ranobe_id):
+    '''Mark a ranobe as changed; called by every write to the ranobe or its chapters'''
+    db.session.execute(ranobe_version_bump(ranobe_id))
+
+def bump_chapter_version(chapter):
+    chapter.version = Chapter.version + 1
+    bump_ranobe_version(chapter.ranobe_id)
+
+# Условные GET-запросы
+def make_etag(kind, row_id, version, updated_at, suffix=''):
+    # updated_at отличает строку, пересозданную с тем же id
+    stamp = int(updated_at.replace(tzinfo=timezone.utc).timestamp()) if updated_at else 0
+    return f'{kind}{row_id}-v{version}-{stamp}{suffix}'
+
+def conditional(validator):
+    '''Answer If-None-Match / If-Modified-Since with 304 before the resource body is loaded.
+
+    validator receives the view arguments and returns (etag, updated_at)
+    from a cheap lookup, or None to let the view produce its own 404.
+    '''
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            validators = validator(**kwargs)
+            if validators is None:
+                return func(*args, **kwargs)
+
+            etag, updated_at = validators
+            headers = {'ETag': quote_etag(etag)}
+            if updated_at:
+                updated_at = updated_at.replace(tzinfo=timezone.utc)
+                headers['Last-Modified'] = http_date(updated_at)
+
+            if request.if_none_match:
+                not_modified = request.if_none_match.contains(etag)
+            else:
+                not_modified = bool(updated_at and request.if_modified_since
+                                    and updated_at.replace(microsecond=0) <= request.if_modified_since)
+            if not_modified:
+                response = make_response('', 304)
+                response.headers.update(headers)
+                return response
+
+            result = func(*args, **kwargs)
+            if isinstance(result, Response):
+                # Потоковый ответ уже собран, валидаторы дописываются в него
+                if result.status_code == 200:
+                    result.headers.update(headers)
+                return result
+            if not isinstance(result, tuple):
+                result = (result, 200)
+            data, code, extra_headers = (result + ({},))[:3]
+            if code == 200:
+                extra_headers = {**headers, **extra_headers}
+            return data, code, extra_headers
+        return wrapper
+    return decorator
+
+def ranobe_validator(id):
+    row = db.session.query(Ranobe.version, Ranobe.updated_at).filter(Ranobe.id == id).first()
+    if row is None:
+        return None
+    return make_etag('r', id, row.version, row.updated_at), row.updated_at
+
+# Версии закешированных ответов (cache.cached); читаются в той же транзакции, что и ответ
+def ranobe_cache_version(id):
+    validators = ranobe_validator(id)
+    if validators is None:
+        return None
+    return ranobe_cache_key(id), validators[0]
+
+def ranobe_list_cache_version():
+    # Меняется при создании и удалении ранобэ и при росте версии любого из них;
+    # updated_at отличает ранобэ, пересозданное с тем же id, как в make_etag
+    row = db.session.query(
+        func.count(Ranobe.id), func.max(Ranobe.id), func.sum(Ranobe.version), func.max(Ranobe.updated_at)
+    ).one()
+    count, last_id, versions, updated_at = row
+    stamp = int(updated_at.replace(tzinfo=timezone.utc).timestamp()) if updated_at else 0
+    return RANOBE_LIST_CACHE_KEY, f'n{count}-i{last_id or 0}-v{versions or 0}-{stamp}'
+
+def chapter_validator(ranobe_id, chapter_id, suffix=''):
+    row = db.session.query(Chapter.id, Chapter.version, Chapter.updated_at)\
+        .filter_by(ranobe_id=ranobe_id, chapter_id=chapter_id).first()
+    if row is None:
+        return None
+    lang = request.args.get('lang', 'en')
+    return make_etag('c', row.id, row.version, row.updated_at, f'-{lang}{suffix}'), row.updated_at
+
+def paragraphs_format():
+    '''format= of the request, otherwise json or ndjson by the Accept header'''
+    fmt = request.args.get('format')
+    if fmt is None:
+        best = request.accept_mimetypes.best_match(('application/json',) + NDJSON_MIMETYPES)
+        fmt = 'ndjson' if best in NDJSON_MIMETYPES else 'json'
+    return fmt
+
+def chapter_paragraphs_validator(ranobe_id, chapter_id):
+    # JSON и NDJSON по одному URL (выбор по Accept) - разные представления, у каждого свой ETag
+    return chapter_validator(ranobe_id, chapter_id, f'-{paragraphs_format()}')
+
+def chapter_query(ranobe_id, chapter_id, lang=None):
+    '''Chapter lookup that loads the body only for the requested language'''
+    query = Chapter.query.filter_by(ranobe_id=ranobe_id, chapter_id=chapter_id)
+    if lang in CONTENT_LANGS:
+        query = query.options(undefer(getattr(Chapter, f'content_{lang}')))
+    return query
+
+# Соседние главы по порядку chapter_number_origin
+BUNDLE_MAX_NEIGHBOURS = 10  # глав в каждую сторону
+
+def chapter_window_query(ranobe_id, chapter_id, prev_count=0, next_count=0, lang=None):
+    '''The chapter and up to prev/next neighbours around it, one range query over the (ranobe_id, number) index'''
+    number = Chapter.chapter_number_origin
+    anchor = select(number).where(Chapter.ranobe_id == ranobe_id, Chapter.chapter_id == chapter_id).scalar_subquery()
+    before = select(number.label('n')).where(Chapter.ranobe_id == ranobe_id, number <= anchor)\
+        .order_by(number.desc()).limit(prev_count + 1).subquery()
+    after = select(number.label('n')).where(Chapter.ranobe_id == ranobe_id, number >= anchor)\
+        .order_by(number).limit(next_count + 1).subquery()
+    query = Chapter.query.filter(
+        Chapter.ranobe_id == ranobe_id,
+        number.between(select(func.min(before.c.n)).scalar_subquery(), select(func.max(after.c.n)).scalar_subquery())
+    ).order_by(number)
+    if lang in CONTENT_LANGS:
+        query = query.options(undefer(getattr(Chapter, f'content_{lang}')))
+    return query
+
+def neighbour_chapter_ids(ranobe_id, chapter_number_origin, next_count=1):
+    '''(previous chapter_id or None, [next chapter_ids]) without loading the chapters'''
+    number = Chapter.chapter_number_origin
+    following = select(number).where(Chapter.ranobe_id == ranobe_id, number > chapter_number_origin)\
+        .order_by(number).limit(next_count)
+    previous = select(func.max(number)).where(Chapter.ranobe_id == ranobe_id, number < chapter_number_origin)\
+        .scalar_subquery()
+    rows = db.session.execute(
+        select(Chapter.chapter_id, number)
+        .where(Chapter.ranobe_id == ranobe_id, or_(number.in_(following), number == previous))
+        .order_by(number)
+    ).all()
+    prev_id = rows[0].chapter_id if rows and rows[0].chapter_number_origin < chapter_number_origin else None
+    return prev_id, [row.chapter_id for row in rows if row.chapter_number_origin > chapter_number_origin]
 
 chapter_summary_model = api.model('ChapterSummary', {
     'id': fields.Integer(readonly=True, description='The chapter unique identifier'),
@@ -60,9 +306,34 @@ chapter_summary_model = api.model('ChapterSummary', {
     'title_ru': fields.String(description='The chapter title in Russian'),
     'title_en': fields.String(description='The chapter title in English'),
     'content_preview_ru': fields.String(description='Preview of the Russian content'),
-    'content_preview_en': fields.String(description='Preview of the English content')
+    'content_preview_en': fields.String(description='Preview of the English content'),
+    'translation_status': fields.String(description='None, in_progress or complete')
 })
 
+# Пакетная запись глав
+BULK_BATCH_SIZE = 100
+NDJSON_MIMETYPES = ('application/x-ndjson', 'application/jsonl', 'application/jsonlines')
+
+@retry_on_busy(db.session)
+def upsert_chapter_batch(batch):
+    '''Upsert (index, item) pairs in one transaction, one savepoint per item'''
+    results, touched = write_chapter_batch(db.session, batch)
+    db.session.commit()
+    for ranobe_id, created in touched.items():
+        invalidate_ranobe(ranobe_id, listing=created)
+    return results
+
+def upsert_chapters(items, batch_size=BULK_BATCH_SIZE):
+    '''Upsert an iterable of chapter dicts batch by batch, yielding per-item results'''
+    batch = []
+    for index, item in enumerate(items):
+        batch.append((index, item))
+        if len(batch) >= batch_size:
+            yield from upsert_chapter_batch(batch)
+            batch = []
+    if batch:
+        yield from upsert_chapter_batch(batch)
+
 # Модели Swagger
 ranobe_model = api.model('Ranobe', {
     'id': fields.Integer(readonly=True, description='The ranobe unique identifier'),
@@ -79,6 +350,7 @@ chapter_model = api.model('Chapter', {
     'title_en': fields.String(description='The chapter title in English'),
     'content_ru': fields.String(description='The chapter content in Russian'),
     'content_en': fields.String(description='The chapter content in English'),
+    'translation_status': fields.String(readonly=True, description='None, in_progress or complete')
 })
 
 ranobe_list_model = api.model('RanobeList', {
@@ -102,6 +374,7 @@ bookmark_model = api.model('Bookmark', {
     'id': fields.Integer(readonly=True, description='The bookmark unique identifier'),
     'ranobe_id': fields.Integer(required=True, description='The ranobe ID'),
     'chapter_id': fields.Integer(required=True, description='The chapter ID'),
+    'position': fields.Integer(description='Reading position inside the chapter'),
     'ranobe_title': fields.String(description='The ranobe title'),
     'chapter_title_ru': fields.String(description='The chapter title in Russian'),
     'chapter_number_origin': fields.Integer(description='The original chapter number')
@@ -111,11 +384,16 @@ bookmark_model = api.model('Bookmark', {
 ns_ranobe = api.namespace('ranobe', description='Ranobe operations')
 ns_chapters = api.namespace('chapters', description='Chapter operations')
 ns_bookmarks = api.namespace('bookmarks', description='Bookmark operations')
+ns_search = api.namespace('search', description='Full-text search over chapters')
+ns_cache = api.namespace('cache', description='Response cache')
+ns_jobs = api.namespace('jobs', description='Scrape/ingest/translate pipeline queue')
+ns_progress = api.namespace('progress', description='Reading position, buffered and written in the background')
 
 # Ranobe endpoints
 @ns_ranobe.route('/')
 class RanobeList(Resource):
     @ns_ranobe.doc('list_ranobe')
+    @cached(response_cache, ranobe_list_cache_version)
     @ns_ranobe.marshal_list_with(ranobe_list_model)
     def get(self):
         '''List all ranobe with their title, ID, and chapter count'''
@@ -136,11 +414,13 @@ class RanobeList(Resource):
     @ns_ranobe.doc('create_ranobe')
     @ns_ranobe.expect(ranobe_create_model)
     @ns_ranobe.marshal_with(ranobe_model, code=201)
+    @retry_on_busy(db.session)
     def post(self):
         '''Create a new ranobe'''
         new_ranobe = Ranobe(title=api.payload['title'])
         db.session.add(new_ranobe)
         db.session.commit()
+        invalidate_ranobe(listing=True)
         return new_ranobe, 201
 
 @ns_ranobe.route('/<int:id>')
@@ -148,17 +428,15 @@ class RanobeList(Resource):
 @ns_ranobe.param('id', 'The ranobe identifier')
 class RanobeView(Resource):
     @ns_ranobe.doc('get_ranobe')
+    @ns_ranobe.response(304, 'Not modified')
+    @conditional(ranobe_validator)
+    @cached(response_cache, ranobe_cache_version)
     @ns_ranobe.marshal_with(ranobe_detail_model)
     def get(self, id):
         '''Get all details about a specific ranobe'''
         ranobe = Ranobe.query.get_or_404(id)
         
-        chapters = Chapter.query.filter_by(ranobe_id=id).order_by(Chapter.chapter_number_origin).all()
-        
-        def get_content_preview(content, max_length=100):
-            if content:
-                return content[:max_length] + ('...' if len(content) > max_length else '')
-            return None
+        chapters = chapter_toc_query(id).all()
         
         return {
             'id': ranobe.id,
@@ -170,53 +448,169 @@ class RanobeView(Resource):
                 'chapter_number_origin': chapter.chapter_number_origin,
                 'title_ru': chapter.title_ru,
                 'title_en': chapter.title_en,
-                'content_preview_ru': get_content_preview(chapter.content_ru),
-                'content_preview_en': get_content_preview(chapter.content_en)
+                'content_preview_ru': format_preview(chapter.content_preview_ru),
+                'content_preview_en': format_preview(chapter.content_preview_en),
+                'translation_status': chapter.translation_status
             } for chapter in chapters]
         }
 
     @ns_ranobe.doc('update_ranobe')
     @ns_ranobe.expect(ranobe_model)
     @ns_ranobe.marshal_with(ranobe_model)
+    @retry_on_busy(db.session)
     def put(self, id):
         '''Update a ranobe given its identifier'''
         ranobe = Ranobe.query.get_or_404(id)
         ranobe.title = api.payload['title']
+        ranobe.version = Ranobe.version + 1
         db.session.commit()
+        invalidate_ranobe(id, listing=True)
         return ranobe
 
     @ns_ranobe.doc('delete_ranobe')
     @ns_ranobe.response(204, 'Ranobe deleted')
+    @retry_on_busy(db.session)
     def delete(self, id):
         '''Delete a ranobe given its identifier'''
         ranobe = Ranobe.query.get_or_404(id)
+        search.unindex_chapters(db.session, Chapter, Chapter.ranobe_id == id)
+        # Главы и закладки удаляются вместе с ранобэ, их версии исчезают вместе со строками
+        Chapter.query.filter_by(ranobe_id=id).delete(synchronize_session=False)
+        Bookmark.query.filter_by(ranobe_id=id).delete(synchronize_session=False)
         db.session.delete(ranobe)
         db.session.commit()
+        invalidate_ranobe(id, listing=True)
         return '', 204
 
+@ns_ranobe.route('/<int:id>/export')
+@ns_ranobe.response(404, 'Ranobe not found or no chapters with content in the range')
+@ns_ranobe.param('id', 'The ranobe identifier')
+@ns_ranobe.param('format', 'epub or zip (plain-text chapters and book.json). Default is epub')
+@ns_ranobe.param('lang', 'Language of the content (ru, en). Default is en')
+@ns_ranobe.param('start', 'First chapter_number_origin to include. Default is the first chapter')
+@ns_ranobe.param('end', 'Last chapter_number_origin to include. Default is the last chapter')
+class RanobeExport(Resource):
+    @ns_ranobe.doc('export_ranobe', description=(
+        'The archive is streamed while chapters are read from the database and kept in a '
+        'cache keyed by the ranobe version; repeated downloads of an unchanged ranobe are '
+        'served from it (X-Book-Cache: hit).'
+    ))
+    def get(self, id):
+        '''Download a range of chapters as an EPUB or ZIP for offline reading'''
+        fmt = request.args.get('format', 'epub')
+        lang = request.args.get('lang', 'en')
+        start = request.args.get('start', type=int)
+        end = request.args.get('end', type=int)
+        if fmt not in BOOK_FORMATS:
+            api.abort(400, f'Unknown format {fmt}')
+        if lang not in CONTENT_LANGS:
+            api.abort(400, f'Unknown language {lang}')
+
+        book = load_book(db.session, id, lang, start, end)
+        if book is None:
+            api.abort(404, f'Ranobe {id} not found')
+        key = BookCache.key(book, fmt)
+        download_name = f"ranobe-{id}-{lang}-{book['range']}.{fmt}"
+        cached_file = book_cache().open(key)
+        if cached_file is not None:
+            response = send_file(cached_file, mimetype=BOOK_FORMATS[fmt], as_attachment=True,
+                                 download_name=download_name, etag=key)
+            response.headers['X-Book-Cache'] = 'hit'
+            return response
+
+        if not count_book_chapters(db.session, id, lang, start, end):
+            api.abort(404, f'No chapters with content in {lang} in this range')
+        # Пачки глав читаются в той же транзакции, что и версия: архив соответствует ключу
+        chapters = iter_book_chapters(db.session, id, lang, start, end)
+        response = Response(stream_with_context(book_cache().store(key, stream_book(fmt, book, chapters))),
+                            mimetype=BOOK_FORMATS[fmt])
+        response.headers['Content-Disposition'] = f'attachment; filename="{download_name}"'
+        response.headers['X-Book-Cache'] = 'miss'
+        response.set_etag(key)
+        return response
+
 @ns_chapters.route('/')
 class ChapterList(Resource):
     @ns_chapters.doc('create_chapter')
     @ns_chapters.expect(chapter_model)
     @ns_chapters.marshal_with(chapter_model, code=201)
+    @ns_chapters.response(409, 'chapter_number_origin is taken by another chapter')
+    @retry_on_busy(db.session)
     def post(self):
         '''Create a new chapter or update if exists'''
         data = api.payload
+        # Проверка и запись в одной транзакции писателя (BEGIN IMMEDIATE): снимок читающего
+        # пула мог не увидеть главу, которую только что вставил другой запрос
+        use_writer(db.session)
         chapter = Chapter.query.filter_by(ranobe_id=data['ranobe_id'], chapter_id=data['chapter_id']).first()
         
-        if chapter:
-            # Update existing chapter
-            for key, value in data.items():
-                if hasattr(chapter, key) and value is not None:
-                    setattr(chapter, key, value)
-        else:
-            # Create new chapter
-            chapter = Chapter(**data)
-            db.session.add(chapter)
-        
+        created = chapter is None
+        try:
+            if chapter:
+                # Update existing chapter
+                search.unindex_chapters(db.session, Chapter, Chapter.id == chapter.id)
+                for key, value in data.items():
+                    if hasattr(chapter, key) and value is not None:
+                        setattr(chapter, key, value)
+                bump_chapter_version(chapter)
+            else:
+                # Create new chapter
+                chapter = Chapter(**data)
+                db.session.add(chapter)
+                bump_ranobe_version(chapter.ranobe_id)
+            db.session.flush()
+        except IntegrityError:
+            db.session.rollback()
+            api.abort(409, 'chapter_number_origin is taken by another chapter')
+        search.index_chapter(db.session, chapter)
+        ranobe_id = chapter.ranobe_id
         db.session.commit()
+        # Число глав в списке меняется только при создании
+        invalidate_ranobe(ranobe_id, listing=created)
         return chapter, 201
 
+bulk_item_result_model = api.model('ChapterBulkItemResult', {
+    'index': fields.Integer(description='Position of the item in the request'),
+    'id': fields.Integer(description='The chapter unique identifier'),
+    'ranobe_id': fields.Integer(description='The ranobe ID'),
+    'chapter_id': fields.Integer(description='The actual chapter ID'),
+    'status': fields.String(description='created, updated or error'),
+    'error': fields.String(description='Why the item was rejected')
+})
+
+bulk_result_model = api.model('ChapterBulkResult', {
+    'created': fields.Integer,
+    'updated': fields.Integer,
+    'errors': fields.Integer,
+    'items': fields.List(fields.Nested(bulk_item_result_model))
+})
+
+@ns_chapters.route('/bulk')
+@ns_chapters.param('batch_size', f'Chapters per transaction. Default is {BULK_BATCH_SIZE}')
+class ChapterBulkUpsert(Resource):
+    @ns_chapters.doc('bulk_upsert_chapters', description=(
+        'Body is a JSON array of chapters or an NDJSON stream '
+        '(Content-Type: application/x-ndjson), one chapter per line.'
+    ))
+    @ns_chapters.marshal_with(bulk_result_model)
+    def post(self):
+        '''Create or update many chapters, keyed by (ranobe_id, chapter_id)'''
+        batch_size = min(max(request.args.get('batch_size', BULK_BATCH_SIZE, type=int), 1), 1000)
+        if request.mimetype in NDJSON_MIMETYPES:
+            items = iter_ndjson(request.stream)
+        else:
+            items = request.get_json(silent=True)
+            if not isinstance(items, list):
+                api.abort(400, 'Expected a JSON array of chapters')
+
+        results = list(upsert_chapters(items, batch_size))
+        return {
+            'created': sum(result['status'] == 'created' for result in results),
+            'updated': sum(result['status'] == 'updated' for result in results),
+            'errors': sum(result['status'] == 'error' for result in results),
+            'items': results
+        }
+
 @ns_chapters.route('/<int:ranobe_id>/<int:chapter_id>')
 @ns_chapters.response(404, 'Chapter not found')
 @ns_chapters.param('ranobe_id', 'The ranobe identifier')
@@ -224,11 +618,13 @@ class ChapterList(Resource):
 @ns_chapters.param('lang', 'Language of the content (ru, en, cn). Default is ru')
 class ChapterItem(Resource):
     @ns_chapters.doc('get_chapter')
+    @ns_chapters.response(304, 'Not modified')
+    @conditional(chapter_validator)
     @ns_chapters.marshal_with(chapter_model)
     def get(self, ranobe_id, chapter_id):
         '''Fetch a chapter given its ranobe id and chapter id'''
-        chapter = Chapter.query.filter_by(ranobe_id=ranobe_id, chapter_id=chapter_id).first_or_404()
         lang = request.args.get('lang', 'en')
+        chapter = chapter_query(ranobe_id, chapter_id, lang).first_or_404()
         
         response = {
             'id': chapter.id,
@@ -237,15 +633,218 @@ class ChapterItem(Resource):
             'chapter_number_origin': chapter.chapter_number_origin,
             'title_ru': chapter.title_ru,
             'title_en': chapter.title_en,
+            'translation_status': chapter.translation_status,
         }
         
         content_field = f'content_{lang}'
-        if hasattr(chapter, content_field) and getattr(chapter, content_field):
+        if lang in CONTENT_LANGS and getattr(chapter, content_field):
             response[content_field] = getattr(chapter, content_field)
-            return response
+            return response, 200, {'Link': prefetch_links(chapter, lang)}
         else:
             return {'error': f'Content not available in {lang}'}, 404
 
+def prefetch_links(chapter, lang):
+    '''Link header: the next chapters to prefetch, the previous one and the bundle around this one'''
+    prev_id, next_ids = neighbour_chapter_ids(chapter.ranobe_id, chapter.chapter_number_origin,
+                                              current_app.config['PREFETCH_LINKS'])
+    def url(resource, chapter_id):
+        return api.url_for(resource, ranobe_id=chapter.ranobe_id, chapter_id=chapter_id, lang=lang)
+    links = [f'<{url(ChapterItem, chapter_id)}>; rel="{"next " if i == 0 else ""}prefetch"'
+             for i, chapter_id in enumerate(next_ids)]
+    if prev_id is not None:
+        links.append(f'<{url(ChapterItem, prev_id)}>; rel="prev"')
+    links.append(f'<{url(ChapterBundle, chapter.chapter_id)}>; rel="alternate"; type="application/json"')
+    return ', '.join(links)
+
+chapter_bundle_item_model = api.inherit('ChapterBundleItem', chapter_model, {
+    'content_included': fields.Boolean(description='False when the content did not fit into max_bytes or is missing in lang')
+})
+
+chapter_bundle_model = api.model('ChapterBundle', {
+    'ranobe_id': fields.Integer(description='The ranobe ID'),
+    'chapter_id': fields.Integer(description='The chapter the bundle was requested for'),
+    'lang': fields.String(description='Language of the content'),
+    'bytes': fields.Integer(description='UTF-8 size of the included content'),
+    'max_bytes': fields.Integer(description='Content size limit that was applied'),
+    'omitted': fields.Integer(description='Chapters listed without content, fetch them one by one'),
+    'items': fields.List(fields.Nested(chapter_bundle_item_model), description='Chapters in chapter_number_origin order')
+})
+
+@ns_chapters.route('/<int:ranobe_id>/<int:chapter_id>/bundle')
+@ns_chapters.response(404, 'Chapter not found')
+@ns_chapters.param('ranobe_id', 'The ranobe identifier')
+@ns_chapters.param('chapter_id', 'The actual chapter ID')
+@ns_chapters.param('lang', 'Language of the content (ru, en). Default is en')
+@ns_chapters.param('next', f'Following chapters to include (0-{BUNDLE_MAX_NEIGHBOURS}). Default is 2')
+@ns_chapters.param('prev', f'Preceding chapters to include (0-{BUNDLE_MAX_NEIGHBOURS}). Default is 0')
+@ns_chapters.param('max_bytes', 'Limit for the content in the response, at most RANOBE_BUNDLE_MAX_BYTES')
+class ChapterBundle(Resource):
+    @ns_chapters.doc('get_chapter_bundle', description=(
+        'The requested chapter always comes with its content. Neighbours are filled in '
+        'nearest first until max_bytes is reached; the rest are listed with content_included=false.'
+    ))
+    @ns_chapters.marshal_with(chapter_bundle_model)
+    def get(self, ranobe_id, chapter_id):
+        '''Fetch a chapter together with the chapters around it, for prefetching'''
+        lang = request.args.get('lang', 'en')
+        next_count = min(max(request.args.get('next', 2, type=int), 0), BUNDLE_MAX_NEIGHBOURS)
+        prev_count = min(max(request.args.get('prev', 0, type=int), 0), BUNDLE_MAX_NEIGHBOURS)
+        max_bytes = min(request.args.get('max_bytes', current_app.config['BUNDLE_MAX_BYTES'], type=int),
+                        current_app.config['BUNDLE_MAX_BYTES'])
+        if lang not in CONTENT_LANGS:
+            api.abort(400, f'Unknown language {lang}')
+
+        chapters = chapter_window_query(ranobe_id, chapter_id, prev_count, next_count, lang).all()
+        anchor = next((i for i, chapter in enumerate(chapters) if chapter.chapter_id == chapter_id), None)
+        if anchor is None:
+            api.abort(404, f'Chapter {chapter_id} of ranobe {ranobe_id} not found')
+        content_field = f'content_{lang}'
+        if not getattr(chapters[anchor], content_field):
+            api.abort(404, f'Content not available in {lang}')
+
+        # Ближние главы важнее дальних: следующая, предыдущая, через одну...
+        order = sorted(range(len(chapters)), key=lambda i: (abs(i - anchor), i < anchor))
+        included, total = set(), 0
+        for i in order:
+            content = getattr(chapters[i], content_field)
+            size = len(content.encode('utf-8')) if content else 0
+            if i != anchor and (not content or total + size > max_bytes):
+                if content:
+                    break
+                continue
+            included.add(i)
+            total += size
+
+        items = []
+        for i, chapter in enumerate(chapters):
+            item = {
+                'id': chapter.id,
+                'ranobe_id': chapter.ranobe_id,
+                'chapter_id': chapter.chapter_id,
+                'chapter_number_origin': chapter.chapter_number_origin,
+                'title_ru': chapter.title_ru,
+                'title_en': chapter.title_en,
+                'translation_status': chapter.translation_status,
+                'content_included': i in included,
+            }
+            if i in included:
+                item[content_field] = getattr(chapter, content_field)
+            items.append(item)
+        return {
+            'ranobe_id': ranobe_id,
+            'chapter_id': chapter_id,
+            'lang': lang,
+            'bytes': total,
+            'max_bytes': max_bytes,
+            'omitted': len(chapters) - len(included),
+            'items': items
+        }
+
+# Абзацы главы по смещениям, сохранённым при записи (paragraphs.py)
+PARAGRAPH_STREAM_CHUNK = 16 * 1024  # байт NDJSON в одной записи в сокет, кроме первой
+
+def chapter_paragraphs_row(ranobe_id, chapter_id, lang):
+    '''Chapter fields with the raw stored body (bytes or str, not decoded) and paragraph offsets for lang'''
+    table = Chapter.__table__
+    return db.session.execute(
+        select(
+            Chapter.id, Chapter.ranobe_id, Chapter.chapter_id, Chapter.chapter_number_origin,
+            Chapter.title_ru, Chapter.title_en, Chapter.translation_status,
+            # Мимо CompressedText: кадр распаковывается в байты, декодируется только нужный срез
+            type_coerce(table.c[f'content_{lang}'], LargeBinary).label('content'),
+            table.c[f'paragraphs_{lang}'].label('offsets'),
+        ).where(Chapter.ranobe_id == ranobe_id, Chapter.chapter_id == chapter_id)
+    ).first()
+
+def ndjson_paragraphs(header, paragraphs, offset):
+    '''Header line, then one line per paragraph; the first paragraph is sent on its own to reach the reader sooner'''
+    yield json.dumps(header, ensure_ascii=False) + '\n'
+    chunk, size = [], 0
+    for index, paragraph in enumerate(paragraphs, offset):
+        line = json.dumps({'index': index, 'text': paragraph}, ensure_ascii=False) + '\n'
+        chunk.append(line)
+        size += len(line)
+        if index == offset or size >= PARAGRAPH_STREAM_CHUNK:
+            yield ''.join(chunk)
+            chunk, size = [], 0
+    if chunk:
+        yield ''.join(chunk)
+
+chapter_paragraphs_model = api.model('ChapterParagraphs', {
+    'id': fields.Integer(description='The chapter unique identifier'),
+    'ranobe_id': fields.Integer(description='The ranobe ID'),
+    'chapter_id': fields.Integer(description='The actual chapter ID'),
+    'chapter_number_origin': fields.Integer(description='The original chapter number'),
+    'title_ru': fields.String(description='The chapter title in Russian'),
+    'title_en': fields.String(description='The chapter title in English'),
+    'translation_status': fields.String(description='None, in_progress or complete'),
+    'lang': fields.String(description='Language of the content'),
+    'offset': fields.Integer(description='Index of the first returned paragraph'),
+    'total': fields.Integer(description='Number of paragraphs in the chapter'),
+    'next_offset': fields.Integer(description='Offset of the next page, null after the last paragraph'),
+    'paragraphs': fields.List(fields.String, description='Paragraph texts, without the separating newlines')
+})
+
+@ns_chapters.route('/<int:ranobe_id>/<int:chapter_id>/paragraphs')
+@ns_chapters.response(404, 'Chapter not found')
+@ns_chapters.param('ranobe_id', 'The ranobe identifier')
+@ns_chapters.param('chapter_id', 'The actual chapter ID')
+@ns_chapters.param('lang', 'Language of the content (ru, en). Default is en')
+@ns_chapters.param('offset', 'Index of the first paragraph. Default is 0')
+@ns_chapters.param('limit', 'Paragraphs to return; RANOBE_PARAGRAPH_PAGE_SIZE for JSON, the rest of the chapter for NDJSON')
+@ns_chapters.param('format', 'json or ndjson. Default follows the Accept header')
+class ChapterParagraphs(Resource):
+    @ns_chapters.doc('get_chapter_paragraphs', description=(
+        'Paragraphs are the newline-separated parts of the content. With format=ndjson '
+        '(or Accept: application/x-ndjson) the response is streamed: a header object with '
+        'the chapter fields and total, then {"index": n, "text": ...} per paragraph.'
+    ))
+    @ns_chapters.response(200, 'Success', chapter_paragraphs_model)
+    @ns_chapters.response(304, 'Not modified')
+    @conditional(chapter_paragraphs_validator)
+    def get(self, ranobe_id, chapter_id):
+        '''Fetch a range of paragraphs of a chapter, or stream them as NDJSON'''
+        lang = request.args.get('lang', 'en')
+        fmt = paragraphs_format()
+        if lang not in CONTENT_LANGS:
+            api.abort(400, f'Unknown language {lang}')
+        if fmt not in ('json', 'ndjson'):
+            api.abort(400, f'Unknown format {fmt}')
+        offset = max(request.args.get('offset', 0, type=int), 0)
+        limit = request.args.get('limit', None if fmt == 'ndjson' else current_app.config['PARAGRAPH_PAGE_SIZE'], type=int)
+        if limit is not None:
+            limit = min(max(limit, 0), current_app.config['PARAGRAPH_MAX_LIMIT'])
+
+        row = chapter_paragraphs_row(ranobe_id, chapter_id, lang)
+        if row is None:
+            api.abort(404, f'Chapter {chapter_id} of ranobe {ranobe_id} not found')
+        if not row.content:
+            api.abort(404, f'Content not available in {lang}')
+        # Кадр распаковывается только до конца нужных абзацев
+        raw = codec.decompress_bytes(row.content, range_size(row.offsets, offset, limit))
+
+        header = {
+            'id': row.id,
+            'ranobe_id': row.ranobe_id,
+            'chapter_id': row.chapter_id,
+            'chapter_number_origin': row.chapter_number_origin,
+            'title_ru': row.title_ru,
+            'title_en': row.title_en,
+            'translation_status': row.translation_status,
+            'lang': lang,
+            'offset': offset,
+        }
+        if fmt == 'ndjson':
+            total, paragraphs = iter_paragraphs(raw, row.offsets, offset, limit)
+            header['total'] = total
+            return Response(ndjson_paragraphs(header, paragraphs, offset),
+                            mimetype='application/x-ndjson', headers={'Vary': 'Accept'})
+
+        paragraphs, total = paragraph_range(raw, row.offsets, offset, limit)
+        end = offset + len(paragraphs)
+        header.update(total=total, next_offset=end if end < total else None, paragraphs=paragraphs)
+        return marshal(header, chapter_paragraphs_model), 200, {'Vary': 'Accept'}
+
 @ns_chapters.route('/<int:ranobe_id>/<int:chapter_id>/update_translation')
 @ns_chapters.response(404, 'Chapter not found')
 @ns_chapters.param('ranobe_id', 'The ranobe identifier')
@@ -257,9 +856,11 @@ class ChapterTranslationUpdate(Resource):
         'title_ru': fields.String(description='The updated Russian translation title')
     }))
     @ns_chapters.marshal_with(chapter_model)
+    @retry_on_busy(db.session)
     def put(self, ranobe_id, chapter_id):
         '''Update the Russian translation of a chapter (content and/or title)'''
         chapter = Chapter.query.filter_by(ranobe_id=ranobe_id, chapter_id=chapter_id).first_or_404()
+        search.unindex_chapters(db.session, Chapter, Chapter.id == chapter.id)
         
         if 'content_ru' in api.payload:
             chapter.content_ru = api.payload['content_ru']
@@ -267,7 +868,67 @@ class ChapterTranslationUpdate(Resource):
         if 'title_ru' in api.payload:
             chapter.title_ru = api.payload['title_ru']
         
+        bump_chapter_version(chapter)
+        search.index_chapter(db.session, chapter)
+        db.session.commit()
+        invalidate_ranobe(ranobe_id)
+        return chapter
+
+translation_state_model = api.model('TranslationState', {
+    'ranobe_id': fields.Integer(description='The ranobe ID'),
+    'chapter_id': fields.Integer(description='The actual chapter ID'),
+    'translation_status': fields.String(description='in_progress or complete'),
+    'translation_parts': fields.Integer(description='Number of parts appended so far')
+})
+
+@ns_chapters.route('/<int:ranobe_id>/<int:chapter_id>/append_translation')
+@ns_chapters.response(404, 'Chapter not found')
+@ns_chapters.param('ranobe_id', 'The ranobe identifier')
+@ns_chapters.param('chapter_id', 'The actual chapter ID')
+class ChapterTranslationAppend(Resource):
+    @ns_chapters.doc('append_chapter_translation')
+    @ns_chapters.expect(api.model('TranslationAppend', {
+        'part': fields.Integer(required=True, description='Index of the part; 0 starts the translation over'),
+        'content_ru': fields.String(required=True, description='The translated text of the part'),
+        'title_ru': fields.String(description='The updated Russian translation title'),
+        'complete': fields.Boolean(description='True for the last part of the chapter')
+    }))
+    @ns_chapters.response(409, 'Part is out of order')
+    @ns_chapters.marshal_with(translation_state_model)
+    @retry_on_busy(db.session)
+    def post(self, ranobe_id, chapter_id):
+        '''Append the next translated part of a chapter while the rest is still being translated'''
+        data = api.payload
+        part = data.get('part')
+        content = data.get('content_ru')
+        if not isinstance(part, int) or part < 0 or not isinstance(content, str):
+            api.abort(400, 'Expected an integer part >= 0 and a string content_ru')
+
+        # Номер части и текст читаются в транзакции писателя: из снимка чтения
+        # параллельная или повторная дозапись потеряла бы часть
+        use_writer(db.session)
+        chapter = chapter_query(ranobe_id, chapter_id, 'ru').first_or_404()
+        appended = chapter.translation_parts or 0
+        if part < appended and part > 0:
+            # Повтор уже принятой части (клиент не дождался ответа) ничего не меняет
+            return chapter
+        search.unindex_chapters(db.session, Chapter, Chapter.id == chapter.id)
+        if part == 0:
+            chapter.content_ru = content
+        elif part == appended and chapter.translation_status == TRANSLATION_IN_PROGRESS:
+            chapter.content_ru = chapter.content_ru + '\n' + content
+        else:
+            api.abort(409, f'Expected part {appended if chapter.translation_status == TRANSLATION_IN_PROGRESS else 0}')
+
+        chapter.translation_parts = part + 1
+        chapter.translation_status = TRANSLATION_COMPLETE if data.get('complete') else TRANSLATION_IN_PROGRESS
+        if data.get('title_ru'):
+            chapter.title_ru = data['title_ru']
+
+        bump_chapter_version(chapter)
+        search.index_chapter(db.session, chapter)
         db.session.commit()
+        invalidate_ranobe(ranobe_id)
         return chapter
 
 @ns_bookmarks.route('/')
@@ -290,6 +951,7 @@ class BookmarkList(Resource):
             'id': bookmark.Bookmark.id,
             'ranobe_id': bookmark.Bookmark.ranobe_id,
             'chapter_id': bookmark.Bookmark.chapter_id,
+            'position': bookmark.Bookmark.position,
             'ranobe_title': bookmark.ranobe_title,
             'chapter_title_ru': bookmark.chapter_title_ru,
             'chapter_number_origin': bookmark.chapter_number_origin
@@ -298,28 +960,26 @@ class BookmarkList(Resource):
     @ns_bookmarks.doc('create_or_update_bookmark')
     @ns_bookmarks.expect(api.model('BookmarkCreate', {
         'ranobe_id': fields.Integer(required=True, description='The ranobe ID'),
-        'chapter_id': fields.Integer(required=True, description='The chapter ID')
+        'chapter_id': fields.Integer(required=True, description='The chapter ID'),
+        'position': fields.Integer(description='Reading position inside the chapter. Default is 0')
     }))
+    @ns_bookmarks.response(404, 'Ranobe or chapter not found')
     @ns_bookmarks.marshal_with(bookmark_model, code=201)
+    @retry_on_busy(db.session)
     def post(self):
         '''Create a new bookmark or update existing one for the ranobe'''
         data = api.payload
-        
-        # Check if a bookmark for this ranobe already exists
-        existing_bookmark = Bookmark.query.filter_by(ranobe_id=data['ranobe_id']).first()
-        
-        if existing_bookmark:
-            # Update existing bookmark
-            existing_bookmark.chapter_id = data['chapter_id']
-            db.session.commit()
-            bookmark = existing_bookmark
-        else:
-            # Create new bookmark
-            new_bookmark = Bookmark(ranobe_id=data['ranobe_id'], chapter_id=data['chapter_id'])
-            db.session.add(new_bookmark)
-            db.session.commit()
-            bookmark = new_bookmark
-        
+        # Закладка на несуществующую главу не должна затереть верную
+        chapter_exists = db.session.query(
+            Chapter.query.filter_by(ranobe_id=data['ranobe_id'], chapter_id=data['chapter_id']).exists()
+        ).scalar()
+        if not chapter_exists:
+            api.abort(404, f"Ranobe {data['ranobe_id']} or its chapter {data['chapter_id']} not found")
+        # Снимок чтения закрывается, иначе ответ не увидел бы записанную закладку
+        db.session.commit()
+        # Тот же upsert и те же часы, что у буфера позиции: порядок с PUT /progress решает updated_at
+        progress_buffer().save(data['ranobe_id'], data['chapter_id'], data.get('position') or 0)
+
         # Fetch additional data for response
         bookmark_data = db.session.query(
             Bookmark,
@@ -329,28 +989,280 @@ class BookmarkList(Resource):
         ).join(Ranobe, Bookmark.ranobe_id == Ranobe.id)\
          .join(Chapter, (Chapter.ranobe_id == Bookmark.ranobe_id) & 
                         (Chapter.chapter_id == Bookmark.chapter_id))\
-         .filter(Bookmark.id == bookmark.id).first()
+         .filter(Bookmark.ranobe_id == data['ranobe_id']).first()
+        if bookmark_data is None:
+            api.abort(404, f"Ranobe {data['ranobe_id']} or its chapter {data['chapter_id']} not found")
 
         return {
             'id': bookmark_data.Bookmark.id,
             'ranobe_id': bookmark_data.Bookmark.ranobe_id,
             'chapter_id': bookmark_data.Bookmark.chapter_id,
+            'position': bookmark_data.Bookmark.position,
             'ranobe_title': bookmark_data.ranobe_title,
             'chapter_title_ru': bookmark_data.chapter_title_ru,
             'chapter_number_origin': bookmark_data.chapter_number_origin
         }, 201
-        
-@app.route('/bookmarks', methods=['OPTIONS'])
+
+progress_model = api.model('ReadingProgress', {
+    'ranobe_id': fields.Integer(readonly=True, description='The ranobe ID'),
+    'chapter_id': fields.Integer(required=True, description='The chapter ID'),
+    'position': fields.Integer(description='Reading position inside the chapter. Default is 0'),
+    'updated_at': fields.DateTime(readonly=True, description='When the position was reported (UTC)'),
+    'pending': fields.Boolean(readonly=True, description='Still in the buffer, not written to the database yet')
+})
+
+@ns_progress.route('/<int:ranobe_id>')
+@ns_progress.param('ranobe_id', 'The ranobe identifier')
+class ReadingProgress(Resource):
+    @ns_progress.doc('get_progress')
+    @ns_progress.response(404, 'No reading position for this ranobe')
+    @ns_progress.marshal_with(progress_model)
+    def get(self, ranobe_id):
+        '''Last reading position: from the buffer of this worker, otherwise from the bookmark'''
+        entry = progress_buffer().get(ranobe_id)
+        if entry is not None:
+            return entry
+        row = db.session.query(Bookmark.ranobe_id, Bookmark.chapter_id, Bookmark.position, Bookmark.updated_at)\
+            .filter(Bookmark.ranobe_id == ranobe_id).first()
+        if row is None:
+            api.abort(404, f"No reading position for ranobe {ranobe_id}")
+        return {**row._mapping, 'pending': False}
+
+    @ns_progress.doc('update_progress', description=(
+        'Cheap enough to call on every scroll or page turn: the position is buffered '
+        'in memory and written to the bookmark in the background.'
+    ))
+    @ns_progress.expect(progress_model)
+    @ns_progress.response(400, 'Invalid position')
+    @ns_progress.marshal_with(progress_model, code=202)
+    def put(self, ranobe_id):
+        '''Report the reading position of a ranobe'''
+        data = request.get_json(silent=True) or {}
+        chapter_id, position = data.get('chapter_id'), data.get('position', 0)
+        if type(chapter_id) is not int or type(position) is not int or position < 0:
+            api.abort(400, 'chapter_id and a non-negative position must be integers')
+        entry = progress_buffer().update(ranobe_id, chapter_id, position)
+        # При RANOBE_PROGRESS_FLUSH_INTERVAL=0 позиция уже записана
+        return dict(entry, pending=progress_buffer().get(ranobe_id) is not None), 202
+
+@ns_progress.route('/stats')
+class ProgressStats(Resource):
+    @ns_progress.doc('progress_stats')
+    def get(self):
+        '''Buffered positions, coalesced updates and flush counters of this worker'''
+        return progress_buffer().stats()
+
+search_hit_model = api.model('SearchHit', {
+    'id': fields.Integer(description='The chapter unique identifier'),
+    'ranobe_id': fields.Integer(description='The ranobe ID'),
+    'chapter_id': fields.Integer(description='The actual chapter ID'),
+    'chapter_number_origin': fields.Integer(description='The original chapter number'),
+    'title_en': fields.String(description='The English title with highlighted matches'),
+    'title_ru': fields.String(description='The Russian title with highlighted matches'),
+    'snippet': fields.String(description='Best matching fragment with highlighted matches'),
+    'rank': fields.Float(description='BM25 rank, lower is more relevant')
+})
+
+search_result_model = api.model('SearchResult', {
+    'items': fields.List(fields.Nested(search_hit_model)),
+    'next_cursor': fields.String(description='Cursor of the next page, null on the last page')
+})
+
+@ns_cache.route('/stats')
+class CacheStats(Resource):
+    @ns_cache.doc('cache_stats')
+    def get(self):
+        '''Response cache hit/miss counters and size, and the same for exported books'''
+        return {**response_cache().stats(), 'books': book_cache().stats()}
+
+@ns_jobs.route('/status')
+class JobStatus(Resource):
+    @ns_jobs.doc('job_status')
+    def get(self):
+        '''Queue depth, job counts by status and throughput per pipeline stage'''
+        return job_stats(db.session)
+
+@ns_search.route('/')
+@ns_search.param('q', 'Words to search for, all of them must match')
+@ns_search.param('ranobe_id', 'Limit the search to one ranobe')
+@ns_search.param('limit', 'Page size (1-100). Default is 20')
+@ns_search.param('cursor', 'next_cursor from the previous page')
+class ChapterSearch(Resource):
+    @ns_search.doc('search_chapters')
+    @ns_search.marshal_with(search_result_model)
+    def get(self):
+        '''Search chapter titles and content in both languages'''
+        query = request.args.get('q', '')
+        ranobe_id = request.args.get('ranobe_id', type=int)
+        limit = min(max(request.args.get('limit', 20, type=int), 1), 100)
+        try:
+            hits, next_cursor = search.search(db.session, query, ranobe_id, limit, request.args.get('cursor'))
+        except ValueError as e:
+            api.abort(400, str(e))
+
+        return {'items': hits, 'next_cursor': next_cursor}
+
+@blueprint.cli.command('init-db')
+def init_db():
+    '''Create all tables of a new database and mark it as migrated to head'''
+    if inspect(db.engine).get_table_names():
+        raise click.ClickException('Database already has tables, run `flask --app app db upgrade` instead')
+    create_schema(db.engine)
+    stamp()
+    print(f"Created database {db.engine.url}")
+
+@blueprint.cli.command('search-backfill')
+def search_backfill():
+    '''Index all existing chapters for full-text search'''
+    indexed = search.backfill(db.session, Chapter)
+    print(f"Indexed {indexed} chapters")
+
+@blueprint.cli.command('export-book')
+@click.argument('ranobe_id', type=int)
+@click.argument('output', type=click.Path(dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(sorted(BOOK_FORMATS)), help='Default: from the output extension, else epub')
+@click.option('--lang', type=click.Choice(CONTENT_LANGS), default='en', show_default=True)
+@click.option('--start', type=int, help='First chapter_number_origin')
+@click.option('--end', type=int, help='Last chapter_number_origin')
+def export_book(ranobe_id, output, fmt, lang, start, end):
+    '''Write a range of chapters of a ranobe to an EPUB or ZIP file'''
+    if fmt is None:
+        fmt = 'zip' if output.endswith('.zip') else 'epub'
+    book = load_book(db.session, ranobe_id, lang, start, end)
+    if book is None:
+        raise click.ClickException(f'Ranobe {ranobe_id} not found')
+    count = count_book_chapters(db.session, ranobe_id, lang, start, end)
+    if not count:
+        raise click.ClickException(f'No chapters with content in {lang} in this range')
+    size = 0
+    with open(output, 'wb') as f:
+        for chunk in stream_book(fmt, book, iter_book_chapters(db.session, ranobe_id, lang, start, end)):
+            f.write(chunk)
+            size += len(chunk)
+    print(f"Wrote {count} chapters to {output} ({size} bytes)")
+
+@blueprint.cli.command('index-paragraphs')
+@click.option('--all', 'reindex', is_flag=True, help='Recompute offsets that are already stored')
+@click.option('--batch-size', default=200, show_default=True)
+def index_paragraphs(reindex, batch_size):
+    '''Store paragraph offsets for chapters written before they were computed on write'''
+    langs = CONTENT_LANGS
+    missing = '' if reindex else ' AND (' + ' OR '.join(
+        f'paragraphs_{lang} IS NULL AND content_{lang} IS NOT NULL' for lang in langs) + ')'
+    last_id = 0
+    indexed = 0
+    while True:
+        rows = db.session.execute(
+            text(f"SELECT id, content_ru, content_en FROM chapter WHERE id > :last_id{missing} ORDER BY id LIMIT :limit"),
+            {'last_id': last_id, 'limit': batch_size}
+        ).all()
+        if not rows:
+            break
+        db.session.execute(
+            text("UPDATE chapter SET paragraphs_ru = :paragraphs_ru, paragraphs_en = :paragraphs_en WHERE id = :id"),
+            [
+                {'id': row.id, **{f'paragraphs_{lang}': paragraph_offsets(codec.decompress(value))
+                                  for lang, value in zip(langs, (row.content_ru, row.content_en))}}
+                for row in rows
+            ]
+        )
+        db.session.commit()
+        indexed += len(rows)
+        last_id = rows[-1].id
+        print(f"Indexed {indexed} chapters (up to id {last_id})")
+
+@blueprint.cli.command('compress-chapters')
+@click.option('--train/--no-train', default=True, help='Train new dictionaries on the stored chapters first')
+@click.option('--ranobe-id', type=int, help='Train on this ranobe only')
+@click.option('--batch-size', default=200, show_default=True)
+@click.option('--vacuum', is_flag=True, help='Reclaim freed pages afterwards')
+def compress_chapters(train, ranobe_id, batch_size, vacuum):
+    '''Compress chapter bodies in place and report the size/latency trade-off'''
+    langs = CONTENT_LANGS
+    if train:
+        for lang in langs:
+            column = getattr(Chapter, f'content_{lang}')
+            # Случайная выборка id без чтения текстов, тексты потом пачками и только пока нужны
+            sample = select(Chapter.id).where(column.is_not(None))
+            if ranobe_id is not None:
+                sample = sample.where(Chapter.ranobe_id == ranobe_id)
+            sample = sample.order_by(func.random()).limit(compression.TRAIN_SAMPLES)
+            texts = db.session.execute(
+                select(column).where(Chapter.id.in_(sample)).execution_options(yield_per=batch_size)
+            ).scalars()
+            try:
+                dictionary = compression.train_dictionary(texts)
+            except ValueError as e:
+                print(f"Skipped {lang} dictionary: {e}")
+                continue
+            finally:
+                texts.close()
+            db.session.add(CompressionDictionary(
+                id=dictionary.dict_id(), lang=lang, ranobe_id=ranobe_id, data=dictionary.as_bytes()
+            ))
+            db.session.commit()
+            print(f"Trained {lang} dictionary {dictionary.dict_id()} ({len(dictionary.as_bytes())} bytes)")
+        codec.load()
+
+    # Читаем сырые значения мимо CompressedText, чтобы не пересжимать актуальные кадры
+    last_id = 0
+    converted = 0
+    while True:
+        rows = db.session.execute(
+            text("SELECT id, content_ru, content_en FROM chapter WHERE id > :last_id ORDER BY id LIMIT :limit"),
+            {'last_id': last_id, 'limit': batch_size}
+        ).all()
+        if not rows:
+            break
+        for row in rows:
+            values = {}
+            for lang, value in zip(langs, (row.content_ru, row.content_en)):
+                if value and not codec.is_current(value, lang):
+                    values[f'content_{lang}'] = codec.compress(codec.decompress(value), lang)
+            if values:
+                db.session.execute(
+                    text(f"UPDATE chapter SET {', '.join(f'{key} = :{key}' for key in values)} WHERE id = :id"),
+                    {**values, 'id': row.id}
+                )
+                converted += 1
+        db.session.commit()
+        last_id = rows[-1].id
+        print(f"Converted {converted} chapters (up to id {last_id})")
+
+    if vacuum:
+        # VACUUM нельзя выполнить внутри транзакции
+        with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+            connection.exec_driver_sql("VACUUM")
+
+    sample = db.session.query(Chapter).options(undefer(Chapter.content_ru), undefer(Chapter.content_en)).limit(200).all()
+    for lang in langs:
+        texts = [getattr(chapter, f'content_{lang}') for chapter in sample]
+        print(compression.measure([value for value in texts if value], lang))
+
+@blueprint.route('/bookmarks', methods=['OPTIONS'])
 def options():
     return '', 204
 
+@blueprint.route('/metrics')
+def prometheus_metrics():
+    metrics = current_app.extensions.get('metrics')
+    if metrics is None:
+        abort(404)
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+def __getattr__(name):
+    # `gunicorn app:application`, `flask --app app` и `from app import app` получают
+    # приложение с настройками из окружения; сам импорт модуля его не создаёт
+    if name in ('app', 'application'):
+        global app
+        with _extensions_lock:
+            if 'app' not in globals():
+                app = create_app()
+        return app
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
 if __name__ == '__main__':
     logger.debug("Running app in debug mode")
-    #app.run(host='0.0.0.0', port=3000, debug=True)
+    #create_app().run(host='0.0.0.0', port=3000, debug=True)
     # run locally
-    app.run(debug=True, port=3000)
-
-else:
-    logger.debug("App imported, not running directly")
-    application = app
-    app.run(host='0.0.0.0', port=3000, debug=True)
+    create_app().run(debug=True, port=3000)
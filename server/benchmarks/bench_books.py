@@ -0,0 +1,109 @@
+"""EPUB export of a whole ranobe: streamed vs built in memory, and a cache hit over HTTP.
+
+`memory` builds the archive in-process both ways and reports the peak
+Python allocation: `buffered` loads all chapters and writes the archive
+into a BytesIO, `streamed` is books.stream_book over batched reads.
+`http` downloads GET /ranobe/1/export from gunicorn twice: the first
+request builds the book (miss), the second is served from the cache (hit).
+
+    python benchmarks/bench_books.py --chapters 500 --body-kb 20,40
+"""
+import argparse
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+import zipfile
+
+from common import build_synthetic_db, load_app
+from bench_ingest import start_gunicorn
+
+
+def measure(func):
+    tracemalloc.start()
+    started = time.perf_counter()
+    size = func()
+    elapsed = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {'seconds': round(elapsed, 3), 'peak_alloc_mb': round(peak / 1024 / 1024, 1), 'output_mb': round(size / 1024 / 1024, 1)}
+
+
+def memory_report(app_module, lang):
+    import books
+
+    db = app_module.db
+
+    def buffered():
+        chapters = list(books.iter_book_chapters(db.session, 1, lang, batch_size=10 ** 9))
+        book = books.load_book(db.session, 1, lang)
+        output = io.BytesIO()
+        with zipfile.ZipFile(output, 'w', zipfile.ZIP_DEFLATED) as archive:
+            for _ in books.write_epub(archive, book, chapters):
+                pass
+        return len(output.getvalue())
+
+    def streamed():
+        book = books.load_book(db.session, 1, lang)
+        return sum(len(chunk) for chunk in books.stream_book('epub', book, books.iter_book_chapters(db.session, 1, lang)))
+
+    report = {}
+    for name, func in (('buffered', buffered), ('streamed', streamed)):
+        with app_module.app.app_context():
+            report[name] = measure(func)
+    return report
+
+
+def http_report(db_path, workdir, lang):
+    import requests
+
+    server, base_url = start_gunicorn(db_path, os.path.join(workdir, 'response_cache.db'))
+    report = {}
+    try:
+        for attempt in ('miss', 'hit'):
+            started = time.perf_counter()
+            response = requests.get(f'{base_url}/ranobe/1/export', params={'lang': lang}, stream=True)
+            first_byte = None
+            size = 0
+            for chunk in response.iter_content(64 * 1024):
+                if first_byte is None:
+                    first_byte = time.perf_counter() - started
+                size += len(chunk)
+            report[attempt] = {
+                'cache': response.headers.get('X-Book-Cache'),
+                'first_byte_ms': round(first_byte * 1000, 1),
+                'total_ms': round((time.perf_counter() - started) * 1000, 1),
+                'output_mb': round(size / 1024 / 1024, 1),
+            }
+    finally:
+        server.terminate()
+        server.wait()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--chapters', type=int, default=500)
+    parser.add_argument('--body-kb', default='20,40')
+    parser.add_argument('--lang', default='ru')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='ranobe-bench-')
+    db_path = os.path.join(workdir, 'ranobe.db')
+    # Кеш книг во временном каталоге, и для этого процесса, и для gunicorn
+    os.environ['RANOBE_BOOK_CACHE_DIR'] = os.path.join(workdir, 'books')
+    low, high = (int(value) for value in args.body_kb.split(','))
+    try:
+        app_module = load_app(db_path)
+        build_synthetic_db(app_module, novels=1, chapters=args.chapters, body_kb=(low, high))
+        report = {'memory': memory_report(app_module, args.lang), 'http': http_report(db_path, workdir, args.lang)}
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
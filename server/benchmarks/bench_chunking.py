@@ -0,0 +1,105 @@
+"""API calls per chapter and truncation rate: old word-split vs paragraph chunker.
+
+A chunk counts as truncated when its expected Russian output does not fit
+MAX_TOKENS. Expected output = chunk tokens x the chapter's own ru/en token
+ratio when the chapter is already translated, chunking.OUTPUT_RATIO otherwise
+(--ratio forces one value).
+
+    python benchmarks/bench_chunking.py --chapters 200
+    RANOBE_DATABASE_URI=sqlite:////path/to/ranobe.db python benchmarks/bench_chunking.py --real --counter tiktoken
+"""
+import argparse
+import json
+import os
+import statistics
+
+from common import build_synthetic_db, load_app
+
+MAX_TOKENS = 4096
+
+
+def legacy_split(content, max_tokens=MAX_TOKENS):
+    '''split_content из translator.py до перехода на chunking'''
+    parts, current, current_tokens = [], [], 0
+    for word in content.split():
+        word_tokens = len(word) // 4 + 1
+        if current_tokens + word_tokens > max_tokens:
+            parts.append(' '.join(current))
+            current, current_tokens = [word], word_tokens
+        else:
+            current.append(word)
+            current_tokens += word_tokens
+    if current:
+        parts.append(' '.join(current))
+    return parts, ' '
+
+
+def summarize(name, rows):
+    chunks = sum(row['chunks'] for row in rows)
+    return {
+        'splitter': name,
+        'chapters': len(rows),
+        'calls_per_chapter': round(chunks / len(rows), 2),
+        'max_calls_per_chapter': max(row['chunks'] for row in rows),
+        'truncation_rate': round(sum(row['truncated'] for row in rows) / chunks, 4),
+        'chapters_with_truncation': sum(1 for row in rows if row['truncated']),
+        'mean_chunk_tokens': round(statistics.mean(row['mean_tokens'] for row in rows)),
+        'paragraphs_preserved': round(sum(row['paragraphs_kept'] for row in rows) / sum(row['paragraphs'] for row in rows), 4),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--chapters', type=int, default=200)
+    parser.add_argument('--real', action='store_true', help='Use the database from RANOBE_DATABASE_URI as is')
+    parser.add_argument('--counter', default='heuristic', choices=('heuristic', 'tiktoken'))
+    parser.add_argument('--max-tokens', type=int, default=MAX_TOKENS)
+    parser.add_argument('--ratio', type=float, help='Force one ru/en output ratio for every chapter')
+    args = parser.parse_args()
+
+    if args.real:
+        app_module = load_app(os.environ['RANOBE_DATABASE_URI'][len('sqlite:///'):])
+    else:
+        app_module = load_app()
+        build_synthetic_db(app_module, novels=1, chapters=args.chapters)
+
+    import chunking
+    from sqlalchemy.orm import undefer_group
+
+    count_tokens = chunking.get_token_counter(args.counter)
+    splitters = {
+        'legacy_word_split': lambda content: legacy_split(content, args.max_tokens),
+        'paragraph_chunker': lambda content: (chunking.chunk_content(content, args.max_tokens, count_tokens), '\n'),
+    }
+    results = {name: [] for name in splitters}
+
+    Chapter = app_module.Chapter
+    with app_module.app.app_context():
+        query = Chapter.query.options(undefer_group('content')).filter(Chapter.content_en.isnot(None))
+        for chapter in query.yield_per(100):
+            source = chapter.content_en
+            source_tokens = count_tokens(source)
+            if args.ratio:
+                ratio = args.ratio
+            elif chapter.content_ru:
+                ratio = count_tokens(chapter.content_ru) / source_tokens
+            else:
+                ratio = chunking.OUTPUT_RATIO
+            paragraphs = chunking.split_paragraphs(source)
+            for name, split in splitters.items():
+                chunks, separator = split(source)
+                joined = separator.join(chunks)
+                token_counts = [count_tokens(chunk) for chunk in chunks]
+                results[name].append({
+                    'chunks': len(chunks),
+                    'truncated': sum(1 for tokens in token_counts if tokens * ratio > args.max_tokens),
+                    'mean_tokens': statistics.mean(token_counts),
+                    'paragraphs': len(paragraphs),
+                    'paragraphs_kept': len(chunking.split_paragraphs(joined)) if separator == '\n' else 1,
+                })
+
+    print(json.dumps([summarize(name, rows) for name, rows in results.items()], indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+"""Compression ratio and decode latency of chapter bodies: zstd levels with and without a dictionary.
+
+    python benchmarks/bench_compression.py --chapters 500
+    RANOBE_DATABASE_URI=sqlite:////path/to/ranobe.db python benchmarks/bench_compression.py --real
+"""
+import argparse
+import json
+import os
+import random
+
+from common import build_synthetic_db, load_app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--chapters', type=int, default=500)
+    parser.add_argument('--real', action='store_true', help='Use the database from RANOBE_DATABASE_URI as is')
+    parser.add_argument('--levels', default='3,9,19')
+    args = parser.parse_args()
+
+    if args.real:
+        app_module = load_app(os.environ['RANOBE_DATABASE_URI'][len('sqlite:///'):])
+    else:
+        app_module = load_app()
+        build_synthetic_db(app_module, novels=1, chapters=args.chapters)
+
+    import compression
+    from sqlalchemy.orm import undefer_group
+
+    Chapter = app_module.Chapter
+    with app_module.app.app_context():
+        chapters = Chapter.query.options(undefer_group('content')).all()
+        texts = {lang: [getattr(c, f'content_{lang}') for c in chapters if getattr(c, f'content_{lang}')]
+                 for lang in app_module.CONTENT_LANGS}
+
+    report = []
+    for level in (int(value) for value in args.levels.split(',')):
+        for with_dictionary in (False, True):
+            codec = compression.ChapterCodec(level)
+            rows = []
+            if with_dictionary:
+                for lang, values in texts.items():
+                    sample = random.Random(0).sample(values, min(len(values), compression.TRAIN_SAMPLES))
+                    dictionary = compression.train_dictionary(sample, level=level)
+                    rows.append((dictionary.dict_id(), lang, dictionary.as_bytes()))
+            codec.load(rows)
+            for lang, values in texts.items():
+                result = compression.measure(values, lang, codec)
+                report.append({'level': level, 'dictionary': with_dictionary, **result})
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""Time and peak memory of dbtojson.py: the old fetchall + json.dump export vs the streaming one.
+
+Each export runs in its own process on the same synthetic database, so
+peak RSS is comparable; the streaming one should stay flat as --chapters grows.
+
+    python benchmarks/bench_export.py --chapters 500
+    python benchmarks/bench_export.py --chapters 2000 --formats json,ndjson.zst
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import shutil
+import tempfile
+import time
+
+from common import build_synthetic_db, load_app
+
+
+def legacy_export(db_path, output):
+    '''db_to_json из dbtojson.py до перехода на потоковую выгрузку'''
+    import sqlite3
+    from compression import ChapterCodec
+
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
+    tables = cursor.fetchall()
+    codec = ChapterCodec()
+    if ('compression_dictionary',) in tables:
+        cursor.execute("SELECT id, lang, data FROM compression_dictionary ORDER BY created_at, id")
+        codec.load(cursor.fetchall())
+    db_data = {}
+    for (table_name,) in tables:
+        # Поисковый индекс старый скрипт тоже выгружал; здесь он пропущен, чтобы объём совпадал
+        if table_name == 'compression_dictionary' or table_name.startswith(('chapter_fts', 'sqlite_')):
+            continue
+        cursor.execute(f"SELECT * FROM {table_name}")
+        columns = [description[0] for description in cursor.description]
+        # Смещений абзацев в старой схеме не было
+        db_data[table_name] = [
+            {column: codec.decompress(value) for column, value in zip(columns, row) if not column.startswith('paragraphs_')}
+            for row in cursor.fetchall()
+        ]
+    with open(output, 'w', encoding='utf-8') as json_file:
+        json.dump(db_data, json_file, ensure_ascii=False, indent=4)
+    conn.close()
+
+
+def peak_rss_kb():
+    # ru_maxrss переживает exec и у spawn-процесса включает пик родителя; VmHWM - нет
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmHWM:'):
+                return int(line.split()[1])
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def export(kind, db_path, output, results):
+    started = time.perf_counter()
+    if kind == 'legacy':
+        legacy_export(db_path, output)
+    else:
+        import dbtojson
+        fmt = 'json' if kind.startswith('json') else 'ndjson'
+        dbtojson.db_to_json(db_path, output, fmt)
+    results.put({
+        'export': kind,
+        'seconds': round(time.perf_counter() - started, 2),
+        'peak_rss_mb': round(peak_rss_kb() / 1024, 1),
+        'output_mb': round(os.path.getsize(output) / 2 ** 20, 1),
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--chapters', type=int, default=500)
+    parser.add_argument('--formats', default='legacy,json,ndjson,ndjson.gz,ndjson.zst')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='ranobe-bench-')
+    db_path = os.path.join(workdir, 'ranobe.db')
+    build_synthetic_db(load_app(db_path), novels=1, chapters=args.chapters)
+    db_mb = round(os.path.getsize(db_path) / 2 ** 20, 1)
+
+    context = multiprocessing.get_context('spawn')
+    report = []
+    try:
+        for kind in args.formats.split(','):
+            results = context.Queue()
+            output = os.path.join(workdir, 'output.json' if kind == 'legacy' else f'output.{kind}')
+            process = context.Process(target=export, args=(kind, db_path, output, results))
+            process.start()
+            report.append({**results.get(), 'db_mb': db_mb})
+            process.join()
+            os.remove(output)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
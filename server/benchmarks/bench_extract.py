@@ -0,0 +1,83 @@
+"""Pages/sec and peak memory of the __NEXT_DATA__ extractors in extractors.py.
+
+Runs on a corpus of saved pages (chapter-*.html, e.g. from
+fake_novel_site.py --dump or pages saved from the real site) or on
+synthetic pages generated in memory. Every extractor must return the
+same chapter data as the BeautifulSoup path.
+
+    python benchmarks/bench_extract.py --chapters 200
+    python benchmarks/bench_extract.py --pages pages/
+"""
+import argparse
+import glob
+import json
+import os
+import time
+import tracemalloc
+
+from common import SERVER_DIR  # noqa: F401 - puts server/ on sys.path
+from fake_novel_site import PageSource
+
+
+def load_corpus(pages_dir, chapters):
+    if pages_dir:
+        pages = []
+        for path in sorted(glob.glob(os.path.join(pages_dir, '*.html'))):
+            with open(path, 'rb') as f:
+                pages.append(f.read())
+        return pages
+    source = PageSource(chapters=chapters)
+    return [source.get(number) for number in range(1, chapters + 1)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--pages', help='Directory with saved chapter pages')
+    parser.add_argument('--chapters', type=int, default=200, help='Synthetic pages when --pages is not given')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    import extractors
+
+    pages = load_corpus(args.pages, args.chapters)
+    total_bytes = sum(len(page) for page in pages)
+    reference = [extractors.extract_bs4(page) for page in pages]
+
+    report = []
+    for name, extract in extractors.EXTRACTORS.items():
+        mismatches = sum(1 for page, expected in zip(pages, reference) if extract(page) != expected)
+
+        best = None
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            for page in pages:
+                extract(page)
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+
+        # Пик памяти на одну страницу: сама страница уже в памяти и не считается
+        peaks = []
+        tracemalloc.start()
+        for page in pages:
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+            extract(page)
+            peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+        tracemalloc.stop()
+
+        report.append({
+            'extractor': name,
+            'pages': len(pages),
+            'mean_page_kb': round(total_bytes / len(pages) / 1024, 1),
+            'pages_per_sec': round(len(pages) / best, 1),
+            'mb_per_sec': round(total_bytes / best / 2 ** 20, 1),
+            'peak_memory_kb_max': round(max(peaks) / 1024, 1),
+            'peak_memory_kb_mean': round(sum(peaks) / len(peaks) / 1024, 1),
+            'mismatches': mismatches,
+        })
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
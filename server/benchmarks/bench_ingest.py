@@ -0,0 +1,200 @@
+"""Chapters/sec of the three ways parser.py can save chapters, while gunicorn serves reads.
+
+    per_chapter - POST /chapters/, one request and one transaction per chapter
+    bulk        - POST /chapters/bulk, --batch-size chapters per request
+    direct      - ingest.ChapterIngest, --batch-size chapters per transaction, no HTTP
+
+Every mode starts from a fresh database with one ranobe and a running
+gunicorn; --readers threads keep reading the table of contents and
+chapters during the writes, so the report also shows read latency and
+errors the writes cause.
+
+    python benchmarks/bench_ingest.py --chapters 500 --readers 2
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from common import SERVER_DIR, WORDS_EN, init_db, make_body, make_paragraphs
+from bench_sqlite_concurrency import percentile
+from suite import free_port
+
+MODES = ('per_chapter', 'bulk', 'direct')
+
+
+def make_chapters(count, seed=42):
+    '''Chapters as parser.py produces them: English title and body only'''
+    rng = random.Random(seed)
+    paragraphs = make_paragraphs(WORDS_EN, rng)
+    return [{
+        'ranobe_id': 1,
+        'chapter_id': i + 1,
+        'chapter_number_origin': i + 1,
+        'title_en': f'Chapter title {i + 1}',
+        'content_en': make_body(paragraphs, rng.randint(15, 30) * 1024, rng),
+    } for i in range(count)]
+
+
+def start_gunicorn(db_path, cache_path):
+    import requests
+
+    port = free_port()
+    env = {**os.environ, 'RANOBE_DATABASE_URI': f'sqlite:///{db_path}'}
+    command = [
+        sys.executable, '-m', 'gunicorn', 'app:application',
+        '--config', os.path.join(SERVER_DIR, 'gunicorn.conf.py'),
+        # Пути логов из конфига есть только на сервере
+        '--bind', f'127.0.0.1:{port}', '--access-logfile', '/dev/null', '--error-logfile', '-',
+        '--log-level', 'warning',
+        # Перезапуск воркера по max_requests рвёт keep-alive соединения посреди замера
+        '--max-requests', '0',
+        # -e заменяет raw_env из конфига целиком; ingest.py сбрасывает только общий кеш
+        '-e', 'RANOBE_RESPONSE_CACHE=sqlite',
+        '-e', f'RANOBE_RESPONSE_CACHE_PATH={cache_path}',
+    ]
+    server = subprocess.Popen(command, cwd=SERVER_DIR, env=env, stderr=subprocess.DEVNULL)
+    base_url = f'http://127.0.0.1:{port}'
+    deadline = time.time() + 60
+    while True:
+        try:
+            if requests.get(f'{base_url}/ranobe/', timeout=1).ok:
+                return server, base_url
+        except requests.RequestException:
+            pass
+        if time.time() > deadline or server.poll() is not None:
+            server.terminate()
+            raise RuntimeError('gunicorn did not start')
+        time.sleep(0.2)
+
+
+def read_load(base_url, chapters, stop, outcomes, seed):
+    import requests
+
+    rng = random.Random(seed)
+    session = requests.Session()
+    while not stop.is_set():
+        if rng.random() < 0.2:
+            path = '/ranobe/1'
+        else:
+            path = f'/chapters/1/{rng.randint(1, chapters)}?lang=en'
+        start = time.perf_counter()
+        response = session.get(base_url + path)
+        # 404 - глава ещё не записана
+        outcomes.append((time.perf_counter() - start, response.status_code >= 500))
+
+
+def write_per_chapter(base_url, chapters, batch_size):
+    import requests
+
+    session = requests.Session()
+    errors = 0
+    for chapter in chapters:
+        errors += session.post(f'{base_url}/chapters/', json=chapter).status_code != 201
+    return errors
+
+
+def write_bulk(base_url, chapters, batch_size):
+    import requests
+
+    session = requests.Session()
+    errors = 0
+    for i in range(0, len(chapters), batch_size):
+        response = session.post(f'{base_url}/chapters/bulk', json=chapters[i:i + batch_size])
+        errors += sum(1 for item in response.json()['items'] if item['status'] == 'error')
+    return errors
+
+
+def write_direct(db_path, cache_path, chapters, batch_size):
+    from ingest import ChapterIngest
+
+    ingest = ChapterIngest(f'sqlite:///{db_path}', cache_path)
+    try:
+        return sum(1 for result in ingest.upsert_chapters(chapters, batch_size) if result['status'] == 'error')
+    finally:
+        ingest.close()
+
+
+def run(mode, chapters, args):
+    from ingest import ChapterIngest
+    from models import Ranobe
+
+    workdir = tempfile.mkdtemp(prefix='ranobe-bench-')
+    db_path = os.path.join(workdir, 'ranobe.db')
+    cache_path = os.path.join(workdir, 'response_cache.db')
+    init_db(db_path)
+    setup = ChapterIngest(f'sqlite:///{db_path}', None)
+    setup.session.add(Ranobe(title='Synthetic ranobe 1'))
+    setup.session.commit()
+    setup.close()
+
+    server, base_url = start_gunicorn(db_path, cache_path)
+    stop = threading.Event()
+    reads = []
+    readers = [
+        threading.Thread(target=read_load, args=(base_url, len(chapters), stop, reads, i))
+        for i in range(args.readers)
+    ]
+    try:
+        for reader in readers:
+            reader.start()
+        started = time.perf_counter()
+        if mode == 'direct':
+            errors = write_direct(db_path, cache_path, chapters, args.batch_size)
+        elif mode == 'bulk':
+            errors = write_bulk(base_url, chapters, args.batch_size)
+        else:
+            errors = write_per_chapter(base_url, chapters, args.batch_size)
+        elapsed = time.perf_counter() - started
+        stop.set()
+        for reader in readers:
+            reader.join()
+
+        import requests
+        toc = requests.get(f'{base_url}/ranobe/1').json()
+    finally:
+        stop.set()
+        server.terminate()
+        server.wait(timeout=30)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    latencies = [latency for latency, _ in reads]
+    return {
+        'mode': mode,
+        'chapters': len(chapters),
+        'seconds': round(elapsed, 2),
+        'chapters_per_sec': round(len(chapters) / elapsed, 1),
+        'write_errors': errors,
+        'chapters_visible_to_api': len(toc['chapters']),
+        'reads': len(reads),
+        'read_errors': sum(1 for _, error in reads if error),
+        'read_p50_ms': percentile(latencies, 0.5),
+        'read_p99_ms': percentile(latencies, 0.99),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--chapters', type=int, default=500)
+    parser.add_argument('--batch-size', type=int, default=100)
+    parser.add_argument('--readers', type=int, default=2, help='Threads reading through gunicorn during the writes')
+    parser.add_argument('--modes', default=','.join(MODES))
+    args = parser.parse_args()
+
+    chapters = make_chapters(args.chapters)
+    report = [run(mode, chapters, args) for mode in args.modes.split(',')]
+    direct = next((row for row in report if row['mode'] == 'direct'), None)
+    if direct:
+        for row in report:
+            row['direct_speedup'] = round(direct['chapters_per_sec'] / row['chapters_per_sec'], 2)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
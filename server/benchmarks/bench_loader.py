@@ -0,0 +1,112 @@
+"""Time and peak memory of loading an export into an API: fill-go.py's json.load + one POST
+at a time vs loader.py against the Go API (concurrent POSTs) and the Flask API (bulk batches).
+
+The API is fake_chapter_api.py with --latency per request, so the numbers
+show the request pattern, not the server. Each load runs in its own
+process; --fail-rate adds 503s that loader.py retries.
+
+    python benchmarks/bench_loader.py --chapters 500
+    python benchmarks/bench_loader.py --chapters 2000 --latency 0.05 --fail-rate 0.05 --loads go,flask
+"""
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+
+from bench_export import peak_rss_kb
+from common import build_synthetic_db, load_app
+from fake_chapter_api import new_stats, serve
+from suite import free_port
+
+GO_RANOBE_ID = '670921dbdad01c7a159da9d6'
+
+
+def legacy_load(export_path, api_url):
+    '''Цикл из fill-go.py до перехода на loader.py'''
+    import requests
+
+    with open(export_path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    for chapter in data['chapter']:
+        requests.post(f'{api_url}/api/chapters', json={
+            "ranobe_id": GO_RANOBE_ID,
+            "chapter_id": chapter['chapter_id'],
+            "chapter_number_origin": chapter['chapter_number_origin'],
+            "title_ru": chapter['title_ru'],
+            "title_en": chapter['title_en'],
+            "content_ru": chapter['content_ru'],
+            "content_en": chapter['content_en']
+        })
+
+
+def load(kind, export_path, api_url, state_path, results):
+    started = time.perf_counter()
+    if kind == 'legacy':
+        legacy_load(export_path, api_url)
+        counts = None
+    else:
+        import asyncio
+        import loader
+        state = loader.LoadState(state_path)
+        if kind == 'go':
+            runner = loader.Loader('go', f'{api_url}/api/chapters', state, GO_RANOBE_ID)
+        else:
+            runner = loader.Loader('flask', f'{api_url}/chapters/', state)
+        # Построчный прогресс loader.py в отчёте не нужен
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            counts = asyncio.run(runner.run(loader.iter_chapters(export_path)))
+        state.close()
+    results.put({
+        'load': kind,
+        'seconds': round(time.perf_counter() - started, 2),
+        'peak_rss_mb': round(peak_rss_kb() / 1024, 1),
+        'counts': counts,
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--chapters', type=int, default=500)
+    parser.add_argument('--latency', type=float, default=0.02, help='Seconds per request in the fake API')
+    parser.add_argument('--fail-rate', type=float, default=0.0)
+    parser.add_argument('--loads', default='legacy,go,flask')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='ranobe-bench-')
+    db_path = os.path.join(workdir, 'ranobe.db')
+    export_path = os.path.join(workdir, 'output.json')
+    build_synthetic_db(load_app(db_path), novels=1, chapters=args.chapters)
+    import dbtojson
+    dbtojson.db_to_json(db_path, export_path)
+    export_mb = round(os.path.getsize(export_path) / 2 ** 20, 1)
+
+    port = free_port()
+    server, chapters, stats = serve(argparse.Namespace(
+        latency=args.latency, fail_rate=args.fail_rate, throttle_rate=0.0, verbose=False), port)
+    context = multiprocessing.get_context('spawn')
+    report = []
+    try:
+        for kind in args.loads.split(','):
+            chapters.clear()
+            stats.update(new_stats())
+            results = context.Queue()
+            state_path = os.path.join(workdir, f'loader_state_{kind}.db')
+            process = context.Process(target=load, args=(kind, export_path, f'http://127.0.0.1:{port}', state_path, results))
+            process.start()
+            report.append({
+                **results.get(), 'export_mb': export_mb, 'requests': stats['requests'],
+                'unique_chapters': len(chapters), 'max_in_flight': stats['max_in_flight'],
+            })
+            process.join()
+    finally:
+        server.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""Cost of the /metrics instrumentation under gunicorn, and whether its totals add up across workers.
+
+The same read mix (ranobe list, one ranobe, chapters) is sent with
+RANOBE_METRICS=off and on. With metrics on, after the run /metrics must
+report exactly the number of requests that were sent, summed over all
+workers (every worker flushes within RANOBE_METRICS_FLUSH_INTERVAL).
+
+    python benchmarks/bench_metrics.py --threads 4 --requests 500
+"""
+import argparse
+import json
+import os
+import random
+import re
+import shutil
+import tempfile
+import threading
+import time
+
+from common import build_synthetic_db, load_app
+from bench_ingest import start_gunicorn
+from bench_sqlite_concurrency import percentile
+
+PATHS = ('/ranobe/', '/ranobe/1', '/chapters/1/{chapter}?lang=en', '/chapters/1/{chapter}/paragraphs?lang=ru')
+
+
+def send(base_url, count, chapters, seed, latencies):
+    import requests
+
+    rng = random.Random(seed)
+    session = requests.Session()
+    for _ in range(count):
+        path = rng.choice(PATHS).format(chapter=rng.randint(1, chapters))
+        started = time.perf_counter()
+        session.get(base_url + path).raise_for_status()
+        latencies.append(time.perf_counter() - started)
+
+
+def counted_requests(text):
+    return int(sum(
+        float(value) for endpoint, value in
+        re.findall(r'^ranobe_http_requests_total\{endpoint="([^"]*)".*\} (\S+)$', text, re.M)
+        if endpoint != 'ranobe.prometheus_metrics'
+    ))
+
+
+def run(mode, db_path, workdir, args):
+    import requests
+
+    os.environ['RANOBE_METRICS'] = mode
+    os.environ['RANOBE_METRICS_PATH'] = os.path.join(workdir, f'metrics-{mode}.db')
+    os.environ['RANOBE_METRICS_FLUSH_INTERVAL'] = str(args.flush_interval)
+    server, base_url = start_gunicorn(db_path, os.path.join(workdir, 'response_cache.db'))
+    try:
+        before = 0
+        if mode == 'on':
+            # Проверка готовности в start_gunicorn тоже попадает в счётчики; ждём, пока её сбросят
+            time.sleep(args.flush_interval + 1)
+            before = counted_requests(requests.get(f'{base_url}/metrics').text)
+        latencies = []
+        threads = [
+            threading.Thread(target=send, args=(base_url, args.requests, args.chapters, seed, latencies))
+            for seed in range(args.threads)
+        ]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        result = {
+            'metrics': mode,
+            'requests_per_second': round(len(latencies) / elapsed, 1),
+            'p50_ms': percentile(latencies, 0.5),
+            'p95_ms': percentile(latencies, 0.95),
+        }
+        if mode == 'on':
+            time.sleep(args.flush_interval + 1)
+            text = requests.get(f'{base_url}/metrics').text
+            result['sent'] = len(latencies)
+            result['counted'] = counted_requests(text) - before
+            result['metrics_bytes'] = len(text)
+    finally:
+        server.terminate()
+        server.wait()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--chapters', type=int, default=200)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--requests', type=int, default=500, help='Requests per thread')
+    parser.add_argument('--flush-interval', type=float, default=2.0)
+    parser.add_argument('--modes', default='off,on')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='ranobe-bench-')
+    db_path = os.path.join(workdir, 'ranobe.db')
+    try:
+        app_module = load_app(db_path)
+        build_synthetic_db(app_module, novels=1, chapters=args.chapters)
+        report = [run(mode, db_path, workdir, args) for mode in args.modes.split(',')]
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
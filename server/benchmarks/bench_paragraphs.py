@@ -0,0 +1,113 @@
+"""Time to first paragraph of long chapters: the whole chapter vs a paragraph range vs the NDJSON stream.
+
+Every request asks for a different chapter of --body-kb size; the reader
+can show text once the first paragraph is parsed. `chapter` is GET
+/chapters/<r>/<c> (whole body in one JSON document), `range` is the first
+--limit paragraphs from /paragraphs, `stream` is /paragraphs?format=ndjson
+read line by line. total_ms is the time until the whole response is read.
+
+    python benchmarks/bench_paragraphs.py --chapters 100 --body-kb 40,120
+    python benchmarks/bench_paragraphs.py --no-compress
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from common import SERVER_DIR, build_synthetic_db, load_app
+from bench_ingest import start_gunicorn
+from bench_sqlite_concurrency import percentile
+
+MODES = ('chapter', 'range', 'stream')
+
+
+def read_chapter(session, base_url, chapter_id, args):
+    response = session.get(f'{base_url}/chapters/1/{chapter_id}', params={'lang': args.lang})
+    first = response.json()[f'content_{args.lang}'].split('\n', 1)[0]
+    return first, len(response.content)
+
+
+def read_range(session, base_url, chapter_id, args):
+    response = session.get(f'{base_url}/chapters/1/{chapter_id}/paragraphs',
+                           params={'lang': args.lang, 'limit': args.limit})
+    return response.json()['paragraphs'][0], len(response.content)
+
+
+def read_stream(session, base_url, chapter_id, args, on_first):
+    response = session.get(f'{base_url}/chapters/1/{chapter_id}/paragraphs',
+                           params={'lang': args.lang, 'format': 'ndjson'}, stream=True)
+    size, count = 0, 0
+    for line in response.iter_lines(chunk_size=None):
+        size += len(line) + 1
+        count += 1
+        if count == 2:
+            on_first(json.loads(line)['text'])
+    return size
+
+
+def run(mode, base_url, chapter_ids, args):
+    import requests
+
+    session = requests.Session()
+    first_paragraph, total, sizes = [], [], []
+    for chapter_id in chapter_ids:
+        started = time.perf_counter()
+        if mode == 'stream':
+            size = read_stream(session, base_url, chapter_id, args,
+                               lambda text: first_paragraph.append(time.perf_counter() - started))
+        else:
+            reader = read_chapter if mode == 'chapter' else read_range
+            _, size = reader(session, base_url, chapter_id, args)
+            first_paragraph.append(time.perf_counter() - started)
+        total.append(time.perf_counter() - started)
+        sizes.append(size)
+    return {
+        'mode': mode,
+        'first_paragraph_p50_ms': percentile(first_paragraph, 0.5),
+        'first_paragraph_p95_ms': percentile(first_paragraph, 0.95),
+        'total_p50_ms': percentile(total, 0.5),
+        'avg_response_kb': round(sum(sizes) / len(sizes) / 1024, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--chapters', type=int, default=100)
+    parser.add_argument('--body-kb', default='40,120', help='Chapter size range, KB of UTF-8 per language')
+    parser.add_argument('--lang', default='ru')
+    parser.add_argument('--limit', type=int, default=20, help='Paragraphs per range request')
+    parser.add_argument('--rounds', type=int, default=3, help='Passes over all chapters per mode')
+    parser.add_argument('--no-compress', dest='compress', action='store_false',
+                        help='Keep bodies as plain text instead of zstd frames')
+    parser.add_argument('--modes', default=','.join(MODES))
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='ranobe-bench-')
+    db_path = os.path.join(workdir, 'ranobe.db')
+    low, high = (int(value) for value in args.body_kb.split(','))
+    app_module = load_app(db_path)
+    build_synthetic_db(app_module, novels=1, chapters=args.chapters, body_kb=(low, high))
+    if args.compress:
+        subprocess.run([sys.executable, '-m', 'flask', '--app', 'app', 'compress-chapters'], cwd=SERVER_DIR,
+                       env={**os.environ, 'RANOBE_DATABASE_URI': f'sqlite:///{db_path}'},
+                       check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    server, base_url = start_gunicorn(db_path, os.path.join(workdir, 'response_cache.db'))
+    try:
+        chapter_ids = list(range(1, args.chapters + 1)) * args.rounds
+        # Прогрев: страницы базы в кеше ОС, словари сжатия загружены в воркерах
+        run('chapter', base_url, chapter_ids[:args.chapters], args)
+        report = [run(mode, base_url, chapter_ids, args) for mode in args.modes.split(',')]
+    finally:
+        server.terminate()
+        server.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+    print(json.dumps({'compressed': args.compress, 'body_kb': [low, high], 'results': report}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
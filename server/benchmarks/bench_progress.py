@@ -0,0 +1,122 @@
+"""Reading-position updates per second: POST /bookmarks/ vs the buffered PUT /progress/<ranobe_id>.
+
+--writers threads play readers scrolling through different ranobe and
+report a position --events times each; --chapter-writers threads keep
+updating chapters meanwhile, like the translator does. After the run the
+bookmarks in the database are compared with the last position every
+writer sent (the buffer must not lose or reorder them).
+
+    python benchmarks/bench_progress.py --writers 8 --events 200
+"""
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from common import init_db
+from bench_ingest import make_chapters, start_gunicorn
+from bench_sqlite_concurrency import percentile
+
+MODES = ('bookmark', 'progress')
+
+
+def report_positions(base_url, mode, ranobe_id, events, latencies, errors):
+    import requests
+
+    session = requests.Session()
+    for position in range(1, events + 1):
+        started = time.perf_counter()
+        if mode == 'bookmark':
+            response = session.post(f'{base_url}/bookmarks/',
+                                    json={'ranobe_id': ranobe_id, 'chapter_id': 1, 'position': position})
+        else:
+            response = session.put(f'{base_url}/progress/{ranobe_id}', json={'chapter_id': 1, 'position': position})
+        latencies.append(time.perf_counter() - started)
+        if response.status_code >= 400:
+            errors.append(response.status_code)
+
+
+def write_chapters(base_url, chapters, stop, count):
+    import requests
+
+    session = requests.Session()
+    while not stop.is_set():
+        for chapter in chapters:
+            if stop.is_set():
+                break
+            session.post(f'{base_url}/chapters/', json=chapter)
+            count.append(1)
+
+
+def run(mode, args):
+    import requests
+
+    workdir = tempfile.mkdtemp(prefix='ranobe-bench-')
+    db_path = os.path.join(workdir, 'ranobe.db')
+    os.environ['RANOBE_PROGRESS_FLUSH_INTERVAL'] = str(args.flush_interval)
+    init_db(db_path)
+    server, base_url = start_gunicorn(db_path, os.path.join(workdir, 'response_cache.db'))
+    try:
+        for i in range(args.writers):
+            requests.post(f'{base_url}/ranobe/', json={'title': f'Ranobe {i + 1}'})
+        chapters = make_chapters(20)
+        for i in range(args.writers):
+            requests.post(f'{base_url}/chapters/', json={**chapters[0], 'ranobe_id': i + 1})
+
+        latencies, errors, chapter_writes = [], [], []
+        stop = threading.Event()
+        background = [
+            threading.Thread(target=write_chapters, args=(base_url, chapters, stop, chapter_writes))
+            for _ in range(args.chapter_writers)
+        ]
+        writers = [
+            threading.Thread(target=report_positions, args=(base_url, mode, i + 1, args.events, latencies, errors))
+            for i in range(args.writers)
+        ]
+        for thread in background:
+            thread.start()
+        started = time.perf_counter()
+        for thread in writers:
+            thread.start()
+        for thread in writers:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        stop.set()
+        for thread in background:
+            thread.join()
+
+        # Фоновый сброс буфера в каждом воркере
+        time.sleep(args.flush_interval * 2 + 0.5)
+        bookmarks = {item['ranobe_id']: item['position'] for item in requests.get(f'{base_url}/bookmarks/').json()}
+    finally:
+        server.terminate()
+        server.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        'mode': mode,
+        'events_per_second': round(len(latencies) / elapsed, 1),
+        'p50_ms': percentile(latencies, 0.5),
+        'p95_ms': percentile(latencies, 0.95),
+        'errors': len(errors),
+        'chapter_writes_per_second': round(len(chapter_writes) / elapsed, 1),
+        'final_positions_ok': all(bookmarks.get(i + 1) == args.events for i in range(args.writers)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--writers', type=int, default=8)
+    parser.add_argument('--events', type=int, default=200, help='Position updates per writer')
+    parser.add_argument('--chapter-writers', type=int, default=1)
+    parser.add_argument('--flush-interval', type=float, default=1.0)
+    parser.add_argument('--modes', default=','.join(MODES))
+    args = parser.parse_args()
+    print(json.dumps([run(mode, args) for mode in args.modes.split(',')], indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""Bytes read and latency of chapter queries before/after column projection.
+
+    python benchmarks/bench_projection.py --chapters 1000
+"""
+import argparse
+import json
+
+from common import build_synthetic_db, load_app, row_bytes, timed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--chapters', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    app_module = load_app()
+    build_synthetic_db(app_module, novels=1, chapters=args.chapters)
+    db, Chapter = app_module.db, app_module.Chapter
+    table = Chapter.__table__
+    chapter_id = args.chapters // 2
+
+    def fetch(statement):
+        # Через Connection ORM-запрос возвращает сырые строки колонок
+        return db.session.connection().execute(statement).all()
+
+    cases = {
+        # Старый RanobeView.get: все колонки всех глав
+        'toc_before': lambda: fetch(
+            table.select().where(table.c.ranobe_id == 1).order_by(table.c.chapter_number_origin)
+        ),
+        'toc_after': lambda: fetch(app_module.chapter_toc_query(1).statement),
+        # Старый ChapterItem.get: оба языка
+        'chapter_before': lambda: fetch(
+            table.select().where((table.c.ranobe_id == 1) & (table.c.chapter_id == chapter_id))
+        ),
+        'chapter_after': lambda: fetch(
+            app_module.chapter_query(1, chapter_id, 'ru').statement
+        ),
+    }
+
+    report = {}
+    with app_module.app.app_context():
+        for name, func in cases.items():
+            seconds, rows = timed(func, args.repeat)
+            report[name] = {'ms': round(seconds * 1000, 2), 'bytes_read': row_bytes(rows)}
+
+        client = app_module.app.test_client()
+        for name, url in (('GET /ranobe/1', '/ranobe/1'),
+                          ('GET /chapters/1/<id>?lang=ru', f'/chapters/1/{chapter_id}?lang=ru')):
+            seconds, response = timed(lambda: client.get(url), args.repeat)
+            report[name] = {'ms': round(seconds * 1000, 2), 'response_bytes': len(response.data)}
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
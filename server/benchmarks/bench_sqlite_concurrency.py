@@ -0,0 +1,95 @@
+"""Concurrent readers and writers against one SQLite file, with and without the storage profile.
+
+Each reader/writer is a separate process with its own copy of the app,
+like gunicorn workers. Readers fetch chapters and the table of contents,
+writers store chapter translations.
+
+    python benchmarks/bench_sqlite_concurrency.py --readers 4 --writers 2 --seconds 10
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+
+from common import build_synthetic_db, load_app
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(len(values) * q))] * 1000, 2)
+
+
+def worker(role, db_path, profile, chapters, seconds, seed, results):
+    os.environ['RANOBE_SQLITE_PROFILE'] = profile
+    os.environ['RANOBE_RESPONSE_CACHE'] = 'none'
+    app_module = load_app(db_path)
+    client = app_module.app.test_client()
+    rng = random.Random(seed)
+    body = ' '.join('слово' for _ in range(6000))
+    latencies, errors = [], 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        chapter_id = rng.randint(1, chapters)
+        start = time.perf_counter()
+        if role == 'writer':
+            response = client.put(f'/chapters/1/{chapter_id}/update_translation',
+                                  json={'content_ru': f'{body} {start}'})
+        elif rng.random() < 0.1:
+            response = client.get('/ranobe/1')
+        else:
+            response = client.get(f'/chapters/1/{chapter_id}?lang=ru')
+        latencies.append(time.perf_counter() - start)
+        if response.status_code >= 500:
+            errors += 1
+    results.put((role, latencies, errors))
+
+
+def run(profile, args):
+    db_path = os.path.join(tempfile.mkdtemp(prefix='ranobe-bench-'), 'ranobe.db')
+    os.environ['RANOBE_SQLITE_PROFILE'] = profile
+    build_synthetic_db(load_app(db_path), novels=1, chapters=args.chapters)
+
+    results = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(target=worker, args=(role, db_path, profile, args.chapters, args.seconds, i, results))
+        for i, role in enumerate(['reader'] * args.readers + ['writer'] * args.writers)
+    ]
+    for process in processes:
+        process.start()
+    collected = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    report = {'profile': profile}
+    for role in ('reader', 'writer'):
+        latencies = [value for r, values, _ in collected if r == role for value in values]
+        report[role] = {
+            'requests': len(latencies),
+            'per_second': round(len(latencies) / args.seconds, 1),
+            'p50_ms': percentile(latencies, 0.5),
+            'p95_ms': percentile(latencies, 0.95),
+            'p99_ms': percentile(latencies, 0.99),
+            'errors': sum(errors for r, _, errors in collected if r == role),
+        }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--chapters', type=int, default=200)
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--writers', type=int, default=2)
+    parser.add_argument('--seconds', type=float, default=10)
+    args = parser.parse_args()
+
+    multiprocessing.set_start_method('spawn')
+    print(json.dumps([run('off', args), run('on', args)], indent=2))
+
+
+if __name__ == '__main__':
+    main()
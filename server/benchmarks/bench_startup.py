@@ -0,0 +1,144 @@
+"""Startup cost of the Flask app: import, create_app, first request, gunicorn time to first response.
+
+Every measurement runs in a fresh interpreter. `import` imports app.py
+with the database, caches and metrics pointed into an empty directory
+and lists the files the import created (there should be none).
+`startup` imports app.py, builds the app and serves one request through
+the test client on a synthetic database. `gunicorn` starts
+app:application with gunicorn.conf.py, with and without --preload, and
+waits for the first 200.
+
+--server-dir points at another checkout of server/ to compare with it;
+trees from before create_app() are built by accessing app.app.
+
+    python benchmarks/bench_startup.py --repeat 5
+    python benchmarks/bench_startup.py --server-dir /tmp/old/server
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from common import SERVER_DIR, build_synthetic_db, load_app
+from bench_ingest import free_port
+
+PROBE = '''
+import json, os, sys, time
+started = time.perf_counter()
+import app as module
+imported = time.perf_counter()
+report = {'import_ms': (imported - started) * 1000,
+          'files': sorted(os.listdir(os.environ['BENCH_WORKDIR']))}
+if sys.argv[1] == 'startup':
+    application = module.create_app() if hasattr(module, 'create_app') else module.app
+    created = time.perf_counter()
+    with application.test_client() as client:
+        client.get('/ranobe/1').close()
+    report.update(create_ms=(created - imported) * 1000, first_request_ms=(time.perf_counter() - created) * 1000)
+print(json.dumps(report))
+'''
+
+
+def environment(workdir, db_path):
+    return {
+        **os.environ,
+        'BENCH_WORKDIR': workdir,
+        'RANOBE_DATABASE_URI': f'sqlite:///{db_path}',
+        'RANOBE_RESPONSE_CACHE': 'sqlite',
+        'RANOBE_RESPONSE_CACHE_PATH': os.path.join(workdir, 'response_cache.db'),
+        'RANOBE_BOOK_CACHE_DIR': os.path.join(workdir, 'books'),
+        'RANOBE_METRICS_PATH': os.path.join(workdir, 'metrics.db'),
+        'RANOBE_LOG_LEVEL': 'WARNING',
+    }
+
+
+def probe(server_dir, phase, env):
+    output = subprocess.run([sys.executable, '-c', PROBE, phase], cwd=server_dir, env=env,
+                            check=True, capture_output=True, text=True).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def median(runs, key):
+    return round(statistics.median(run[key] for run in runs), 1)
+
+
+def import_report(server_dir, repeat):
+    runs, created = [], set()
+    for _ in range(repeat):
+        workdir = tempfile.mkdtemp(prefix='ranobe-bench-')
+        try:
+            runs.append(probe(server_dir, 'import', environment(workdir, os.path.join(workdir, 'ranobe.db'))))
+            created.update(runs[-1]['files'])
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return {'import_ms': median(runs, 'import_ms'), 'files_created_by_import': sorted(created)}
+
+
+def startup_report(server_dir, workdir, db_path, repeat):
+    runs = [probe(server_dir, 'startup', environment(workdir, db_path)) for _ in range(repeat)]
+    return {key: median(runs, key) for key in ('import_ms', 'create_ms', 'first_request_ms')}
+
+
+def gunicorn_report(server_dir, workdir, db_path, preload, repeat):
+    import requests
+
+    times = []
+    for _ in range(repeat):
+        port = free_port()
+        command = [
+            sys.executable, '-m', 'gunicorn', 'app:application',
+            '--config', os.path.join(server_dir, 'gunicorn.conf.py'),
+            '--bind', f'127.0.0.1:{port}', '--access-logfile', '/dev/null', '--error-logfile', '-',
+            '--log-level', 'warning',
+        ] + (['--preload'] if preload else [])
+        started = time.perf_counter()
+        server = subprocess.Popen(command, cwd=server_dir, env=environment(workdir, db_path), stderr=subprocess.DEVNULL)
+        try:
+            while True:
+                try:
+                    if requests.get(f'http://127.0.0.1:{port}/ranobe/1', timeout=1).ok:
+                        break
+                except requests.RequestException:
+                    pass
+                if server.poll() is not None or time.perf_counter() - started > 60:
+                    raise RuntimeError('gunicorn did not start')
+                time.sleep(0.01)
+            times.append(time.perf_counter() - started)
+        finally:
+            server.terminate()
+            server.wait()
+    return {'preload': preload, 'first_response_ms': round(statistics.median(times) * 1000, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--server-dir', default=SERVER_DIR)
+    parser.add_argument('--chapters', type=int, default=200)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--no-gunicorn', dest='gunicorn', action='store_false')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='ranobe-bench-')
+    db_path = os.path.join(workdir, 'ranobe.db')
+    try:
+        build_synthetic_db(load_app(db_path), novels=1, chapters=args.chapters)
+        report = {
+            'server_dir': args.server_dir,
+            **import_report(args.server_dir, args.repeat),
+            'startup': startup_report(args.server_dir, workdir, db_path, args.repeat),
+        }
+        if args.gunicorn:
+            report['gunicorn'] = [gunicorn_report(args.server_dir, workdir, db_path, preload, args.repeat)
+                                  for preload in (False, True)]
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+"""Общие утилиты для бенчмарков сервера.
+
+Запуск из каталога server/: python benchmarks/<script>.py
+"""
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if SERVER_DIR not in sys.path:
+    sys.path.insert(0, SERVER_DIR)
+
+WORDS_EN = (
+    "the boss said that system money loss game company studio employee profit "
+    "project plan was not what he expected but everyone looked at him with admiration"
+).split()
+WORDS_RU = (
+    "босс сказал что система деньги убыток игра компания студия сотрудник прибыль "
+    "проект план был не тем чего он ожидал но все смотрели на него с восхищением"
+).split()
+
+
+def load_app(db_path=None):
+    """Import app.py against a throwaway database and return the module.
+
+    app_module.app is created on first access, with the environment as it is then.
+    """
+    if db_path is None:
+        db_path = os.path.join(tempfile.mkdtemp(prefix='ranobe-bench-'), 'ranobe.db')
+    os.environ['RANOBE_DATABASE_URI'] = f'sqlite:///{db_path}'
+
+    import logging
+    logging.disable(logging.WARNING)
+    import app
+    return app
+
+
+def init_db(db_path):
+    """Create an empty database with `flask --app app init-db`, as on a new server."""
+    subprocess.run([sys.executable, '-m', 'flask', '--app', 'app', 'init-db'], cwd=SERVER_DIR,
+                   env={**os.environ, 'RANOBE_DATABASE_URI': f'sqlite:///{db_path}'},
+                   check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def make_paragraphs(words, rng, count=2000):
+    """Pool of paragraphs sharing one vocabulary, like chapters of one novel."""
+    return [
+        ' '.join(rng.choice(words) for _ in range(rng.randint(8, 60))).capitalize() + '.'
+        for _ in range(count)
+    ]
+
+
+def make_body(paragraphs, size_bytes, rng):
+    """Paragraphs separated by \\n, roughly size_bytes of UTF-8 text."""
+    body = []
+    total = 0
+    while total < size_bytes:
+        paragraph = rng.choice(paragraphs)
+        body.append(paragraph)
+        total += len(paragraph.encode('utf-8')) + 1
+    return '\n'.join(body)
+
+
+def build_synthetic_db(app_module, novels=1, chapters=1000, body_kb=(20, 40), seed=42, batch_size=200):
+    """Fill the app database with novels x chapters of bilingual content and one bookmark per novel.
+
+    Chapters go through upsert_chapters, so previews, compression and the
+    search index look exactly like data written by the API.
+    """
+    rng = random.Random(seed)
+    paragraphs_en = make_paragraphs(WORDS_EN, rng)
+    paragraphs_ru = make_paragraphs(WORDS_RU, rng)
+    db, Ranobe, Bookmark = app_module.db, app_module.Ranobe, app_module.Bookmark
+
+    def generate(ranobe_id):
+        for i in range(chapters):
+            size = rng.randint(body_kb[0], body_kb[1]) * 1024
+            yield {
+                'ranobe_id': ranobe_id,
+                'chapter_id': i + 1,
+                'chapter_number_origin': i + 1,
+                'title_en': f'Chapter title {i + 1}',
+                'title_ru': f'Заголовок главы {i + 1}',
+                'content_en': make_body(paragraphs_en, size, rng),
+                'content_ru': make_body(paragraphs_ru, size, rng),
+            }
+
+    from models import drop_schema
+
+    with app_module.app.app_context():
+        drop_schema(db.engine)
+        app_module.create_schema(db.engine)
+        for n in range(novels):
+            ranobe = Ranobe(title=f'Synthetic ranobe {n + 1}')
+            db.session.add(ranobe)
+            db.session.commit()
+            for result in app_module.upsert_chapters(generate(ranobe.id), batch_size):
+                if result['status'] == 'error':
+                    raise RuntimeError(result['error'])
+            db.session.add(Bookmark(ranobe_id=ranobe.id, chapter_id=max(1, chapters // 2)))
+            db.session.commit()
+
+
+def row_bytes(rows):
+    """Bytes of column values that crossed from SQLite into Python."""
+    total = 0
+    for row in rows:
+        for value in row:
+            if isinstance(value, str):
+                total += len(value.encode('utf-8'))
+            elif isinstance(value, bytes):
+                total += len(value)
+            elif value is not None:
+                total += 8
+    return total
+
+
+def timed(func, repeat=5):
+    """Run func repeat times, return (median seconds, last result)."""
+    timings = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    return timings[len(timings) // 2], result
@@ -0,0 +1,140 @@
+"""Local stand-in for the chapter APIs that loader.py writes to.
+
+Accepts POST /api/chapters (the Go server, one chapter per request) and
+POST /chapters/bulk (the Flask API, a JSON array with per-item results),
+keeps the chapters in memory keyed by (ranobe_id, chapter_id) and can add
+latency, 503s and 429 + Retry-After. GET /stats shows what arrived.
+
+    python benchmarks/fake_chapter_api.py --port 8003 --fail-rate 0.1
+    python loader.py output.json --target go --api-url http://127.0.0.1:8003/api/chapters --ranobe-id 670921dbdad01c7a159da9d6
+    python loader.py output.json --target flask --api-url http://127.0.0.1:8003/chapters/
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def new_stats():
+    return dict.fromkeys((
+        'requests', 'chapters_received', 'created', 'updated', 'rejected', 'failed', 'throttled',
+        'in_flight', 'max_in_flight',
+    ), 0)
+
+
+def make_handler(args, chapters, stats):
+    lock = threading.Lock()
+
+    def store(item):
+        '''Upsert one chapter; per-item result like in POST /chapters/bulk'''
+        if not isinstance(item, dict) or item.get('ranobe_id') is None or type(item.get('chapter_id')) is not int:
+            stats['rejected'] += 1
+            return {'status': 'error', 'error': 'ranobe_id and integer chapter_id are required'}
+        key = (str(item['ranobe_id']), item['chapter_id'])
+        with lock:
+            status = 'updated' if key in chapters else 'created'
+            # Хранится только размер, чтобы заглушка не росла с объёмом текстов
+            chapters[key] = sum(len(item.get(field) or '') for field in ('content_ru', 'content_en'))
+            stats['chapters_received'] += 1
+            stats[status] += 1
+        return {'ranobe_id': item['ranobe_id'], 'chapter_id': item['chapter_id'], 'status': status}
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *log_args):
+            if args.verbose:
+                super().log_message(format, *log_args)
+
+        def send_json(self, status, data, headers=()):
+            body = json.dumps(data).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            for name, value in dict(headers).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == '/stats':
+                with lock:
+                    self.send_json(200, {**stats, 'unique_chapters': len(chapters)})
+            else:
+                self.send_json(404, {'error': 'Not found'})
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+            with lock:
+                stats['requests'] += 1
+                stats['in_flight'] += 1
+                stats['max_in_flight'] = max(stats['max_in_flight'], stats['in_flight'])
+            try:
+                time.sleep(args.latency)
+                if random.random() < args.throttle_rate:
+                    stats['throttled'] += 1
+                    self.send_json(429, {'error': 'Too Many Requests'}, {'Retry-After': '1'})
+                    return
+                if random.random() < args.fail_rate:
+                    stats['failed'] += 1
+                    self.send_json(503, {'error': 'Service Unavailable'})
+                    return
+                try:
+                    data = json.loads(body)
+                except ValueError:
+                    self.send_json(400, {'error': 'Invalid data'})
+                    return
+
+                if self.path == '/api/chapters':
+                    result = store(data)
+                    if result['status'] == 'error':
+                        self.send_json(400, {'error': 'Invalid data'})
+                    else:
+                        self.send_json(201, data)
+                elif self.path.split('?')[0].rstrip('/') == '/chapters/bulk':
+                    if not isinstance(data, list):
+                        self.send_json(400, {'message': 'Expected a JSON array of chapters'})
+                        return
+                    items = [{'index': index, **store(item)} for index, item in enumerate(data)]
+                    self.send_json(200, {
+                        'created': sum(item['status'] == 'created' for item in items),
+                        'updated': sum(item['status'] == 'updated' for item in items),
+                        'errors': sum(item['status'] == 'error' for item in items),
+                        'items': items,
+                    })
+                else:
+                    self.send_json(404, {'error': 'Not found'})
+            finally:
+                with lock:
+                    stats['in_flight'] -= 1
+
+    return Handler
+
+
+def serve(args, port):
+    '''Start the stub in a background thread; (server, chapters, stats)'''
+    chapters, stats = {}, new_stats()
+    server = ThreadingHTTPServer(('127.0.0.1', port), make_handler(args, chapters, stats))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, chapters, stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8003)
+    parser.add_argument('--latency', type=float, default=0.02)
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='Share of requests answered with 503')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='Share of requests answered with 429')
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+
+    chapters, stats = {}, new_stats()
+    server = ThreadingHTTPServer(('127.0.0.1', args.port), make_handler(args, chapters, stats))
+    print(f'Fake chapter API on http://127.0.0.1:{args.port} (/api/chapters, /chapters/bulk, /stats)')
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,192 @@
+"""Local stand-in for the novel site that parser.py scrapes.
+
+Serves Next.js-style chapter pages (<script id="__NEXT_DATA__"> with
+props.pageProps.serie.chapter_data.data.{title, body}) at the same path
+as BASE_URL, either recorded pages from --pages (chapter-<n>.html) or
+synthetic ones. Can add latency, 503s and 429 + Retry-After.
+
+    python benchmarks/fake_novel_site.py --port 8002 --chapters 1000 --fail-rate 0.05
+    python parser.py --crawl --base-url "http://127.0.0.1:8002/en/serie-619/losing-money-to-be-a-tycoon/chapter-{}"
+    python benchmarks/fake_novel_site.py --dump pages/ --chapters 200   # save a page corpus and exit
+"""
+import argparse
+import html
+import json
+import os
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from common import WORDS_EN, make_body, make_paragraphs
+
+CHAPTER_PATH = re.compile(r'/en/serie-(\d+)/([^/]+)/chapter-(\d+)$')
+
+
+def render_page(number, chapter_id, paragraphs, rng, toc_size=300):
+    '''HTML страница главы: разметка, скрипты и тяжёлый __NEXT_DATA__, как у Next.js'''
+    title = f"Chapter {chapter_id} {' '.join(rng.choice(WORDS_EN) for _ in range(4)).title()}"
+    body = make_body(paragraphs, rng.randint(15, 30) * 1024, rng).split('\n')
+    next_data = {
+        'props': {
+            'pageProps': {
+                'serie': {
+                    'serie_data': {
+                        'id': 619,
+                        'slug': 'losing-money-to-be-a-tycoon',
+                        'data': {
+                            'title': 'Losing Money to Be a Tycoon',
+                            'description': ' '.join(rng.choice(paragraphs) for _ in range(5)),
+                        },
+                        'tags': [rng.choice(WORDS_EN) for _ in range(20)],
+                    },
+                    'chapters': [
+                        {'id': i, 'order': i, 'title': f'Chapter {i}', 'updated_at': '2024-10-01T00:00:00Z'}
+                        for i in range(max(1, number - toc_size // 2), number + toc_size // 2)
+                    ],
+                    'chapter_data': {
+                        'id': 100000 + number,
+                        'order': number,
+                        'data': {'title': title, 'body': body},
+                    },
+                },
+                'locale': 'en',
+                '_nextI18Next': {'initialI18nStore': {'en': {'common': {f'key_{i}': f'Value {i}' for i in range(200)}}}},
+            },
+            '__N_SSG': True,
+        },
+        'page': '/[locale]/serie-[raw_id]/[slug]/[chapter_slug]',
+        'query': {'locale': 'en', 'raw_id': '619', 'chapter_slug': f'chapter-{number}'},
+        'buildId': 'fake-build',
+        'isFallback': False,
+        'gsp': True,
+        'scriptLoader': [],
+    }
+    rendered = '\n'.join(f'<p class="chapter-paragraph">{html.escape(paragraph)}</p>' for paragraph in body)
+    scripts = '\n'.join(
+        f'<script src="/_next/static/chunks/{i}-{rng.getrandbits(32):08x}.js" defer=""></script>' for i in range(25)
+    )
+    return (
+        '<!DOCTYPE html><html lang="en"><head><meta charSet="utf-8"/>'
+        f'<title>{html.escape(title)} | Losing Money to Be a Tycoon</title>'
+        '<meta name="viewport" content="width=device-width, initial-scale=1"/>'
+        f'<link rel="stylesheet" href="/_next/static/css/app.css"/>{scripts}</head>'
+        '<body><div id="__next"><nav class="navbar"><a href="/">Home</a></nav>'
+        f'<main><h1 class="chapter-title">{html.escape(title)}</h1><div class="chapter-body">{rendered}</div></main>'
+        '<footer>fake site</footer></div>'
+        f'<script id="__NEXT_DATA__" type="application/json">{json.dumps(next_data)}</script>'
+        '</body></html>'
+    )
+
+
+class PageSource:
+    '''Записанные страницы из каталога или синтетические, по номеру главы'''
+    def __init__(self, pages_dir=None, chapters=1000, id_offset=0, seed=42):
+        self.pages_dir = pages_dir
+        self.chapters = chapters
+        self.id_offset = id_offset
+        self.seed = seed
+        self.paragraphs = make_paragraphs(WORDS_EN, random.Random(seed))
+        self.cache = {}
+        self.lock = threading.Lock()
+
+    def get(self, number):
+        if self.pages_dir:
+            path = os.path.join(self.pages_dir, f'chapter-{number}.html')
+            if not os.path.exists(path):
+                return None
+            with open(path, 'rb') as f:
+                return f.read()
+        if not 1 <= number <= self.chapters:
+            return None
+        with self.lock:
+            page = self.cache.get(number)
+        if page is None:
+            rng = random.Random(self.seed * 100003 + number)
+            page = render_page(number, number + self.id_offset, self.paragraphs, rng).encode('utf-8')
+            with self.lock:
+                self.cache[number] = page
+        return page
+
+
+def make_handler(args, source, stats):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *log_args):
+            if args.verbose:
+                super().log_message(format, *log_args)
+
+        def send_body(self, status, body, content_type='text/html; charset=utf-8', headers=()):
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            for name, value in dict(headers).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == '/stats':
+                self.send_body(200, json.dumps(stats).encode(), 'application/json')
+                return
+            match = CHAPTER_PATH.match(self.path)
+            with stats_lock:
+                stats['requests'] += 1
+                stats['in_flight'] += 1
+                stats['max_in_flight'] = max(stats['max_in_flight'], stats['in_flight'])
+            try:
+                time.sleep(args.latency)
+                if random.random() < args.throttle_rate:
+                    stats['throttled'] += 1
+                    self.send_body(429, b'Too Many Requests', 'text/plain', {'Retry-After': '1'})
+                elif random.random() < args.fail_rate:
+                    stats['failed'] += 1
+                    self.send_body(503, b'Service Unavailable', 'text/plain')
+                else:
+                    page = source.get(int(match.group(3))) if match else None
+                    if page is None:
+                        stats['not_found'] += 1
+                        self.send_body(404, b'<html><body>Not found</body></html>')
+                    else:
+                        stats['served'] += 1
+                        self.send_body(200, page)
+            finally:
+                with stats_lock:
+                    stats['in_flight'] -= 1
+
+    stats_lock = threading.Lock()
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8002)
+    parser.add_argument('--pages', help='Directory with recorded chapter-<n>.html pages')
+    parser.add_argument('--chapters', type=int, default=1000, help='Synthetic chapters 1..N')
+    parser.add_argument('--id-offset', type=int, default=0, help='chapter_id = chapter number + offset')
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='Share of requests answered with 503')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='Share of requests answered with 429')
+    parser.add_argument('--dump', help='Write synthetic pages into this directory and exit')
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+
+    source = PageSource(args.pages, args.chapters, args.id_offset)
+    if args.dump:
+        os.makedirs(args.dump, exist_ok=True)
+        for number in range(1, args.chapters + 1):
+            with open(os.path.join(args.dump, f'chapter-{number}.html'), 'wb') as f:
+                f.write(source.get(number))
+        print(f'Wrote {args.chapters} pages to {args.dump}')
+        return
+
+    stats = dict.fromkeys(('requests', 'served', 'not_found', 'failed', 'throttled', 'in_flight', 'max_in_flight'), 0)
+    server = ThreadingHTTPServer(('127.0.0.1', args.port), make_handler(args, source, stats))
+    print(f'Fake novel site on http://127.0.0.1:{args.port}/en/serie-619/losing-money-to-be-a-tycoon/chapter-N')
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
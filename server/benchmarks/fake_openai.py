@@ -0,0 +1,208 @@
+"""Local stand-in for the OpenAI chat completions API.
+
+Answers POST /v1/chat/completions with a fake "translation" of the last
+user message, enforces requests/tokens per minute with real-looking
+x-ratelimit-* headers and 429 + retry-after, and can inject 5xx errors.
+A message ending in a JSON array (batched titles) gets a JSON array back;
+--mangle-rate blanks one item of such answers to exercise the fallback.
+"stream": true is answered with server-sent events chunk by chunk.
+
+    python benchmarks/fake_openai.py --port 8001 --rpm 60 --tpm 20000 --latency 0.5
+    OPENAI_BASE_URL=http://127.0.0.1:8001/v1 OPENAI_API_KEY=test python translator.py
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+STREAM_PIECE = 40  # символов в одном чанке потокового ответа
+
+
+class Budget:
+    '''Sliding one-minute window of requests and tokens'''
+    def __init__(self, rpm, tpm):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.events = deque()
+        self.lock = threading.Lock()
+
+    def _trim(self, now):
+        while self.events and self.events[0][0] <= now - 60:
+            self.events.popleft()
+
+    def try_spend(self, tokens):
+        '''(allowed, headers) for a request costing tokens'''
+        with self.lock:
+            now = time.monotonic()
+            self._trim(now)
+            used_requests = len(self.events)
+            used_tokens = sum(cost for _, cost in self.events)
+            allowed = used_requests < self.rpm and used_tokens + tokens <= self.tpm
+            if allowed:
+                self.events.append((now, tokens))
+                used_requests += 1
+                used_tokens += tokens
+            reset = (self.events[0][0] + 60 - now) if self.events else 0
+            headers = {
+                'x-ratelimit-limit-requests': str(self.rpm),
+                'x-ratelimit-remaining-requests': str(max(0, self.rpm - used_requests)),
+                'x-ratelimit-reset-requests': f'{reset:.3f}s',
+                'x-ratelimit-limit-tokens': str(self.tpm),
+                'x-ratelimit-remaining-tokens': str(max(0, self.tpm - used_tokens)),
+                'x-ratelimit-reset-tokens': f'{reset:.3f}s',
+            }
+            if not allowed:
+                headers['retry-after'] = f'{max(reset, 0.1):.1f}'
+            return allowed, headers
+
+
+def estimate_tokens(text):
+    return len(text) // 4 + 1
+
+
+def fake_translation(text, mangle_rate=0.0):
+    last_line = text.rsplit('\n', 1)[-1]
+    if last_line.startswith('['):
+        try:
+            items = [f'[ru] {item}' for item in json.loads(last_line)]
+        except ValueError:
+            pass
+        else:
+            if items and random.random() < mangle_rate:
+                items[random.randrange(len(items))] = ''
+            return json.dumps(items, ensure_ascii=False)
+    # Русский текст длиннее английского примерно на 10-20%
+    return '\n'.join(f'[ru] {line}' for line in text.split('\n'))
+
+
+def make_handler(args, budget, stats):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *log_args):
+            if args.verbose:
+                super().log_message(format, *log_args)
+
+        def send_json(self, status, payload, headers=()):
+            body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            for name, value in dict(headers).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def send_stream(self, request, completion, headers):
+            '''Тот же ответ в виде chat.completion.chunk событий, с задержкой генерации между чанками'''
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Connection', 'close')
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.close_connection = True
+
+            content = completion['choices'][0]['message']['content']
+            pieces = [content[i:i + STREAM_PIECE] for i in range(0, len(content), STREAM_PIECE)]
+            delay = completion['usage']['completion_tokens'] / args.tokens_per_second / max(len(pieces), 1)
+            base = {key: completion[key] for key in ('id', 'created', 'model')}
+            base['object'] = 'chat.completion.chunk'
+
+            def event(choices, **extra):
+                payload = json.dumps({**base, 'choices': choices, **extra}, ensure_ascii=False)
+                self.wfile.write(f'data: {payload}\n\n'.encode('utf-8'))
+                self.wfile.flush()
+
+            time.sleep(args.latency)
+            event([{'index': 0, 'delta': {'role': 'assistant', 'content': ''}, 'finish_reason': None}])
+            for piece in pieces:
+                time.sleep(delay)
+                event([{'index': 0, 'delta': {'content': piece}, 'finish_reason': None}])
+            event([{'index': 0, 'delta': {}, 'finish_reason': completion['choices'][0]['finish_reason']}])
+            if (request.get('stream_options') or {}).get('include_usage'):
+                event([], usage=completion['usage'])
+            self.wfile.write(b'data: [DONE]\n\n')
+
+        def do_GET(self):
+            if self.path == '/stats':
+                self.send_json(200, stats)
+            else:
+                self.send_json(404, {'error': {'message': 'Not found'}})
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length', 0))
+            request = json.loads(self.rfile.read(length) or b'{}')
+            if not self.path.endswith('/chat/completions'):
+                self.send_json(404, {'error': {'message': 'Not found'}})
+                return
+
+            messages = request.get('messages', [])
+            prompt_tokens = sum(estimate_tokens(message.get('content', '')) for message in messages)
+            max_tokens = request.get('max_tokens') or 4096
+            allowed, headers = budget.try_spend(prompt_tokens + max_tokens)
+            stats['requests'] += 1
+            if not allowed:
+                stats['rate_limited'] += 1
+                self.send_json(429, {'error': {'message': 'Rate limit reached', 'type': 'requests',
+                                               'code': 'rate_limit_exceeded'}}, headers)
+                return
+            if random.random() < args.fail_rate:
+                stats['failed'] += 1
+                self.send_json(500, {'error': {'message': 'Injected failure', 'type': 'server_error'}}, headers)
+                return
+
+            user_text = next((m['content'] for m in reversed(messages) if m.get('role') == 'user'), '')
+            content = fake_translation(user_text, args.mangle_rate)
+            completion_tokens = min(estimate_tokens(content), max_tokens)
+            stats['completed'] += 1
+            stats['prompt_tokens'] += prompt_tokens
+            stats['completion_tokens'] += completion_tokens
+            completion = {
+                'id': f'chatcmpl-fake-{stats["requests"]}',
+                'object': 'chat.completion',
+                'created': int(time.time()),
+                'model': request.get('model', 'fake'),
+                'choices': [{
+                    'index': 0,
+                    'message': {'role': 'assistant', 'content': content},
+                    'finish_reason': 'stop' if estimate_tokens(content) <= max_tokens else 'length',
+                }],
+                'usage': {
+                    'prompt_tokens': prompt_tokens,
+                    'completion_tokens': completion_tokens,
+                    'total_tokens': prompt_tokens + completion_tokens,
+                },
+            }
+            if request.get('stream'):
+                self.send_stream(request, completion, headers)
+                return
+            time.sleep(args.latency + completion_tokens / args.tokens_per_second)
+            self.send_json(200, completion, headers)
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8001)
+    parser.add_argument('--rpm', type=int, default=500, help='Requests per minute before 429')
+    parser.add_argument('--tpm', type=int, default=30000, help='Tokens per minute before 429')
+    parser.add_argument('--latency', type=float, default=0.2, help='Fixed seconds per request')
+    parser.add_argument('--tokens-per-second', type=float, default=2000, help='Generation speed')
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='Share of requests answered with 500')
+    parser.add_argument('--mangle-rate', type=float, default=0.0, help='Share of batch answers with a blank item')
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+
+    stats = dict.fromkeys(('requests', 'completed', 'rate_limited', 'failed', 'prompt_tokens', 'completion_tokens'), 0)
+    server = ThreadingHTTPServer(('127.0.0.1', args.port), make_handler(args, Budget(args.rpm, args.tpm), stats))
+    print(f'Fake OpenAI API on http://127.0.0.1:{args.port}/v1 (stats at /stats)')
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,293 @@
+"""Reproducible load test of the Flask API on a synthetic database.
+
+Builds ranobe.db at each requested scale, then drives every endpoint
+in-process through the WSGI app and/or over HTTP against gunicorn started
+with gunicorn.conf.py. Results are written as JSON so runs can be compared.
+
+    python benchmarks/suite.py --scales 1,10 --chapters 2000 --output run.json
+    python benchmarks/suite.py --scales 1 --chapters 200 --mode http --compare run.json
+"""
+import argparse
+import datetime
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from common import SERVER_DIR, build_synthetic_db, load_app
+
+ENDPOINTS = ('RanobeList', 'RanobeView', 'ChapterItem', 'ChapterBundle', 'BookmarkList', 'ChapterList.post')
+
+
+def make_request(endpoint, novels, chapters, rng):
+    '''(method, path, json body) for one request to endpoint'''
+    ranobe_id = rng.randint(1, novels)
+    chapter_id = rng.randint(1, chapters)
+    if endpoint == 'RanobeList':
+        return 'GET', '/ranobe/', None
+    if endpoint == 'RanobeView':
+        return 'GET', f'/ranobe/{ranobe_id}', None
+    if endpoint == 'ChapterItem':
+        return 'GET', f"/chapters/{ranobe_id}/{chapter_id}?lang={rng.choice(('ru', 'en'))}", None
+    if endpoint == 'ChapterBundle':
+        # Глава и две следующие, как при перелистывании в читалке
+        return 'GET', f"/chapters/{ranobe_id}/{chapter_id}/bundle?lang={rng.choice(('ru', 'en'))}&next=2", None
+    if endpoint == 'BookmarkList':
+        return 'GET', '/bookmarks/', None
+    return 'POST', '/chapters/', {
+        'ranobe_id': ranobe_id,
+        'chapter_id': chapter_id,
+        'chapter_number_origin': chapter_id,
+        'title_ru': f'Заголовок {rng.random()}',
+        'content_ru': 'Новый перевод главы.\n' * rng.randint(500, 1000),
+    }
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def summarize(latencies, elapsed, sizes, errors):
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+        'mean_ms': round(sum(latencies) / len(latencies) * 1000, 3),
+        'throughput_rps': round(len(latencies) / elapsed, 1),
+        'response_bytes_mean': round(sum(sizes) / len(sizes)),
+    }
+
+
+def build(db_path, novels, chapters, body_kb, seed):
+    build_synthetic_db(load_app(db_path), novels=novels, chapters=chapters, body_kb=body_kb, seed=seed)
+
+
+def run_wsgi(db_path, args, novels):
+    '''In-process: Flask test client, SQL statements counted on every engine'''
+    app_module = load_app(db_path)
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+
+    statements = [0]
+
+    @event.listens_for(Engine, 'before_cursor_execute')
+    def count_statement(*args):
+        statements[0] += 1
+
+    client = app_module.app.test_client()
+    rng = random.Random(args.seed)
+    results = {}
+    for endpoint in ENDPOINTS:
+        latencies, sizes, errors = [], [], 0
+        statements[0] = 0
+        started = time.perf_counter()
+        for _ in range(args.requests):
+            method, path, body = make_request(endpoint, novels, args.chapters, rng)
+            start = time.perf_counter()
+            response = client.open(path, method=method, json=body)
+            latencies.append(time.perf_counter() - start)
+            sizes.append(len(response.data))
+            errors += response.status_code >= 400
+        result = summarize(latencies, time.perf_counter() - started, sizes, errors)
+        result['sql_queries_per_request'] = round(statements[0] / args.requests, 2)
+        # ru_maxrss в Linux - КиБ
+        result['peak_rss_kb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        results[endpoint] = result
+    return results
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def process_tree_peak_rss_kb(pid):
+    '''Sum of VmHWM over the gunicorn master and its workers (Linux /proc)'''
+    pids = [pid]
+    try:
+        with open(f'/proc/{pid}/task/{pid}/children') as f:
+            pids += [int(child) for child in f.read().split()]
+    except OSError:
+        pass
+    total = 0
+    for child in pids:
+        try:
+            with open(f'/proc/{child}/status') as f:
+                for line in f:
+                    if line.startswith('VmHWM:'):
+                        total += int(line.split()[1])
+        except OSError:
+            pass
+    return total
+
+
+def run_http(db_path, args, novels):
+    '''Over HTTP against gunicorn with the production config'''
+    import requests
+
+    port = free_port()
+    cache_dir = tempfile.mkdtemp(prefix='ranobe-bench-cache-')
+    env = {**os.environ, 'RANOBE_DATABASE_URI': f'sqlite:///{db_path}'}
+    command = [
+        sys.executable, '-m', 'gunicorn', 'app:application',
+        '--config', os.path.join(SERVER_DIR, 'gunicorn.conf.py'), '--preload',
+        # Пути логов из конфига есть только на сервере
+        '--bind', f'127.0.0.1:{port}', '--access-logfile', '/dev/null', '--error-logfile', '-',
+        '--log-level', 'warning',
+        '-e', f'RANOBE_RESPONSE_CACHE={args.response_cache}',
+        '-e', f"RANOBE_RESPONSE_CACHE_PATH={os.path.join(cache_dir, 'response_cache.db')}",
+    ]
+    server = subprocess.Popen(command, cwd=SERVER_DIR, env=env)
+    base_url = f'http://127.0.0.1:{port}'
+    try:
+        deadline = time.time() + 60
+        while True:
+            try:
+                if requests.get(f'{base_url}/ranobe/', timeout=1).ok:
+                    break
+            except requests.RequestException:
+                pass
+            if time.time() > deadline or server.poll() is not None:
+                raise RuntimeError('gunicorn did not start')
+            time.sleep(0.2)
+
+        local = threading.local()
+        results = {}
+        rng = random.Random(args.seed)
+        for endpoint in ENDPOINTS:
+            plan = [make_request(endpoint, novels, args.chapters, rng) for _ in range(args.requests)]
+
+            def send(request):
+                session = getattr(local, 'session', None)
+                if session is None:
+                    session = local.session = requests.Session()
+                method, path, body = request
+                start = time.perf_counter()
+                response = session.request(method, base_url + path, json=body)
+                return time.perf_counter() - start, len(response.content), response.status_code >= 400
+
+            started = time.perf_counter()
+            with ThreadPoolExecutor(args.concurrency) as pool:
+                outcomes = list(pool.map(send, plan))
+            result = summarize(
+                [latency for latency, _, _ in outcomes],
+                time.perf_counter() - started,
+                [size for _, size, _ in outcomes],
+                sum(error for _, _, error in outcomes),
+            )
+            result['sql_queries_per_request'] = None
+            result['peak_rss_kb'] = process_tree_peak_rss_kb(server.pid)
+            results[endpoint] = result
+        return results
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=SERVER_DIR, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(previous, current):
+    '''Print p50/p95 and throughput ratios current/previous for matching rows'''
+    old = {(r['mode'], r['novels'], r['endpoint']): r for r in previous['results']}
+    for row in current['results']:
+        before = old.get((row['mode'], row['novels'], row['endpoint']))
+        if not before:
+            continue
+        print(f"{row['mode']:5} {row['novels']:>3} {row['endpoint']:17} "
+              f"p50 {before['p50_ms']:>9} -> {row['p50_ms']:>9} ms  "
+              f"p95 {before['p95_ms']:>9} -> {row['p95_ms']:>9} ms  "
+              f"rps {before['throughput_rps']:>8} -> {row['throughput_rps']:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scales', default='1', help='Comma separated novel counts, e.g. 1,10,50')
+    parser.add_argument('--chapters', type=int, default=2000, help='Chapters per novel')
+    parser.add_argument('--body-kb', default='20-40', help='Chapter body size range in KiB')
+    parser.add_argument('--requests', type=int, default=200, help='Requests per endpoint')
+    parser.add_argument('--concurrency', type=int, default=4, help='Parallel clients in HTTP mode')
+    parser.add_argument('--mode', choices=('wsgi', 'http', 'both'), default='wsgi')
+    parser.add_argument('--response-cache', default='none', help='RANOBE_RESPONSE_CACHE for the run')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--workdir', help='Keep generated databases here instead of a temp dir')
+    parser.add_argument('--output', help='Write the JSON report here (default: stdout)')
+    parser.add_argument('--compare', help='Previous JSON report to compare against')
+    args = parser.parse_args()
+
+    os.environ['RANOBE_RESPONSE_CACHE'] = args.response_cache
+    body_kb = tuple(int(value) for value in args.body_kb.split('-'))
+    workdir = args.workdir or tempfile.mkdtemp(prefix='ranobe-bench-')
+    os.makedirs(workdir, exist_ok=True)
+    context = multiprocessing.get_context('spawn')
+
+    report = {
+        'meta': {
+            'started_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'git_revision': git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'args': vars(args),
+        },
+        'results': [],
+    }
+    modes = ('wsgi', 'http') if args.mode == 'both' else (args.mode,)
+    for novels in (int(value) for value in args.scales.split(',')):
+        db_path = os.path.join(workdir, f'ranobe-{novels}x{args.chapters}-{args.body_kb}-{args.seed}.db')
+        if not os.path.exists(db_path):
+            started = time.perf_counter()
+            # Сборка в отдельном процессе, чтобы не влиять на пиковую память замеров
+            builder = context.Process(target=build, args=(db_path, novels, args.chapters, body_kb, args.seed))
+            builder.start()
+            builder.join()
+            if builder.exitcode:
+                raise RuntimeError(f'Building {db_path} failed')
+            print(f'Built {db_path} in {time.perf_counter() - started:.1f}s', file=sys.stderr)
+
+        for mode in modes:
+            runner = run_wsgi if mode == 'wsgi' else run_http
+            with context.Pool(1) as pool:
+                results = pool.apply(runner, (db_path, args, novels))
+            for endpoint, result in results.items():
+                report['results'].append({
+                    'mode': mode,
+                    'novels': novels,
+                    'chapters_per_novel': args.chapters,
+                    'db_bytes': os.path.getsize(db_path),
+                    'endpoint': endpoint,
+                    **result,
+                })
+
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output)
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            compare(json.load(f), report)
+
+
+if __name__ == '__main__':
+    main()
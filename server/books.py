@@ -0,0 +1,341 @@
+"""Выгрузка диапазона глав ранобэ в EPUB или ZIP для чтения офлайн.
+
+Главы читаются из базы пачками и сразу пишутся в архив; архив отдаётся
+клиенту по мере готовности записей, так что в памяти одновременно только
+одна пачка глав и одна запись архива. zipfile пишет в ArchiveBuffer:
+возврат назад (для заголовка записи) разрешён только внутри ещё не
+отданной записи, поэтому архив получается обычным, без data descriptor,
+и mimetype в EPUB остаётся первой несжатой записью, как требует OCF.
+
+Готовые файлы кладутся в BookCache (каталог на диске, общий для воркеров)
+под ключом с версией ранобэ: любая запись в ранобэ или её главы меняет
+версию, и повторная выгрузка той же версии отдаётся файлом без сборки.
+"""
+import json
+import os
+import re
+import threading
+import zipfile
+from datetime import datetime
+from html import escape
+
+from sqlalchemy import func, select
+
+from models import Chapter, Ranobe
+
+FORMATS = {'epub': 'application/epub+zip', 'zip': 'application/zip'}
+BATCH_SIZE = 50  # глав на запрос к базе
+COUNTERS = ('hits', 'misses', 'stores', 'evictions', 'invalidations')
+
+# Символы, которых не может быть в XML 1.0
+XML_INVALID = re.compile(r'[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]')
+
+
+class ArchiveBuffer:
+    '''Write-only file for zipfile that hands out finished bytes with take()'''
+
+    def __init__(self):
+        self._data = bytearray()
+        self._base = 0  # абсолютное смещение начала _data, всё до него уже отдано
+        self._position = 0
+
+    def write(self, data):
+        start = self._position - self._base
+        self._data[start:start + len(data)] = data
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self._position
+        elif whence == os.SEEK_END:
+            offset += self._base + len(self._data)
+        if offset < self._base:
+            raise OSError('Cannot seek into bytes already sent')
+        self._position = offset
+        return offset
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = bytes(self._data)
+        self._base += len(self._data)
+        self._data.clear()
+        return data
+
+
+def iter_book_chapters(session, ranobe_id, lang, start=None, end=None, batch_size=BATCH_SIZE):
+    '''Chapters with content in lang, in chapter_number_origin order, fetched batch_size at a time'''
+    number = Chapter.chapter_number_origin
+    content = getattr(Chapter, f'content_{lang}')
+    query = select(Chapter.chapter_id, number, Chapter.title_ru, Chapter.title_en, content.label('content'))\
+        .where(*book_filter(ranobe_id, lang, start, end)).order_by(number).limit(batch_size)
+    last = None
+    while True:
+        # Строки, а не объекты модели: identity map сессии не растёт вместе с книгой
+        rows = session.execute(query if last is None else query.where(number > last)).all()
+        yield from rows
+        if len(rows) < batch_size:
+            return
+        last = rows[-1].chapter_number_origin
+
+
+def load_book(session, ranobe_id, lang, start=None, end=None):
+    '''Book description for stream_book and BookCache.key, or None when the ranobe does not exist'''
+    row = session.execute(
+        select(Ranobe.id, Ranobe.title, Ranobe.version, Ranobe.updated_at).where(Ranobe.id == ranobe_id)
+    ).first()
+    return None if row is None else {**row._asdict(), 'lang': lang, 'range': book_range(start, end)}
+
+
+def count_book_chapters(session, ranobe_id, lang, start=None, end=None):
+    return session.scalar(select(func.count(Chapter.id)).where(*book_filter(ranobe_id, lang, start, end)))
+
+
+def book_filter(ranobe_id, lang, start, end):
+    number = Chapter.chapter_number_origin
+    conditions = [Chapter.ranobe_id == ranobe_id, getattr(Chapter, f'content_{lang}').is_not(None)]
+    if start is not None:
+        conditions.append(number >= start)
+    if end is not None:
+        conditions.append(number <= end)
+    return conditions
+
+
+def book_range(start=None, end=None):
+    '''Part of the cache key and the EPUB identifier for a chapter range'''
+    return f"{'first' if start is None else start}-{'last' if end is None else end}"
+
+
+def chapter_title(row, lang):
+    titles = (row.title_ru, row.title_en) if lang == 'ru' else (row.title_en, row.title_ru)
+    return next((title for title in titles if title), None) or f'Chapter {row.chapter_number_origin}'
+
+
+def stream_book(fmt, book, chapters):
+    '''Archive bytes in pieces, one piece per finished entry; book comes from load_book'''
+    write = write_epub if fmt == 'epub' else write_zip
+    buffer = ArchiveBuffer()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for _ in write(archive, book, chapters):
+            data = buffer.take()
+            if data:
+                yield data
+    yield buffer.take()
+
+
+def entry(name, book, compress_type=zipfile.ZIP_DEFLATED):
+    # Время записей - время изменения ранобэ: одна версия даёт одинаковый архив
+    updated_at = book['updated_at'] or datetime(1980, 1, 1)
+    info = zipfile.ZipInfo(name, date_time=updated_at.timetuple()[:6])
+    info.compress_type = compress_type
+    return info
+
+
+def write_zip(archive, book, chapters):
+    '''Plain-text chapters, NNNNN.txt with the title on the first line, and book.json with the table of contents'''
+    toc = []
+    for row in chapters:
+        name = f'{row.chapter_number_origin:05d}.txt'
+        title = chapter_title(row, book['lang'])
+        archive.writestr(entry(name, book), f'{title}\n\n{row.content}\n')
+        toc.append({'file': name, 'chapter_id': row.chapter_id,
+                    'chapter_number_origin': row.chapter_number_origin, 'title': title})
+        yield
+    manifest = {key: book[key] for key in ('id', 'title', 'lang', 'version')}
+    archive.writestr(entry('book.json', book), json.dumps({**manifest, 'chapters': toc}, ensure_ascii=False, indent=2))
+    yield
+
+
+CONTAINER_XML = '''<?xml version="1.0" encoding="utf-8"?>
+<container version="1.0" xmlns="urn:oasis:names:tc:opendocument:xmlns:container">
+  <rootfiles>
+    <rootfile full-path="OEBPS/content.opf" media-type="application/oebps-package+xml"/>
+  </rootfiles>
+</container>
+'''
+
+CHAPTER_XHTML = '''<?xml version="1.0" encoding="utf-8"?>
+<!DOCTYPE html>
+<html xmlns="http://www.w3.org/1999/xhtml" xml:lang="{lang}" lang="{lang}">
+<head><title>{title}</title></head>
+<body>
+<h1>{title}</h1>
+{paragraphs}
+</body>
+</html>
+'''
+
+NAV_XHTML = '''<?xml version="1.0" encoding="utf-8"?>
+<!DOCTYPE html>
+<html xmlns="http://www.w3.org/1999/xhtml" xmlns:epub="http://www.idpf.org/2007/ops" xml:lang="{lang}" lang="{lang}">
+<head><title>{title}</title></head>
+<body>
+<nav epub:type="toc" id="toc">
+<h1>{title}</h1>
+<ol>
+{items}
+</ol>
+</nav>
+</body>
+</html>
+'''
+
+CONTENT_OPF = '''<?xml version="1.0" encoding="utf-8"?>
+<package xmlns="http://www.idpf.org/2007/opf" version="3.0" unique-identifier="book-id" xml:lang="{lang}">
+  <metadata xmlns:dc="http://purl.org/dc/elements/1.1/">
+    <dc:identifier id="book-id">{identifier}</dc:identifier>
+    <dc:title>{title}</dc:title>
+    <dc:language>{lang}</dc:language>
+    <meta property="dcterms:modified">{modified}</meta>
+  </metadata>
+  <manifest>
+    <item id="nav" href="nav.xhtml" media-type="application/xhtml+xml" properties="nav"/>
+{manifest}
+  </manifest>
+  <spine>
+{spine}
+  </spine>
+</package>
+'''
+
+
+def xml_text(value):
+    return escape(XML_INVALID.sub('', value), quote=True)
+
+
+def write_epub(archive, book, chapters):
+    '''EPUB 3: mimetype, container, one XHTML file per chapter, then the navigation document and the package'''
+    lang = book['lang']
+    archive.writestr(entry('mimetype', book, zipfile.ZIP_STORED), FORMATS['epub'])
+    archive.writestr(entry('META-INF/container.xml', book), CONTAINER_XML)
+    yield
+
+    items = []
+    for row in chapters:
+        name = f'chapter-{row.chapter_number_origin:05d}.xhtml'
+        title = xml_text(chapter_title(row, lang))
+        paragraphs = '\n'.join(f'<p>{xml_text(p)}</p>' for p in row.content.split('\n') if p.strip())
+        archive.writestr(entry(f'OEBPS/{name}', book),
+                         CHAPTER_XHTML.format(lang=lang, title=title, paragraphs=paragraphs))
+        items.append((f'c{row.chapter_number_origin}', name, title))
+        yield
+
+    title = xml_text(book['title'])
+    archive.writestr(entry('OEBPS/nav.xhtml', book), NAV_XHTML.format(
+        lang=lang, title=title,
+        items='\n'.join(f'<li><a href="{name}">{chapter}</a></li>' for _, name, chapter in items)
+    ))
+    modified = (book['updated_at'] or datetime.utcnow()).strftime('%Y-%m-%dT%H:%M:%SZ')
+    archive.writestr(entry('OEBPS/content.opf', book), CONTENT_OPF.format(
+        lang=lang, title=title, modified=modified,
+        identifier=xml_text(f"urn:ranobe:{book['id']}:{lang}:{book['range']}"),
+        manifest='\n'.join(f'    <item id="{item_id}" href="{name}" media-type="application/xhtml+xml"/>'
+                           for item_id, name, _ in items),
+        spine='\n'.join(f'    <itemref idref="{item_id}"/>' for item_id, _, _ in items),
+    ))
+    yield
+
+
+class BookCache:
+    '''Generated archives on disk, shared by all workers; evicts the least recently served past max_bytes.
+
+    Counters are per process, entries and bytes are read from the directory.
+    '''
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._counters = dict.fromkeys(COUNTERS, 0)
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(book, fmt):
+        return f"{book['id']}-v{book['version']}-{book['lang']}-{book['range']}.{fmt}"
+
+    def _count(self, counter, amount=1):
+        with self._lock:
+            self._counters[counter] += amount
+
+    def open(self, key):
+        '''Open cached archive, or None; an open file survives eviction by another worker'''
+        path = os.path.join(self.directory, key)
+        try:
+            f = open(path, 'rb')
+            # mtime - время последней выдачи, по нему вытесняются старые
+            os.utime(path)
+        except FileNotFoundError:
+            self._count('misses')
+            return None
+        self._count('hits')
+        return f
+
+    def store(self, key, chunks):
+        '''Pass chunks through while writing them to the cache; the file appears only when the archive is complete'''
+        if self.max_bytes <= 0:
+            yield from chunks
+            return
+        path = os.path.join(self.directory, key)
+        temporary = f'{path}.{os.getpid()}-{threading.get_ident()}.tmp'
+        complete = False
+        try:
+            with open(temporary, 'wb') as f:
+                for chunk in chunks:
+                    f.write(chunk)
+                    yield chunk
+            os.replace(temporary, path)
+            complete = True
+        finally:
+            # Клиент оборвал загрузку или сборка упала: недописанный файл не нужен
+            if not complete and os.path.exists(temporary):
+                os.remove(temporary)
+        self._count('stores')
+        self._prune(key)
+
+    def _entries(self):
+        entries = []
+        with os.scandir(self.directory) as scan:
+            for item in scan:
+                if item.is_file() and not item.name.endswith('.tmp'):
+                    stat = item.stat()
+                    entries.append((stat.st_mtime, stat.st_size, item.name))
+        return entries
+
+    def _prune(self, key):
+        entries = self._entries()
+        # Прежние версии этой ранобэ больше никогда не запросят
+        ranobe, version = key.split('-', 2)[:2]
+        for _, _, name in entries:
+            if name.startswith(f'{ranobe}-v') and name.split('-', 2)[1] != version:
+                self._remove(name, 'invalidations')
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in entries:
+            if total <= self.max_bytes:
+                break
+            self._remove(name, 'evictions')
+            total -= size
+
+    def _remove(self, name, counter):
+        try:
+            os.remove(os.path.join(self.directory, name))
+        except FileNotFoundError:
+            # Уже удалил другой воркер
+            return
+        self._count(counter)
+
+    def stats(self):
+        entries = self._entries()
+        with self._lock:
+            return {
+                'directory': self.directory,
+                'entries': len(entries),
+                'bytes': sum(size for _, size, _ in entries),
+                'max_bytes': self.max_bytes,
+                **self._counters,
+            }
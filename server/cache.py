@@ -0,0 +1,242 @@
+"""Кеш ответов API с инвалидацией при записи.
+
+Бэкенды:
+    LRUCache    - в памяти процесса, у каждого воркера gunicorn свой
+    SQLiteCache - общий файл для всех воркеров на одной машине
+
+Оба ограничены размером в байтах и считают попадания/промахи.
+
+Запись хранится вместе с версией данных, прочитанной в том же снимке базы,
+что и сами данные; get с другой версией - промах. Так ответ, собранный из
+старого снимка и записанный уже после инвалидации, не отдаётся как новый.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+COUNTERS = ('hits', 'misses', 'stores', 'evictions', 'invalidations')
+
+# Ключи кешированных ответов, общие для app.py и ingest.py
+RANOBE_LIST_CACHE_KEY = 'ranobe:list'
+
+
+def ranobe_cache_key(id):
+    return f'ranobe:{id}'
+
+
+class NullCache:
+    name = 'none'
+
+    def get(self, key, version=''):
+        return None
+
+    def set(self, key, value, version=''):
+        pass
+
+    def delete(self, *keys):
+        pass
+
+    def clear(self):
+        pass
+
+    def stats(self):
+        return {'backend': self.name}
+
+
+class LRUCache:
+    name = 'lru'
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._counters = dict.fromkeys(COUNTERS, 0)
+        self._lock = threading.Lock()
+
+    def get(self, key, version=''):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                self._counters['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._counters['hits'] += 1
+            return entry[1]
+
+    def set(self, key, value, version=''):
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old[1])
+            self._entries[key] = (version, value)
+            self._bytes += len(value)
+            self._counters['stores'] += 1
+            while self._bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+                self._counters['evictions'] += 1
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                entry = self._entries.pop(key, None)
+                if entry is not None:
+                    self._bytes -= len(entry[1])
+                    self._counters['invalidations'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'backend': self.name,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                **self._counters,
+            }
+
+
+class SQLiteCache:
+    '''Cache shared by processes through a local SQLite file.
+
+    Counters live in the same file, so stats() covers all workers.
+    '''
+    name = 'sqlite'
+
+    def __init__(self, path, max_bytes):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache_entry ("
+                "key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, accessed REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_cache_entry_accessed ON cache_entry (accessed)")
+            conn.execute("CREATE TABLE IF NOT EXISTS cache_counter (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            conn.executemany("INSERT OR IGNORE INTO cache_counter VALUES (?, 0)", [(name,) for name in COUNTERS])
+
+    def _connect(self):
+        # Соединения не переживают fork воркера gunicorn
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            # Это кеш: потеря последних записей при сбое допустима
+            conn.execute("PRAGMA synchronous=OFF")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _count(self, conn, name, n=1):
+        conn.execute("UPDATE cache_counter SET value = value + ? WHERE name = ?", (n, name))
+
+    def get(self, key, version=''):
+        conn = self._connect()
+        with conn:
+            row = conn.execute("SELECT value FROM cache_entry WHERE key = ?", (key,)).fetchone()
+            # Версия хранится перед значением до первого перевода строки
+            stored, _, value = row[0].partition(b'\n') if row is not None else (None, None, None)
+            if row is None or stored != version.encode('utf-8'):
+                self._count(conn, 'misses')
+                return None
+            conn.execute("UPDATE cache_entry SET accessed = ? WHERE key = ?", (time.time(), key))
+            self._count(conn, 'hits')
+            return value
+
+    def set(self, key, value, version=''):
+        if len(value) > self.max_bytes:
+            return
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO cache_entry VALUES (?, ?, ?, ?)",
+                (key, version.encode('utf-8') + b'\n' + value, len(value), time.time())
+            )
+            self._count(conn, 'stores')
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM cache_entry").fetchone()[0]
+            evicted = 0
+            while total > self.max_bytes:
+                key, size = conn.execute(
+                    "SELECT key, size FROM cache_entry ORDER BY accessed LIMIT 1"
+                ).fetchone()
+                conn.execute("DELETE FROM cache_entry WHERE key = ?", (key,))
+                total -= size
+                evicted += 1
+            if evicted:
+                self._count(conn, 'evictions', evicted)
+
+    def delete(self, *keys):
+        conn = self._connect()
+        with conn:
+            deleted = 0
+            for key in keys:
+                deleted += conn.execute("DELETE FROM cache_entry WHERE key = ?", (key,)).rowcount
+            if deleted:
+                self._count(conn, 'invalidations', deleted)
+
+    def clear(self):
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM cache_entry")
+
+    def stats(self):
+        conn = self._connect()
+        entries, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache_entry").fetchone()
+        return {
+            'backend': self.name,
+            'entries': entries,
+            'bytes': size,
+            'max_bytes': self.max_bytes,
+            **dict(conn.execute("SELECT name, value FROM cache_counter").fetchall()),
+        }
+
+
+def create_cache(backend, max_bytes, path=None):
+    if backend == 'lru':
+        return LRUCache(max_bytes)
+    if backend == 'sqlite':
+        return SQLiteCache(path, max_bytes)
+    if backend == 'none':
+        return NullCache()
+    raise ValueError(f'Unknown response cache backend: {backend}')
+
+
+def cached(get_cache, key_func):
+    '''Cache successful view results as JSON.
+
+    Goes below conditional() and above marshal_with(), so hits skip
+    both the database queries and marshalling. get_cache() returns the
+    cache of the current app, looked up on every call. key_func returns
+    (key, version), reading the version in the same transaction as the
+    view, or None to bypass the cache.
+    '''
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            versioned = key_func(**kwargs)
+            if versioned is None:
+                return func(*args, **kwargs)
+            key, version = versioned
+            cache = get_cache()
+            value = cache.get(key, version)
+            if value is not None:
+                return json.loads(value)
+
+            result = func(*args, **kwargs)
+            data, code = (result[0], result[1]) if isinstance(result, tuple) else (result, 200)
+            if code == 200:
+                cache.set(key, json.dumps(data, ensure_ascii=False).encode('utf-8'), version)
+            return result
+        return wrapper
+    return decorator
@@ -0,0 +1,107 @@
+"""Нарезка главы на части для перевода по абзацам.
+
+Абзацы (строки, разделённые \\n, как их сохраняет parser.py) упаковываются
+целиком, пока часть укладывается и во входной бюджет, и в max_tokens ответа
+с учётом того, что русский перевод длиннее английского оригинала. Абзац,
+который сам не помещается, режется по предложениям, предложение - по словам
+(в переводе такой абзац станет несколькими).
+После перевода части склеиваются обратно через \\n.
+
+Счётчик токенов подключаемый: get_token_counter("tiktoken") использует
+настоящий токенизатор модели, если пакет tiktoken установлен.
+"""
+import re
+
+# Во сколько раз ответ на русском длиннее английского исходника в токенах
+OUTPUT_RATIO = 1.3
+# Запас на разброс оценки и оформление ответа
+SAFETY_MARGIN = 0.9
+
+SENTENCE_END = re.compile(r'(?<=[.!?…"»])\s+')
+
+
+def heuristic_token_count(text):
+    '''Оценка без токенизатора: ~4 символа на токен, знаки препинания отдельно'''
+    return len(text) // 4 + len(re.findall(r'[^\w\s]', text)) // 2 + 1
+
+
+def get_token_counter(name='heuristic', model='gpt-4o'):
+    '''Функция text -> количество токенов'''
+    if name == 'heuristic':
+        return heuristic_token_count
+    if name == 'tiktoken':
+        try:
+            import tiktoken
+        except ImportError:
+            raise RuntimeError("tiktoken is not installed: pip install tiktoken")
+        encoding = tiktoken.encoding_for_model(model)
+        return lambda text: len(encoding.encode(text, disallowed_special=()))
+    raise ValueError(f"Unknown token counter: {name}")
+
+
+def input_budget(max_output_tokens, output_ratio=OUTPUT_RATIO, max_input_tokens=None):
+    '''Сколько входных токенов можно отправить, чтобы перевод поместился в max_output_tokens'''
+    budget = int(max_output_tokens * SAFETY_MARGIN / output_ratio)
+    return min(budget, max_input_tokens) if max_input_tokens else budget
+
+
+def split_paragraphs(content):
+    return [paragraph.strip() for paragraph in content.split('\n') if paragraph.strip()]
+
+
+def _split_oversized(paragraph, budget, count_tokens):
+    '''Абзац больше бюджета: сначала по предложениям, затем по словам'''
+    pieces = SENTENCE_END.split(paragraph)
+    if len(pieces) == 1:
+        pieces = paragraph.split()
+    parts = []
+    current = []
+    for piece in pieces:
+        candidate = ' '.join(current + [piece])
+        if current and count_tokens(candidate) > budget:
+            parts.append(' '.join(current))
+            current = [piece]
+        else:
+            current.append(piece)
+    if current:
+        parts.append(' '.join(current))
+    result = []
+    for part in parts:
+        if count_tokens(part) > budget and len(part.split()) > 1 and part != paragraph:
+            result.extend(_split_oversized(part, budget, count_tokens))
+        else:
+            result.append(part)
+    return result
+
+
+def chunk_content(content, max_output_tokens, count_tokens=heuristic_token_count,
+                  output_ratio=OUTPUT_RATIO, max_input_tokens=None):
+    '''Части главы из целых абзацев, каждая не больше input_budget токенов'''
+    budget = input_budget(max_output_tokens, output_ratio, max_input_tokens)
+    chunks = []
+    current = []
+    current_tokens = 0
+
+    for paragraph in split_paragraphs(content):
+        tokens = count_tokens(paragraph)
+        if tokens > budget:
+            if current:
+                chunks.append('\n'.join(current))
+                current, current_tokens = [], 0
+            chunks.extend(_split_oversized(paragraph, budget, count_tokens))
+            continue
+        # +1 за перевод строки между абзацами
+        if current and current_tokens + tokens + 1 > budget:
+            chunks.append('\n'.join(current))
+            current, current_tokens = [], 0
+        current.append(paragraph)
+        current_tokens += tokens + 1
+
+    if current:
+        chunks.append('\n'.join(current))
+    return chunks
+
+
+def join_chunks(chunks):
+    '''Обратная сборка: части кончаются на границе абзаца'''
+    return '\n'.join(chunk.strip('\n') for chunk in chunks)
@@ -0,0 +1,188 @@
+"""Сжатое хранение текстов глав (zstd со словарём, обученным на главах).
+
+Колонки content_* объявлены как CompressedText: при записи строка сжимается
+активным словарём своего языка, при чтении кадр zstd распаковывается словарём,
+id которого записан в заголовке кадра. Старые несжатые строки читаются как есть,
+поэтому базу можно конвертировать постепенно.
+"""
+import threading
+import time
+
+import zstandard
+from sqlalchemy.types import Text, TypeDecorator
+
+COMPRESSION_LEVEL = 9
+DICT_SIZE = 112 * 1024
+TRAIN_SAMPLES = 2000
+# Меньше глав - словарь не обучить (zstd падает или учит шум); больше байт zstd уже не помогают
+MIN_TRAIN_SAMPLES = 20
+TRAIN_MAX_BYTES = 32 * 1024 * 1024
+
+
+class ChapterCodec:
+    def __init__(self, level=COMPRESSION_LEVEL):
+        self.level = level
+        # fetch() -> [(dict_id, lang, data)] в порядке создания; задаётся приложением
+        self.fetch = None
+        self._dictionaries = {}
+        self._active = {}
+        self._loaded = False
+        self._lock = threading.Lock()
+        # Объекты zstandard не потокобезопасны
+        self._local = threading.local()
+
+    def load(self, rows=None):
+        '''Register dictionaries; the last one of each language becomes active'''
+        if rows is None:
+            rows = self.fetch() if self.fetch else []
+        with self._lock:
+            for dict_id, lang, data in rows:
+                self._dictionaries[dict_id] = zstandard.ZstdCompressionDict(data)
+                self._active[lang] = dict_id
+            self._loaded = True
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            self.load()
+
+    def active_dictionary(self, lang):
+        self._ensure_loaded()
+        return self._active.get(lang)
+
+    def _compressor(self, dict_id):
+        compressors = self._local.__dict__.setdefault('compressors', {})
+        if dict_id not in compressors:
+            dictionary = self._dictionaries.get(dict_id)
+            compressors[dict_id] = zstandard.ZstdCompressor(level=self.level, dict_data=dictionary)
+        return compressors[dict_id]
+
+    def _decompressor(self, dict_id):
+        decompressors = self._local.__dict__.setdefault('decompressors', {})
+        if dict_id not in decompressors:
+            if dict_id and dict_id not in self._dictionaries:
+                # Словарь обучен другим процессом после нашего старта
+                self.load()
+            dictionary = self._dictionaries.get(dict_id) if dict_id else None
+            if dict_id and dictionary is None:
+                raise LookupError(f'Unknown compression dictionary {dict_id}')
+            decompressors[dict_id] = zstandard.ZstdDecompressor(dict_data=dictionary)
+        return decompressors[dict_id]
+
+    def compress(self, text, lang):
+        '''zstd frame for text, or text itself when compression does not pay off'''
+        if not text:
+            return text
+        raw = text.encode('utf-8')
+        compressed = self._compressor(self.active_dictionary(lang)).compress(raw)
+        return compressed if len(compressed) < len(raw) else text
+
+    def decompress(self, value):
+        if not isinstance(value, bytes):
+            return value
+        return self.decompress_bytes(value).decode('utf-8')
+
+    def decompress_bytes(self, value, size=None):
+        '''UTF-8 text of a stored value without decoding it, for slicing by byte offsets.
+
+        With size only the first size bytes are decompressed and returned.
+        '''
+        if value is None:
+            return None
+        if not isinstance(value, bytes):
+            return value.encode('utf-8')[:size]
+        self._ensure_loaded()
+        dict_id = zstandard.get_frame_parameters(value).dict_id
+        if size is None:
+            return self._decompressor(dict_id).decompress(value)
+        chunks = []
+        with self._decompressor(dict_id).stream_reader(value) as reader:
+            while size > 0:
+                chunk = reader.read(size)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+                size -= len(chunk)
+        return b''.join(chunks)
+
+    def is_current(self, value, lang):
+        '''True when value is already compressed with the active dictionary'''
+        if not isinstance(value, bytes):
+            return False
+        return zstandard.get_frame_parameters(value).dict_id == (self.active_dictionary(lang) or 0)
+
+
+codec = ChapterCodec()
+
+
+class CompressedText(TypeDecorator):
+    '''Text column stored as a zstd frame; lang selects the dictionary'''
+    impl = Text
+    cache_ok = True
+
+    def __init__(self, lang, *args, **kwargs):
+        self.lang = lang
+        super().__init__(*args, **kwargs)
+
+    def process_bind_param(self, value, dialect):
+        return codec.compress(value, self.lang)
+
+    def process_result_value(self, value, dialect):
+        return codec.decompress(value)
+
+
+def train_dictionary(texts, dict_size=DICT_SIZE, samples=TRAIN_SAMPLES, level=COMPRESSION_LEVEL,
+                     max_bytes=TRAIN_MAX_BYTES, min_samples=MIN_TRAIN_SAMPLES):
+    '''Train a zstd dictionary on the first samples chapter bodies of an iterable, up to max_bytes.
+
+    The caller picks the sample (random order); the iterable is read lazily
+    and only as far as needed. Raises ValueError when there is too little
+    text to train on.
+    '''
+    chunks = []
+    used = total = 0
+    for text in texts:
+        if not text:
+            continue
+        # Главы длинные, а zstd учится на кусках: режем по абзацам
+        for paragraph in text.split('\n'):
+            if paragraph:
+                chunks.append(paragraph.encode('utf-8'))
+                total += len(chunks[-1])
+        used += 1
+        if used >= samples or total >= max_bytes:
+            break
+    if used < min_samples:
+        raise ValueError(f'{used} chapters with text, at least {min_samples} are needed')
+    try:
+        return zstandard.train_dictionary(dict_size, chunks, level=level)
+    except zstandard.ZstdError as e:
+        raise ValueError(f'{used} chapters ({total} bytes) are not enough: {e}')
+
+
+def measure(texts, lang, codec=codec, repeat=3):
+    '''Size and decode latency of texts stored raw vs with the codec'''
+    raw_bytes = stored_bytes = 0
+    encoded = []
+    for text in texts:
+        raw_bytes += len(text.encode('utf-8'))
+        value = codec.compress(text, lang)
+        stored_bytes += len(value) if isinstance(value, bytes) else len(value.encode('utf-8'))
+        encoded.append(value)
+
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for value in encoded:
+            codec.decompress(value)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    return {
+        'lang': lang,
+        'chapters': len(texts),
+        'dictionary_id': codec.active_dictionary(lang),
+        'raw_bytes': raw_bytes,
+        'stored_bytes': stored_bytes,
+        'ratio': round(raw_bytes / stored_bytes, 2) if stored_bytes else None,
+        'decode_us_per_chapter': round(best / len(encoded) * 1e6, 1) if encoded else None,
+    }
@@ -1,39 +1,177 @@
+"""Потоковая выгрузка ranobe.db в JSON или NDJSON.
+
+Строки читаются пачками (fetchmany) и сразу пишутся в файл, поэтому
+память не растёт с размером базы. Тексты глав выгружаются распакованными.
+
+    python dbtojson.py instance/ranobe.db output.json
+    python dbtojson.py instance/ranobe.db chapters.ndjson.zst --format ndjson --table chapter --ranobe 1
+    python dbtojson.py instance/ranobe.db delta.ndjson.gz --format ndjson --since-last
+
+json   - {"таблица": [строки, ...], ...}, как раньше;
+ndjson - по строке на запись: {"table": "chapter", "row": {...}}.
+Сжатие выбирается по расширению (.gz, .zst) или --compress.
+
+Инкрементальная выгрузка берёт строки с updated_at не раньше момента
+начала прошлой выгрузки (он хранится в <output>.state.json или в --state).
+Таблицы без updated_at в неё не попадают, удаления не отслеживаются.
+"""
+import argparse
+import gzip
+import io
 import json
+import os
 import sqlite3
+import sys
+
+import zstandard
+
+from compression import ChapterCodec
+from search import FTS_TABLE
+
+BATCH_SIZE = 500  # строк на fetchmany
+SKIP_TABLES = ('compression_dictionary',)
+# Производные колонки: пересчитываются при записи глав, в выгрузке не нужны
+SKIP_COLUMNS = {'chapter': ('paragraphs_ru', 'paragraphs_en')}
+
+
+def open_output(path, compress=None):
+    '''Text stream for path ('-' is stdout), gzip/zstd by extension or by compress'''
+    if compress is None:
+        compress = 'gzip' if path.endswith('.gz') else 'zstd' if path.endswith('.zst') else 'none'
+    if compress == 'gzip':
+        raw = gzip.GzipFile(fileobj=sys.stdout.buffer, mode='wb') if path == '-' else gzip.open(path, 'wb')
+        return io.TextIOWrapper(raw, encoding='utf-8')
+    raw = sys.stdout.buffer if path == '-' else open(path, 'wb')
+    if compress == 'zstd':
+        raw = zstandard.ZstdCompressor(level=3).stream_writer(raw, closefd=path != '-')
+    return io.TextIOWrapper(raw, encoding='utf-8')
 
-def db_to_json(db_path, output_json):
-    # Подключаемся к базе данных
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
 
-    # Получаем все таблицы из базы данных
-    cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-    tables = cursor.fetchall()
+def list_tables(cursor, tables=None):
+    names = [
+        name for (name,) in cursor.execute("SELECT name FROM sqlite_master WHERE type='table' ORDER BY rowid")
+        # Служебные таблицы SQLite и поисковый индекс FTS5 (его можно перестроить из глав)
+        if not name.startswith(('sqlite_', FTS_TABLE)) and name not in SKIP_TABLES
+    ]
+    if tables:
+        unknown = set(tables) - set(names)
+        if unknown:
+            raise ValueError(f"Unknown tables: {', '.join(sorted(unknown))}")
+        names = [name for name in names if name in tables]
+    return names
 
-    db_data = {}
 
-    # Проходим по каждой таблице
-    for table_name in tables:
-        table_name = table_name[0]
-        cursor.execute(f"SELECT * FROM {table_name}")
-        columns = [description[0] for description in cursor.description]
-        rows = cursor.fetchall()
+def table_query(cursor, table, ranobe_ids=None, since=None):
+    '''SELECT for one table with the filters, or None when the table cannot be filtered that way'''
+    columns = [row[1] for row in cursor.execute(f'PRAGMA table_info("{table}")')]
+    conditions, params = [], []
+    if ranobe_ids:
+        key = 'id' if table == 'ranobe' else 'ranobe_id' if 'ranobe_id' in columns else None
+        if key is None:
+            return None
+        conditions.append(f"{key} IN ({', '.join('?' * len(ranobe_ids))})")
+        params.extend(ranobe_ids)
+    if since is not None:
+        if 'updated_at' not in columns:
+            return None
+        # >=: updated_at хранится с точностью до секунды, повтор строки безопаснее пропуска
+        conditions.append("updated_at >= ?")
+        params.append(since)
+    where = f" WHERE {' AND '.join(conditions)}" if conditions else ''
+    order = ' ORDER BY rowid' if 'id' in columns else ''
+    selected = ', '.join(f'"{column}"' for column in columns if column not in SKIP_COLUMNS.get(table, ()))
+    return f'SELECT {selected} FROM "{table}"{where}{order}', params
 
-        table_data = []
+
+def iter_rows(conn, query, params, codec, batch_size=BATCH_SIZE):
+    cursor = conn.execute(query, params)
+    columns = [description[0] for description in cursor.description]
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            break
         for row in rows:
-            table_data.append(dict(zip(columns, row)))
+            yield dict(zip(columns, map(codec.decompress, row)))
+
+
+def load_state(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
 
-        db_data[table_name] = table_data
+def db_to_json(db_path, output, fmt='json', compress=None, tables=None, ranobe_ids=None, since=None,
+               batch_size=BATCH_SIZE, state_path=None):
+    '''Stream the database into output; returns {table: rows written}'''
+    # Только чтение: выгрузку можно запускать рядом с работающим сервером
+    conn = sqlite3.connect(f'file:{os.path.abspath(db_path)}?mode=ro', uri=True, isolation_level=None)
+    # Все таблицы из одного снимка базы (WAL), даже если параллельно идёт запись
+    conn.execute('BEGIN')
+    started_at = conn.execute('SELECT CURRENT_TIMESTAMP').fetchone()[0]
 
-    # Записываем всё в JSON файл
-    with open(output_json, 'w', encoding='utf-8') as json_file:
-        json.dump(db_data, json_file, ensure_ascii=False, indent=4)
+    # Тексты глав хранятся сжатыми, в JSON выгружаем их распакованными
+    codec = ChapterCodec()
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'compression_dictionary'").fetchone():
+        codec.load(conn.execute("SELECT id, lang, data FROM compression_dictionary ORDER BY created_at, id"))
 
-    # Закрываем соединение
+    counts = {}
+    with open_output(output, compress) as out:
+        if fmt == 'json':
+            out.write('{')
+        for table in list_tables(conn.cursor(), tables):
+            query = table_query(conn.cursor(), table, ranobe_ids, since)
+            if query is None:
+                continue
+            if fmt == 'json':
+                out.write(f"{',' if counts else ''}\n{json.dumps(table)}: [")
+            count = 0
+            for row in iter_rows(conn, *query, codec, batch_size):
+                if fmt == 'json':
+                    out.write(f"{',' if count else ''}\n{json.dumps(row, ensure_ascii=False)}")
+                else:
+                    out.write(json.dumps({'table': table, 'row': row}, ensure_ascii=False))
+                    out.write('\n')
+                count += 1
+            if fmt == 'json':
+                out.write('\n]' if count else ']')
+            counts[table] = count
+        if fmt == 'json':
+            out.write('\n}\n')
     conn.close()
 
-    print(f"Данные успешно экспортированы в {output_json}")
+    if state_path:
+        with open(state_path, 'w', encoding='utf-8') as f:
+            json.dump({'exported_at': started_at, 'since': since, 'counts': counts}, f, ensure_ascii=False, indent=2)
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('db_path')
+    parser.add_argument('output', help="Output file, '-' for stdout")
+    parser.add_argument('--format', choices=('json', 'ndjson'), default='json')
+    parser.add_argument('--compress', choices=('none', 'gzip', 'zstd'), help='Default: by the output extension')
+    parser.add_argument('--table', action='append', help='Export only this table (repeatable)')
+    parser.add_argument('--ranobe', type=int, action='append', help='Export only rows of this ranobe (repeatable)')
+    parser.add_argument('--since', help="Only rows with updated_at >= this UTC time ('YYYY-MM-DD HH:MM:SS')")
+    parser.add_argument('--since-last', action='store_true', help='Only rows changed since the export recorded in --state')
+    parser.add_argument('--state', help='Export state file (default: <output>.state.json)')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    args = parser.parse_args()
+
+    state_path = args.state or (f'{args.output}.state.json' if args.output != '-' else None)
+    since = args.since
+    if args.since_last:
+        since = load_state(state_path).get('exported_at') if state_path else None
+        if since is None:
+            print('No previous export found, exporting everything', file=sys.stderr)
+
+    counts = db_to_json(args.db_path, args.output, args.format, args.compress, args.table, args.ranobe,
+                        since, args.batch_size, state_path)
+    print(f"Данные успешно экспортированы в {args.output}: {counts}", file=sys.stderr)
 
-# Использование
-db_to_json(r'D:\pet\ranoberead\server\instance\ranobe.db', 'output.json')
 
+if __name__ == '__main__':
+    main()
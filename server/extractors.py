@@ -0,0 +1,122 @@
+"""Extraction of chapter_data.data ({title, body}) from a chapter page's __NEXT_DATA__.
+
+Extractors take the raw page (bytes or str) and return the dict or None:
+
+- subtree: byte search for the script tag from the end of the page and for
+  the keys of CHAPTER_DATA_PATH in order, then decodes only the
+  chapter_data value with JSONDecoder.raw_decode
+- json: the same byte search, then json.loads of the whole payload
+- bs4: BeautifulSoup DOM of the whole page, as parser.py used to do
+
+extract_chapter_data tries them in order, so a page the fast paths do not
+understand still goes through BeautifulSoup.
+"""
+import json
+
+from bs4 import BeautifulSoup
+
+NEXT_DATA_MARKER = b'id="__NEXT_DATA__"'
+SCRIPT_END = b'</script>'
+CHAPTER_DATA_PATH = ('props', 'pageProps', 'serie', 'chapter_data', 'data')
+# Ключи до chapter_data включительно, как их пишет Next.js: без пробела после двоеточия
+PATH_KEYS = tuple(b'"%s":' % key.encode() for key in CHAPTER_DATA_PATH[:-1])
+
+decoder = json.JSONDecoder()
+
+
+def chapter_fields(data):
+    '''data, если это {title: str, body: list}'''
+    if isinstance(data, dict) and isinstance(data.get('title'), str) and isinstance(data.get('body'), list):
+        return data
+    return None
+
+
+def next_data_span(page):
+    '''(page bytes, start, end) of the __NEXT_DATA__ payload; Next.js puts it at the end of <body>'''
+    if isinstance(page, str):
+        page = page.encode('utf-8')
+    marker = page.rfind(NEXT_DATA_MARKER)
+    if marker < 0:
+        return None
+    start = page.find(b'>', marker) + 1
+    end = page.find(SCRIPT_END, start)
+    if start == 0 or end < 0:
+        return None
+    return page, start, end
+
+
+def find_key(page, key, start, end):
+    '''Position of the object key, or -1'''
+    position = page.find(key, start, end)
+    # Ключ, а не кусок строки: внутри строки кавычка была бы экранирована
+    while position > 0 and page[position - 1] == 0x5C:
+        position = page.find(key, position + 1, end)
+    return position
+
+
+def follow(payload, path=CHAPTER_DATA_PATH):
+    try:
+        for key in path:
+            payload = payload[key]
+    except (KeyError, TypeError):
+        return None
+    return chapter_fields(payload)
+
+
+def extract_subtree(page):
+    span = next_data_span(page)
+    if span is None:
+        return None
+    page, start, end = span
+    # Весь путь до chapter_data по порядку; иначе страницу разбирает extract_json
+    key = start
+    for path_key in PATH_KEYS:
+        key = find_key(page, path_key, key, end)
+        if key < 0:
+            return None
+    try:
+        chapter_data, _ = decoder.raw_decode(page[key + len(PATH_KEYS[-1]):end].decode('utf-8').lstrip())
+    except (ValueError, UnicodeDecodeError):
+        return None
+    return follow(chapter_data, CHAPTER_DATA_PATH[-1:])
+
+
+def extract_json(page):
+    span = next_data_span(page)
+    if span is None:
+        return None
+    page, start, end = span
+    try:
+        payload = json.loads(page[start:end])
+    except (ValueError, UnicodeDecodeError):
+        return None
+    return follow(payload)
+
+
+def extract_bs4(page):
+    soup = BeautifulSoup(page, 'html.parser')
+    script_tag = soup.find('script', id='__NEXT_DATA__')
+    if not script_tag or not script_tag.string:
+        return None
+    try:
+        payload = json.loads(script_tag.string)
+    except ValueError:
+        return None
+    return follow(payload)
+
+
+EXTRACTORS = {
+    'subtree': extract_subtree,
+    'json': extract_json,
+    'bs4': extract_bs4,
+}
+DEFAULT_CHAIN = ('subtree', 'json', 'bs4')
+
+
+def extract_chapter_data(page, chain=DEFAULT_CHAIN):
+    '''chapter_data.data from the first extractor in chain that understands the page'''
+    for name in chain:
+        data = EXTRACTORS[name](page)
+        if data is not None:
+            return data
+    return None
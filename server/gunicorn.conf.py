@@ -1,3 +1,5 @@
+import os
+
 bind = '0.0.0.0:3000'
 workers = 2
 threads = 2
@@ -5,7 +7,11 @@ worker_class = "gthread"
 max_requests = 1000
 max_requests_jitter = 50
 
-loglevel = "debug"
+# Общий для воркеров кеш ответов (см. cache.py)
+raw_env = ["RANOBE_RESPONSE_CACHE=sqlite"]
+
+# debug заваливает лог; медленные запросы и SQL пишутся на уровне warning (см. metrics.py)
+loglevel = os.getenv("RANOBE_LOG_LEVEL", "info").lower()
 accesslog = "/root/ranoberead/logs/gunicorn-access.log"
 errorlog = "/root/ranoberead/logs/gunicorn-error.log"
 capture_output = True
@@ -14,18 +20,18 @@ enable_stdio_inheritance = True
 # Добавим проверку загрузки приложения
 def on_starting(server):
     import logging
-    logging.basicConfig(level=logging.DEBUG)
+    logging.basicConfig(level=loglevel.upper())
     logger = logging.getLogger("gunicorn.error")
     logger.debug("Gunicorn is starting up")
 
 def on_reload(server):
     import logging
-    logging.basicConfig(level=logging.DEBUG)
+    logging.basicConfig(level=loglevel.upper())
     logger = logging.getLogger("gunicorn.error")
     logger.debug("Gunicorn is reloading")
 
 def when_ready(server):
     import logging
-    logging.basicConfig(level=logging.DEBUG)
+    logging.basicConfig(level=loglevel.upper())
     logger = logging.getLogger("gunicorn.error")
     logger.debug("Gunicorn is ready")
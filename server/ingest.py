@@ -0,0 +1,151 @@
+"""Прямая запись глав в базу, минуя HTTP API.
+
+Использует модели и upsert из models.py, но не поднимает Flask-приложение:
+отдельный движок SQLAlchemy на тот же файл с профилем storage.py (WAL,
+BEGIN IMMEDIATE, busy_timeout), поэтому можно писать, пока gunicorn
+обслуживает чтение. Главы пишутся пачками, по одной транзакции на пачку,
+с той же семантикой, что POST /chapters/bulk: превью, сжатие, поисковый
+индекс, версии ранобэ. После каждой пачки сбрасываются затронутые ответы
+в общем кеше (RANOBE_RESPONSE_CACHE=sqlite, как в gunicorn.conf.py).
+
+    python ingest.py chapters.ndjson        # по главе на строку, как для /chapters/bulk
+    python parser.py --crawl --output db
+"""
+import argparse
+import os
+import sys
+import time
+
+from alembic.migration import MigrationContext
+from alembic.script import ScriptDirectory
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import Session
+
+from cache import RANOBE_LIST_CACHE_KEY, SQLiteCache, ranobe_cache_key
+from compression import codec
+from models import CompressionDictionary, iter_ndjson, write_chapter_batch
+from storage import DEFAULT_PROFILE, configure_write_engine, is_sqlite, retry_on_busy, storage
+
+SERVER_DIR = os.path.dirname(os.path.abspath(__file__))
+# Flask-SQLAlchemy считает относительные пути SQLite от instance/ приложения
+INSTANCE_DIR = os.path.join(SERVER_DIR, 'instance')
+MIGRATIONS_DIR = os.path.join(SERVER_DIR, 'migrations')
+DATABASE_URI = os.getenv('RANOBE_DATABASE_URI', 'sqlite:///ranobe.db')
+RESPONSE_CACHE = os.getenv('RANOBE_RESPONSE_CACHE', 'sqlite')
+RESPONSE_CACHE_PATH = os.getenv('RANOBE_RESPONSE_CACHE_PATH', os.path.join(INSTANCE_DIR, 'response_cache.db'))
+BATCH_SIZE = 200  # chapters per transaction
+
+
+def resolve_database_uri(uri):
+    prefix = 'sqlite:///'
+    if uri.startswith(prefix) and uri != 'sqlite:///:memory:' and not os.path.isabs(uri[len(prefix):]):
+        return prefix + os.path.join(INSTANCE_DIR, uri[len(prefix):])
+    return uri
+
+
+def check_schema(engine):
+    '''Raise RuntimeError unless the database is at the latest migration'''
+    heads = set(ScriptDirectory(MIGRATIONS_DIR).get_heads())
+    current = set()
+    # Проверка не должна оставлять после себя пустой файл базы
+    if not is_sqlite(engine) or os.path.exists(engine.url.database):
+        with engine.connect() as connection:
+            current = set(MigrationContext.configure(connection).get_current_heads())
+    if current != heads:
+        engine.dispose()
+        raise RuntimeError(
+            f"Database {engine.url} is at revision {', '.join(sorted(current)) or 'none'}, "
+            f"latest is {', '.join(sorted(heads))}: run 'flask --app app db upgrade' "
+            f"(or 'flask --app app init-db' for a new database)"
+        )
+
+
+def create_write_engine(database_uri=DATABASE_URI, profile=None):
+    '''Engine on the app database with the storage.py write profile.
+
+    The schema belongs to the migrations: the database must already be upgraded.
+    '''
+    engine = create_engine(resolve_database_uri(database_uri))
+    if is_sqlite(engine):
+        configure_write_engine(engine, {**DEFAULT_PROFILE, **(profile or {})})
+    check_schema(engine)
+    return engine
+
+
+class ChapterIngest:
+    '''Batched chapter upserts straight into the app database'''
+
+    def __init__(self, database_uri=DATABASE_URI, cache_path=RESPONSE_CACHE_PATH, profile=None):
+        self.profile = {**DEFAULT_PROFILE, **(profile or {})}
+        self.engine = create_write_engine(database_uri, self.profile)
+
+        codec.fetch = self.fetch_compression_dictionaries
+        self.session = Session(self.engine)
+        self.write_batch = retry_on_busy(self.session, self.profile['write_retries'])(self._write_batch)
+        # LRU-кеш живёт в памяти воркеров, отсюда его не сбросить
+        if RESPONSE_CACHE == 'sqlite' and cache_path and os.path.exists(cache_path):
+            self.cache = SQLiteCache(cache_path, 0)
+        else:
+            self.cache = None
+
+    def fetch_compression_dictionaries(self):
+        # Словари догружаются посреди пачки; через пишущий движок это ждало бы свою же транзакцию
+        with storage.read_engine(self.engine).connect() as connection:
+            return connection.execute(
+                select(CompressionDictionary.id, CompressionDictionary.lang, CompressionDictionary.data)
+                .order_by(CompressionDictionary.created_at, CompressionDictionary.id)
+            ).all()
+
+    def _write_batch(self, items):
+        '''Upsert a list of chapter dicts in one transaction; per-item results in the same order'''
+        results, touched = write_chapter_batch(self.session, list(enumerate(items)))
+        self.session.commit()
+        if self.cache is not None and touched:
+            keys = [ranobe_cache_key(ranobe_id) for ranobe_id in touched]
+            if any(touched.values()):
+                keys.append(RANOBE_LIST_CACHE_KEY)
+            self.cache.delete(*keys)
+        return results
+
+    def upsert_chapters(self, items, batch_size=BATCH_SIZE):
+        '''Upsert an iterable of chapter dicts batch by batch, yielding per-item results'''
+        batch = []
+        for item in items:
+            batch.append(item)
+            if len(batch) >= batch_size:
+                yield from self.write_batch(batch)
+                batch = []
+        if batch:
+            yield from self.write_batch(batch)
+
+    def close(self):
+        self.session.close()
+        self.engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('files', nargs='*', help='NDJSON files with one chapter per line (default: stdin)')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    args = parser.parse_args()
+
+    ingest = ChapterIngest()
+    counts = {}
+    started = time.perf_counter()
+    try:
+        for path in args.files or ['-']:
+            stream = sys.stdin if path == '-' else open(path, encoding='utf-8')
+            with stream:
+                for index, result in enumerate(ingest.upsert_chapters(iter_ndjson(stream), args.batch_size)):
+                    counts[result['status']] = counts.get(result['status'], 0) + 1
+                    if result['status'] == 'error':
+                        print(f"{path}: item {index + 1}: {result['error']}")
+    finally:
+        ingest.close()
+    elapsed = time.perf_counter() - started
+    total = sum(counts.values())
+    print(f"Processed {total} chapters in {elapsed:.1f}s ({total / elapsed if elapsed else 0:.1f} chapters/sec): {counts}")
+
+
+if __name__ == '__main__':
+    main()
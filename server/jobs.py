@@ -0,0 +1,196 @@
+"""Очередь задач конвейера scrape -> ingest -> translate в базе приложения.
+
+Задача - одна стадия для одной главы (таблица job, модель Job в models.py).
+Воркер берёт задачи в аренду (lease) на время: UPDATE ... RETURNING в
+транзакции BEGIN IMMEDIATE, поэтому два процесса не получат одну задачу.
+Пока обработчик работает, аренда продлевается (renew); если воркер упал,
+аренда истекает и задачу забирает другой. Завершить задачу может только
+её текущий арендатор, а следующая стадия ставится в очередь в той же
+транзакции. Неудача возвращает задачу в pending с задержкой, после
+max_attempts попыток - в failed.
+"""
+import json
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import and_, case, func, or_, select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import sessionmaker
+
+from models import Job
+
+STAGES = ('scrape', 'ingest', 'translate')
+NEXT_STAGE = {'scrape': 'ingest', 'ingest': 'translate'}
+JOB_STATUSES = ('pending', 'leased', 'done', 'failed')
+THROUGHPUT_WINDOWS = (5, 60)  # minutes
+
+
+def utcnow():
+    # Как CURRENT_TIMESTAMP в SQLite: UTC без часового пояса
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def job_dict(row):
+    job = dict(row._mapping)
+    job['payload'] = json.loads(job['payload']) if job.get('payload') else None
+    return job
+
+
+def empty_stage_stats():
+    return {'depth': 0, 'ready': 0, **dict.fromkeys(JOB_STATUSES, 0), 'oldest_pending_seconds': None}
+
+
+def job_stats(session, now=None):
+    '''Queue depth and throughput per stage; works with any session on the app database'''
+    now = now or utcnow()
+    stats = {stage: empty_stage_stats() for stage in STAGES}
+    counts = session.execute(
+        select(
+            Job.stage, Job.status, func.count(),
+            func.sum(case((Job.available_at <= now, 1), else_=0)),
+            func.min(Job.created_at),
+        ).group_by(Job.stage, Job.status)
+    )
+    for stage, status, count, ready, oldest in counts:
+        row = stats.setdefault(stage, empty_stage_stats())
+        row[status] = count
+        if status in ('pending', 'leased'):
+            row['depth'] += count
+        if status == 'pending':
+            row['ready'] = ready or 0
+            if oldest:
+                row['oldest_pending_seconds'] = round((now - oldest).total_seconds())
+
+    for minutes in THROUGHPUT_WINDOWS:
+        for stage in stats:
+            stats[stage][f'done_per_minute_{minutes}m'] = 0.0
+            stats[stage][f'mean_seconds_{minutes}m'] = None
+        finished = session.execute(
+            select(
+                Job.stage, func.count(),
+                func.avg((func.julianday(Job.finished_at) - func.julianday(Job.started_at)) * 86400),
+            ).where(Job.status == 'done', Job.finished_at >= now - timedelta(minutes=minutes))
+            .group_by(Job.stage)
+        )
+        for stage, count, mean_seconds in finished:
+            if stage in stats:
+                stats[stage][f'done_per_minute_{minutes}m'] = round(count / minutes, 2)
+                stats[stage][f'mean_seconds_{minutes}m'] = round(mean_seconds, 2) if mean_seconds is not None else None
+    return stats
+
+
+class JobQueue:
+    def __init__(self, engine, max_attempts=5, retry_base=5, retry_cap=600):
+        self.Session = sessionmaker(engine)
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        self.retry_cap = retry_cap
+
+    def enqueue(self, stage, ranobe_id, chapter_numbers, payload=None, retry_failed=False):
+        '''Add jobs; existing ones are kept, failed ones go back to pending with retry_failed'''
+        now = utcnow()
+        chapter_numbers = list(chapter_numbers)
+        rows = [{
+            'stage': stage, 'ranobe_id': ranobe_id, 'chapter_number_origin': number, 'status': 'pending',
+            'attempts': 0, 'payload': json.dumps(payload) if payload is not None else None, 'available_at': now,
+        } for number in chapter_numbers]
+        if not rows:
+            return 0
+        with self.Session.begin() as session:
+            statement = sqlite_insert(Job.__table__).on_conflict_do_nothing(
+                index_elements=['stage', 'ranobe_id', 'chapter_number_origin'])
+            added = session.execute(statement, rows).rowcount
+            if retry_failed:
+                session.execute(
+                    update(Job)
+                    .where(Job.stage == stage, Job.ranobe_id == ranobe_id, Job.status == 'failed',
+                           Job.chapter_number_origin.in_(chapter_numbers))
+                    .values(status='pending', attempts=0, error=None, available_at=now)
+                )
+        return added
+
+    def lease(self, stage, worker, limit=1, lease_seconds=300):
+        '''Take up to limit ready jobs of the stage: pending ones and leases that expired'''
+        now = utcnow()
+        with self.Session.begin() as session:
+            ids = select(Job.id).where(
+                Job.stage == stage,
+                or_(
+                    and_(Job.status == 'pending', Job.available_at <= now),
+                    and_(Job.status == 'leased', Job.lease_until < now),
+                )
+            ).order_by(Job.available_at, Job.id).limit(limit).scalar_subquery()
+            rows = session.execute(
+                update(Job)
+                .where(Job.id.in_(ids))
+                .values(status='leased', worker=worker, attempts=Job.attempts + 1,
+                        lease_until=now + timedelta(seconds=lease_seconds), started_at=now)
+                .returning(Job.id, Job.stage, Job.ranobe_id, Job.chapter_number_origin, Job.chapter_id,
+                           Job.attempts, Job.payload)
+            ).all()
+        return sorted((job_dict(row) for row in rows), key=lambda job: job['id'])
+
+    def renew(self, job_ids, worker, lease_seconds):
+        with self.Session.begin() as session:
+            return session.execute(
+                update(Job)
+                .where(Job.id.in_(job_ids), Job.status == 'leased', Job.worker == worker)
+                .values(lease_until=utcnow() + timedelta(seconds=lease_seconds))
+            ).rowcount
+
+    def complete(self, job, worker, result='ok', next_payload=None, chapter_id=None):
+        '''Mark a leased job done and enqueue the next stage with next_payload (if given).
+
+        Returns False when the lease was lost: another worker owns the job now.
+        '''
+        now = utcnow()
+        with self.Session.begin() as session:
+            done = session.execute(
+                update(Job)
+                .where(Job.id == job['id'], Job.status == 'leased', Job.worker == worker)
+                .values(status='done', result=result, error=None, payload=None, lease_until=None,
+                        finished_at=now, chapter_id=chapter_id or Job.chapter_id)
+            ).rowcount
+            next_stage = NEXT_STAGE.get(job['stage'])
+            if done and next_stage and next_payload is not None:
+                statement = sqlite_insert(Job).values(
+                    stage=next_stage, ranobe_id=job['ranobe_id'], chapter_number_origin=job['chapter_number_origin'],
+                    chapter_id=chapter_id or job['chapter_id'], status='pending', attempts=0,
+                    payload=json.dumps(next_payload), available_at=now,
+                )
+                # Повторный scrape перезапускает ingest, если тот не выполняется прямо сейчас
+                session.execute(statement.on_conflict_do_update(
+                    index_elements=['stage', 'ranobe_id', 'chapter_number_origin'],
+                    set_={
+                        'chapter_id': statement.excluded.chapter_id, 'status': 'pending', 'attempts': 0,
+                        'payload': statement.excluded.payload, 'error': None, 'available_at': now,
+                    },
+                    where=Job.status != 'leased',
+                ))
+        return bool(done)
+
+    def fail(self, job, worker, error):
+        '''Give the job back for a retry later, or mark it failed after max_attempts'''
+        now = utcnow()
+        if job['attempts'] >= self.max_attempts:
+            values = {'status': 'failed', 'finished_at': now}
+        else:
+            delay = min(self.retry_cap, self.retry_base * 2 ** (job['attempts'] - 1))
+            values = {'status': 'pending', 'available_at': now + timedelta(seconds=delay)}
+        with self.Session.begin() as session:
+            return bool(session.execute(
+                update(Job)
+                .where(Job.id == job['id'], Job.status == 'leased', Job.worker == worker)
+                .values(error=str(error)[:1000], lease_until=None, **values)
+            ).rowcount)
+
+    def active(self, stages):
+        '''Jobs of these stages that are pending or leased (including ones waiting for a retry)'''
+        with self.Session() as session:
+            return session.scalar(
+                select(func.count()).select_from(Job)
+                .where(Job.stage.in_(stages), Job.status.in_(('pending', 'leased')))
+            )
+
+    def stats(self):
+        with self.Session() as session:
+            return job_stats(session)
@@ -0,0 +1,381 @@
+"""Потоковая загрузка глав из выгрузки (dbtojson.py, output.json) в API.
+
+Выгрузка читается по одной записи: большой JSON не загружается в память
+целиком, а NDJSON читается построчно; .gz и .zst распаковываются на лету.
+Главы отправляются параллельно через общий пул соединений:
+
+go    - по главе на POST /api/chapters сервера на Go (ranobe_id - ObjectID, --ranobe-id);
+flask - пачками через POST /chapters/bulk, по результату на каждую главу.
+
+Ответы 429/5xx и сетевые ошибки повторяются с экспоненциальной задержкой.
+Итог по каждой главе пишется в loader_state.db, повторный запуск
+пропускает уже загруженные главы.
+
+    python loader.py output.json --target go --ranobe-id 670921dbdad01c7a159da9d6
+    python loader.py chapters.ndjson.zst --target flask --api-url http://127.0.0.1:3000/chapters/
+    python loader.py output.json --target flask --source-ranobe 1 --ranobe-id 3
+"""
+import argparse
+import asyncio
+import gzip
+import io
+import json
+import os
+import sqlite3
+import sys
+import time
+
+import httpx
+import zstandard
+
+from ratelimit import backoff_delay, parse_duration
+
+GO_API_URL = "http://localhost:8080/api/chapters"
+FLASK_API_URL = "http://127.0.0.1:3000/chapters/"
+TARGETS = ('go', 'flask')
+CONCURRENCY = {'go': 8, 'flask': 2}  # запросов одновременно; flask пишет в SQLite, там больше не нужно
+BATCH_SIZE = 100  # глав на POST /chapters/bulk
+BATCH_CHARS = 2_000_000  # и не больше стольких символов текста в одной пачке
+MAX_ATTEMPTS = 5
+BACKOFF_BASE = 1  # seconds
+BACKOFF_CAP = 30  # seconds
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+STATE_PATH = os.getenv("LOADER_STATE_PATH", "loader_state.db")
+READ_SIZE = 1 << 16  # символов за одно чтение из выгрузки
+GO_FIELDS = ('chapter_id', 'chapter_number_origin', 'title_ru', 'title_en', 'content_ru', 'content_en')
+FLASK_FIELDS = ('ranobe_id',) + GO_FIELDS
+
+
+def open_input(path):
+    '''Text stream for path ('-' is stdin), unpacking .gz and .zst'''
+    raw = sys.stdin.buffer if path == '-' else open(path, 'rb')
+    if path.endswith('.gz'):
+        raw = gzip.GzipFile(fileobj=raw)
+    elif path.endswith('.zst'):
+        raw = zstandard.ZstdDecompressor().stream_reader(raw, closefd=path != '-')
+    return io.TextIOWrapper(raw, encoding='utf-8')
+
+
+class JsonStream:
+    """Reads a JSON document piece by piece: containers are walked, only their items are decoded"""
+
+    def __init__(self, stream, read_size=READ_SIZE):
+        self.stream = stream
+        self.read_size = read_size
+        self.decoder = json.JSONDecoder()
+        self.buffer = ''
+        self.pos = 0
+        self.offset = 0  # позиция начала буфера в документе
+        self.eof = False
+
+    def _read(self, size):
+        chunk = self.stream.read(size)
+        if not chunk:
+            self.eof = True
+            return False
+        # Прочитанное отбрасываем, в памяти остаётся только текущая запись
+        self.offset += self.pos
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def tell(self):
+        return self.offset + self.pos
+
+    def peek(self):
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in ' \t\r\n':
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._read(self.read_size):
+                return None
+
+    def expect(self, chars):
+        char = self.peek()
+        if char is None or char not in chars:
+            raise ValueError(f"Expected {' or '.join(repr(c) for c in chars)} at offset {self.tell()}, got {char!r}")
+        self.pos += 1
+        return char
+
+    def value(self):
+        '''Decode the next complete value'''
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+                # Число на краю буфера может продолжаться в следующем куске
+                if end < len(self.buffer) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            # Запись не поместилась: читаем не меньше, чем уже есть, чтобы не разбирать её заново слишком часто
+            self._read(max(self.read_size, len(self.buffer) - self.pos))
+
+    def items(self):
+        '''Items of the array that starts here'''
+        self.expect('[')
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        while True:
+            yield self.value()
+            if self.expect(',]') == ']':
+                return
+
+    def members(self):
+        '''(key, stream) pairs of the object that starts here; read or skip each value before the next pair'''
+        self.expect('{')
+        if self.peek() == '}':
+            self.pos += 1
+            return
+        while True:
+            key = self.value()
+            self.expect(':')
+            start = self.tell()
+            yield key, self
+            if self.tell() == start:
+                self.skip()
+            if self.expect(',}') == '}':
+                return
+
+    def skip(self):
+        if self.peek() == '[':
+            for _ in self.items():
+                pass
+        else:
+            self.value()
+
+
+def iter_json_rows(stream, table='chapter'):
+    '''Rows of a JSON export: {"chapter": [...], ...} (dbtojson.py) or a plain array of chapters'''
+    document = JsonStream(stream)
+    if document.peek() == '[':
+        yield from document.items()
+        return
+    for key, value in document.members():
+        if key == table:
+            yield from value.items()
+
+
+def iter_ndjson_rows(stream, table='chapter'):
+    '''Rows of an NDJSON export: {"table": ..., "row": {...}} lines (dbtojson.py) or bare chapters'''
+    for line in stream:
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        if 'row' in record and 'table' in record:
+            if record['table'] == table:
+                yield record['row']
+        else:
+            yield record
+
+
+def iter_chapters(path, fmt=None):
+    '''Chapters from an export file; fmt is json or ndjson, by default guessed from the extension'''
+    if fmt is None:
+        name = path[:-3] if path.endswith('.gz') else path[:-4] if path.endswith('.zst') else path
+        fmt = 'ndjson' if name.endswith(('.ndjson', '.jsonl')) else 'json'
+    with open_input(path) as stream:
+        yield from (iter_ndjson_rows if fmt == 'ndjson' else iter_json_rows)(stream)
+
+
+def chapter_request(target, chapter, ranobe_id=None):
+    '''Body of one chapter for the target API; ranobe_id replaces the one from the export'''
+    if target == 'go':
+        return {'ranobe_id': ranobe_id, **{key: chapter.get(key) for key in GO_FIELDS}}
+    body = {key: chapter.get(key) for key in FLASK_FIELDS}
+    if ranobe_id is not None:
+        body['ranobe_id'] = ranobe_id
+    return body
+
+
+class LoadState:
+    """Per-chapter outcome of loader runs for each API URL, so a run resumes where the last one stopped"""
+
+    def __init__(self, path=STATE_PATH):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS chapter (
+                api_url TEXT NOT NULL,
+                ranobe_id TEXT NOT NULL,
+                chapter_id INTEGER NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (api_url, ranobe_id, chapter_id)
+            )
+        ''')
+        self.conn.commit()
+
+    def saved(self, api_url):
+        return {
+            (ranobe_id, chapter_id) for ranobe_id, chapter_id in self.conn.execute(
+                "SELECT ranobe_id, chapter_id FROM chapter WHERE api_url = ? AND status = 'saved'", (api_url,))
+        }
+
+    def mark(self, api_url, results):
+        '''results: (ranobe_id, chapter_id, status, error) tuples, written in one transaction'''
+        now = time.time()
+        with self.conn:
+            self.conn.executemany(
+                'INSERT INTO chapter (api_url, ranobe_id, chapter_id, status, attempts, error, updated_at) '
+                'VALUES (?, ?, ?, ?, 1, ?, ?) ON CONFLICT (api_url, ranobe_id, chapter_id) DO UPDATE SET '
+                'status = excluded.status, attempts = attempts + 1, error = excluded.error, updated_at = excluded.updated_at',
+                [(api_url, str(ranobe_id), chapter_id, status, error, now) for ranobe_id, chapter_id, status, error in results]
+            )
+
+    def summary(self, api_url):
+        return dict(self.conn.execute(
+            'SELECT status, COUNT(*) FROM chapter WHERE api_url = ? GROUP BY status', (api_url,)))
+
+    def close(self):
+        self.conn.close()
+
+
+async def post_with_retries(http, url, body, label):
+    '''POST with retries on 429/5xx and network errors; (response or None, error)'''
+    # Один раз и без \u-экранирования: у русского текста тело иначе вырастает в несколько раз
+    content = json.dumps(body, ensure_ascii=False).encode('utf-8')
+    error = None
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        retry_after = None
+        try:
+            response = await http.post(url, content=content, headers={'Content-Type': 'application/json'})
+            if response.status_code < 400:
+                return response, None
+            error = f"HTTP {response.status_code}: {response.text[:200]}"
+            if response.status_code not in RETRY_STATUSES:
+                return None, error
+            retry_after = parse_duration(response.headers.get('Retry-After'))
+        except httpx.TransportError as e:
+            error = str(e) or type(e).__name__
+        if attempt == MAX_ATTEMPTS:
+            break
+        delay = max(backoff_delay(attempt, BACKOFF_BASE, BACKOFF_CAP), retry_after or 0)
+        print(f"Failed to save {label} ({error}), attempt {attempt}/{MAX_ATTEMPTS}. Retrying in {delay:.1f} seconds...")
+        await asyncio.sleep(delay)
+    return None, error
+
+
+class Loader:
+    def __init__(self, target, api_url, state, ranobe_id=None, source_ranobe=None,
+                 concurrency=None, batch_size=BATCH_SIZE):
+        if target == 'go' and ranobe_id is None:
+            raise ValueError('The Go API needs --ranobe-id (ObjectID of the ranobe there)')
+        self.target = target
+        self.api_url = api_url
+        self.state = state
+        self.ranobe_id = ranobe_id
+        self.source_ranobe = source_ranobe
+        self.concurrency = concurrency or CONCURRENCY[target]
+        self.batch_size = batch_size if target == 'flask' else 1
+        self.counts = dict.fromkeys(('saved', 'failed', 'skipped'), 0)
+
+    def batches(self, chapters):
+        '''Request bodies of chapters not saved yet, batch_size at a time'''
+        saved = self.state.saved(self.api_url)
+        batch, chars = [], 0
+        for chapter in chapters:
+            if self.source_ranobe is not None and chapter.get('ranobe_id') != self.source_ranobe:
+                continue
+            body = chapter_request(self.target, chapter, self.ranobe_id)
+            if (str(body['ranobe_id']), body['chapter_id']) in saved:
+                self.counts['skipped'] += 1
+                continue
+            batch.append(body)
+            chars += sum(len(body.get(key) or '') for key in ('content_ru', 'content_en'))
+            if len(batch) >= self.batch_size or chars >= BATCH_CHARS:
+                yield batch
+                batch, chars = [], 0
+        if batch:
+            yield batch
+
+    async def send(self, http, batch):
+        '''Results per chapter: (ranobe_id, chapter_id, status, error)'''
+        if self.target == 'go':
+            body = batch[0]
+            response, error = await post_with_retries(http, self.api_url, body, f"chapter {body['chapter_id']}")
+            return [(body['ranobe_id'], body['chapter_id'], 'saved' if response else 'failed', error)]
+
+        url = f"{self.api_url.rstrip('/')}/bulk"
+        response, error = await post_with_retries(http, url, batch, f"{len(batch)} chapters")
+        if response is None:
+            return [(body['ranobe_id'], body['chapter_id'], 'failed', error) for body in batch]
+        return [
+            (body['ranobe_id'], body['chapter_id'], 'failed' if item['status'] == 'error' else 'saved', item.get('error'))
+            for body, item in zip(batch, response.json()['items'])
+        ]
+
+    async def worker(self, http, queue):
+        while True:
+            batch = await queue.get()
+            if batch is None:
+                return
+            try:
+                results = await self.send(http, batch)
+            except Exception as e:
+                results = [(body['ranobe_id'], body['chapter_id'], 'failed', str(e)) for body in batch]
+            self.state.mark(self.api_url, results)
+            for ranobe_id, chapter_id, status, error in results:
+                self.counts[status] += 1
+                if status == 'failed':
+                    print(f"Failed to save chapter {chapter_id}: {error}")
+            print(f"Saved {self.counts['saved']} chapters, {self.counts['failed']} failed")
+
+    async def run(self, chapters):
+        # Очередь ограничена, поэтому чтение выгрузки не убегает вперёд отправки
+        queue = asyncio.Queue(maxsize=self.concurrency)
+        limits = httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency)
+        async with httpx.AsyncClient(timeout=60, limits=limits) as http:
+            workers = [asyncio.create_task(self.worker(http, queue)) for _ in range(self.concurrency)]
+            try:
+                for batch in self.batches(chapters):
+                    await queue.put(batch)
+                    # Разбор JSON синхронный, даём воркерам отправить готовое
+                    await asyncio.sleep(0)
+                for _ in workers:
+                    await queue.put(None)
+                await asyncio.gather(*workers)
+            finally:
+                for task in workers:
+                    task.cancel()
+        return self.counts
+
+
+def main(default_target=None, default_ranobe_id=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('input', help="Export file (.json, .ndjson, optionally .gz/.zst), '-' for stdin")
+    parser.add_argument('--format', choices=('json', 'ndjson'), help='Default: by the file extension')
+    parser.add_argument('--target', choices=TARGETS, default=default_target, required=default_target is None)
+    parser.add_argument('--api-url', help=f'Default: {GO_API_URL} for go, {FLASK_API_URL} for flask')
+    parser.add_argument('--ranobe-id', default=default_ranobe_id,
+                        help='Ranobe to load the chapters into (ObjectID for go, integer for flask)')
+    parser.add_argument('--source-ranobe', type=int, help='Only chapters of this ranobe id in the export')
+    parser.add_argument('--concurrency', type=int, help='Requests in flight (default: 8 for go, 2 for flask)')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Chapters per POST /chapters/bulk')
+    parser.add_argument('--state', default=STATE_PATH, help='Checkpoint database')
+    args = parser.parse_args()
+
+    ranobe_id = args.ranobe_id
+    if args.target == 'flask' and ranobe_id is not None:
+        ranobe_id = int(ranobe_id)
+    api_url = args.api_url or (GO_API_URL if args.target == 'go' else FLASK_API_URL)
+
+    state = LoadState(args.state)
+    try:
+        loader = Loader(args.target, api_url, state, ranobe_id, args.source_ranobe, args.concurrency, args.batch_size)
+        started = time.perf_counter()
+        counts = asyncio.run(loader.run(iter_chapters(args.input, args.format)))
+        print(f"Loaded in {time.perf_counter() - started:.1f}s: {counts}")
+        print(f"Checkpoint for {api_url}: {state.summary(api_url)}")
+    finally:
+        state.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,286 @@
+"""Метрики API в формате Prometheus: задержка и размер ответов, SQL на запрос, медленные запросы.
+
+На каждый HTTP-запрос считаются длительность (до закрытия ответа, то есть
+вместе с потоковой отдачей), размер тела, число SQL-операторов и их
+суммарное время (события before/after_cursor_execute движков SQLAlchemy;
+SQLite отдаёт строки по мере выборки, так что время выборки после первой
+строки в него не входит).
+Запросы и SQL-операторы дольше порогов пишутся в лог и считаются отдельно.
+
+Счётчики копятся в памяти воркера под блокировкой, а фоновый поток раз в
+flush_interval секунд (и при выходе процесса) прибавляет накопленное к
+общему SQLite-файлу одним INSERT ... ON CONFLICT. /metrics сначала
+сбрасывает свой воркер и отдаёт сумму по всем воркерам; у остальных она
+отстаёт не больше чем на flush_interval. Гистограммы хранятся по
+корзинам без накопления, накопительные le считаются при выдаче.
+"""
+import atexit
+import bisect
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+
+from flask import request
+from sqlalchemy import event
+
+from storage import storage
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+STATEMENT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+# Имя: (тип, описание, корзины гистограммы)
+FAMILIES = {
+    'ranobe_http_requests_total': ('counter', 'HTTP requests by endpoint, method and status', None),
+    'ranobe_http_request_duration_seconds': ('histogram', 'Time until the response is closed, streaming included', LATENCY_BUCKETS),
+    'ranobe_http_response_size_bytes': ('histogram', 'Response body size', SIZE_BUCKETS),
+    'ranobe_http_request_sql_statements': ('histogram', 'SQL statements executed per request', STATEMENT_BUCKETS),
+    'ranobe_http_request_sql_seconds': ('histogram', 'Cumulative SQL time per request', LATENCY_BUCKETS),
+    'ranobe_sql_statements_total': ('counter', 'SQL statements by endpoint; background work has endpoint=""', None),
+    'ranobe_sql_seconds_total': ('counter', 'Cumulative SQL time by endpoint', None),
+    'ranobe_slow_requests_total': ('counter', 'Requests slower than RANOBE_SLOW_REQUEST_SECONDS', None),
+    'ranobe_slow_queries_total': ('counter', 'SQL statements slower than RANOBE_SLOW_QUERY_SECONDS', None),
+}
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(labels):
+    return ','.join(f'{key}="{escape_label(value)}"' for key, value in labels)
+
+
+def format_value(value):
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Metrics:
+    def __init__(self, path, flush_interval=5.0, slow_request_seconds=1.0, slow_query_seconds=0.25):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.slow_request_seconds = slow_request_seconds
+        self.slow_query_seconds = slow_query_seconds
+        # (имя, метки, le) -> прирост с прошлого сброса; le - граница корзины или ''
+        self._pending = defaultdict(float)
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._request = threading.local()
+        self._local = threading.local()
+        self._pid = None
+
+    def init_app(self, app, db):
+        app.extensions['metrics'] = self
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        # Только движки этого приложения (и их движки для чтения): слушатель на классе Engine
+        # остался бы навсегда и добавлялся бы заново с каждым create_app()
+        with app.app_context():
+            engines = list(db.engines.values())
+        for engine in engines:
+            self.track(engine)
+            storage.on_read_engine(engine, self.track)
+
+    def track(self, engine):
+        '''Count the SQL statements of engine'''
+        if not event.contains(engine, 'before_cursor_execute', self._before_cursor_execute):
+            event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+            event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+
+    def _connect(self):
+        # Соединения не переживают fork воркера gunicorn
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            # Потеря последнего сброса при сбое машины для метрик допустима
+            conn.execute("PRAGMA synchronous=OFF")
+            # Файл и таблица появляются при первом сбросе, а не при создании приложения
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS metric_sample ("
+                "name TEXT NOT NULL, labels TEXT NOT NULL, le TEXT NOT NULL, value REAL NOT NULL, "
+                "PRIMARY KEY (name, labels, le))"
+            )
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _ensure_started(self):
+        # Поток запускается в том процессе, который считает: после fork его не было бы
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            # Наследство мастер-процесса уже сброшено или будет сброшено им самим
+            self._pending.clear()
+        if self.flush_interval > 0:
+            threading.Thread(target=self._run, name='metrics-flush', daemon=True).start()
+        atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Metrics flush failed')
+
+    # Сбор
+    def _add(self, samples):
+        self._ensure_started()
+        with self._lock:
+            for key, value in samples:
+                self._pending[key] += value
+
+    def inc(self, name, labels=(), value=1):
+        self._add([((name, format_labels(labels), ''), value)])
+
+    def _observation(self, name, labels, value):
+        buckets = FAMILIES[name][2]
+        # Корзина - первая граница >= value; больше последней - +Inf
+        index = bisect.bisect_left(buckets, value)
+        le = format_value(buckets[index]) if index < len(buckets) else '+Inf'
+        return [((name, labels, le), 1), ((name + '_sum', labels, ''), value), ((name + '_count', labels, ''), 1)]
+
+    def observe(self, name, labels, value):
+        self._add(self._observation(name, format_labels(labels), value))
+
+    def _before_request(self):
+        state = self._request
+        state.active = True
+        state.started = time.perf_counter()
+        state.sql_statements = 0
+        state.sql_seconds = 0.0
+
+    def _after_request(self, response):
+        state = self._request
+        if not getattr(state, 'active', False):
+            return response
+        endpoint = request.url_rule.endpoint if request.url_rule else 'unmatched'
+        method, path = request.method, request.path
+        size = response.content_length
+        if size is None and response.is_streamed:
+            counted = [0]
+            body = response.response
+
+            def counting():
+                try:
+                    for chunk in body:
+                        counted[0] += len(chunk) if isinstance(chunk, bytes) else len(chunk.encode('utf-8'))
+                        yield chunk
+                finally:
+                    # Обёртка не должна откладывать очистку в исходном генераторе (BookCache.store)
+                    if hasattr(body, 'close'):
+                        body.close()
+            response.response = counting()
+        else:
+            counted = [size or 0]
+
+        def record():
+            # Вызывается при закрытии ответа, после отдачи всего потока
+            state.active = False
+            self._record_request(endpoint, method, path, response.status_code, counted[0],
+                                 time.perf_counter() - state.started, state.sql_statements, state.sql_seconds)
+        response.call_on_close(record)
+        return response
+
+    def _record_request(self, endpoint, method, path, status, size, seconds, sql_statements, sql_seconds):
+        labels = format_labels((('endpoint', endpoint), ('method', method)))
+        samples = [
+            (('ranobe_http_requests_total', format_labels((('endpoint', endpoint), ('method', method), ('status', status))), ''), 1),
+            (('ranobe_sql_statements_total', format_labels((('endpoint', endpoint),)), ''), sql_statements),
+            (('ranobe_sql_seconds_total', format_labels((('endpoint', endpoint),)), ''), sql_seconds),
+        ]
+        samples += self._observation('ranobe_http_request_duration_seconds', labels, seconds)
+        samples += self._observation('ranobe_http_response_size_bytes', labels, size)
+        samples += self._observation('ranobe_http_request_sql_statements', labels, sql_statements)
+        samples += self._observation('ranobe_http_request_sql_seconds', labels, sql_seconds)
+        if seconds >= self.slow_request_seconds:
+            samples.append((('ranobe_slow_requests_total', labels, ''), 1))
+            logger.warning('Slow request %.3fs: %s %s -> %s, %d bytes, %d SQL statements in %.1fms',
+                           seconds, method, path, status, size, sql_statements, sql_seconds * 1000)
+        self._add(samples)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._metrics_started = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, '_metrics_started', None)
+        if started is None:
+            return
+        seconds = time.perf_counter() - started
+        state = self._request
+        if getattr(state, 'active', False):
+            # Итог по запросу пишется одним разом в _record_request
+            state.sql_statements += 1
+            state.sql_seconds += seconds
+        else:
+            self._add([(('ranobe_sql_statements_total', 'endpoint=""', ''), 1),
+                       (('ranobe_sql_seconds_total', 'endpoint=""', ''), seconds)])
+        if seconds >= self.slow_query_seconds:
+            self.inc('ranobe_slow_queries_total')
+            logger.warning('Slow query %.1fms: %s', seconds * 1000, ' '.join(statement.split())[:500])
+
+    # Сброс и выдача
+    def flush(self):
+        '''Add everything counted since the last flush to the shared file; returns the number of samples'''
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, defaultdict(float)
+            if not batch:
+                return 0
+            try:
+                conn = self._connect()
+                with conn:
+                    conn.executemany(
+                        "INSERT INTO metric_sample (name, labels, le, value) VALUES (?, ?, ?, ?) "
+                        "ON CONFLICT (name, labels, le) DO UPDATE SET value = value + excluded.value",
+                        [(*key, value) for key, value in batch.items()]
+                    )
+            except Exception:
+                with self._lock:
+                    for key, value in batch.items():
+                        self._pending[key] += value
+                raise
+            return len(batch)
+
+    def render(self):
+        '''All workers' metrics in the Prometheus text exposition format'''
+        self.flush()
+        rows = self._connect().execute("SELECT name, labels, le, value FROM metric_sample").fetchall()
+        samples = defaultdict(list)
+        for name, labels, le, value in rows:
+            samples[name].append((labels, le, value))
+
+        lines = []
+        for family, (kind, help_text, buckets) in FAMILIES.items():
+            lines.append(f'# HELP {family} {help_text}')
+            lines.append(f'# TYPE {family} {kind}')
+            if kind == 'counter':
+                for labels, _, value in sorted(samples[family]):
+                    lines.append(f'{family}{{{labels}}} {format_value(value)}' if labels else f'{family} {format_value(value)}')
+                continue
+            counts = defaultdict(dict)
+            for labels, le, value in samples[family]:
+                counts[labels][le] = value
+            sums = {labels: value for labels, _, value in samples[family + '_sum']}
+            totals = {labels: value for labels, _, value in samples[family + '_count']}
+            bounds = [format_value(bound) for bound in buckets] + ['+Inf']
+            for labels in sorted(totals):
+                cumulative = 0
+                prefix = f'{labels},' if labels else ''
+                for le in bounds:
+                    cumulative += counts[labels].get(le, 0)
+                    lines.append(f'{family}_bucket{{{prefix}le="{le}"}} {format_value(cumulative)}')
+                lines.append(f'{family}_sum{{{labels}}} {format_value(sums.get(labels, 0))}')
+                lines.append(f'{family}_count{{{labels}}} {format_value(totals[labels])}')
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,52 @@
+"""initial schema
+
+Revision ID: 21fb88482e93
+Revises: 
+Create Date: 2024-09-24 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '21fb88482e93'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('ranobe',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('title', sa.String(length=100), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('chapter',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('ranobe_id', sa.Integer(), nullable=False),
+    sa.Column('chapter_id', sa.Integer(), nullable=False),
+    sa.Column('chapter_number_origin', sa.Integer(), nullable=False),
+    sa.Column('title_ru', sa.String(length=200), nullable=True),
+    sa.Column('title_en', sa.String(length=200), nullable=True),
+    sa.Column('content_ru', sa.Text(), nullable=True),
+    sa.Column('content_en', sa.Text(), nullable=True),
+    sa.ForeignKeyConstraint(['ranobe_id'], ['ranobe.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('bookmark',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('ranobe_id', sa.Integer(), nullable=False),
+    sa.Column('chapter_id', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['ranobe_id'], ['ranobe.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('ranobe_id', name='uix_1')
+    )
+
+
+def downgrade():
+    op.drop_table('bookmark')
+    op.drop_table('chapter')
+    op.drop_table('ranobe')
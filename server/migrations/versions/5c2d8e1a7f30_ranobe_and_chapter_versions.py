@@ -0,0 +1,42 @@
+"""ranobe and chapter versions
+
+Revision ID: 5c2d8e1a7f30
+Revises: 21fb88482e93
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5c2d8e1a7f30'
+down_revision = '21fb88482e93'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('ranobe', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+        batch_op.add_column(sa.Column('updated_at', sa.DateTime(), nullable=True))
+
+    with op.batch_alter_table('chapter', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+        batch_op.add_column(sa.Column('updated_at', sa.DateTime(), nullable=True))
+        batch_op.create_index('ix_chapter_ranobe_id_chapter_id', ['ranobe_id', 'chapter_id'], unique=False)
+
+    # SQLite не умеет ADD COLUMN с непостоянным значением по умолчанию
+    op.execute("UPDATE ranobe SET updated_at = CURRENT_TIMESTAMP")
+    op.execute("UPDATE chapter SET updated_at = CURRENT_TIMESTAMP")
+
+
+def downgrade():
+    with op.batch_alter_table('chapter', schema=None) as batch_op:
+        batch_op.drop_index('ix_chapter_ranobe_id_chapter_id')
+        batch_op.drop_column('updated_at')
+        batch_op.drop_column('version')
+
+    with op.batch_alter_table('ranobe', schema=None) as batch_op:
+        batch_op.drop_column('updated_at')
+        batch_op.drop_column('version')
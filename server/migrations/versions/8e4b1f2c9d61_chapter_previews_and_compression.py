@@ -0,0 +1,44 @@
+"""chapter previews and compression dictionaries
+
+Revision ID: 8e4b1f2c9d61
+Revises: 5c2d8e1a7f30
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8e4b1f2c9d61'
+down_revision = '5c2d8e1a7f30'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('compression_dictionary',
+    sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('lang', sa.String(length=2), nullable=False),
+    sa.Column('ranobe_id', sa.Integer(), nullable=True),
+    sa.Column('data', sa.LargeBinary(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['ranobe_id'], ['ranobe.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('chapter', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('content_preview_ru', sa.String(length=101), nullable=True))
+        batch_op.add_column(sa.Column('content_preview_en', sa.String(length=101), nullable=True))
+
+    # Тексты ещё не сжаты, превью можно посчитать прямо в SQL;
+    # сами тексты сжимает `flask compress-chapters`
+    op.execute("UPDATE chapter SET content_preview_ru = substr(content_ru, 1, 101), "
+               "content_preview_en = substr(content_en, 1, 101)")
+
+
+def downgrade():
+    with op.batch_alter_table('chapter', schema=None) as batch_op:
+        batch_op.drop_column('content_preview_en')
+        batch_op.drop_column('content_preview_ru')
+
+    op.drop_table('compression_dictionary')
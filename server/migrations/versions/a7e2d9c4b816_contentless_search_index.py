@@ -0,0 +1,72 @@
+"""contentless search index
+
+Revision ID: a7e2d9c4b816
+Revises: e1b7f3a05c92
+Create Date: 2026-10-21 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+import search
+from compression import codec
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7e2d9c4b816'
+down_revision = 'e1b7f3a05c92'
+branch_labels = None
+depends_on = None
+
+OLD_TABLE = search.FTS_TABLE + '_old'
+COLUMNS = ', '.join(search.FTS_COLUMNS)
+
+
+def table_sql(connection):
+    return connection.execute(
+        sa.text("SELECT sql FROM sqlite_master WHERE name = :name"), {'name': search.FTS_TABLE}
+    ).scalar()
+
+
+def upgrade():
+    # Индекс переносится из старой таблицы как есть: её копия текстов совпадает с тем,
+    # что индексировалось, а распаковывать главы для этого не нужно
+    connection = op.get_bind()
+    sql = table_sql(connection)
+    if sql is not None and "content=''" in sql:
+        return
+    if sql is not None:
+        op.execute(f"ALTER TABLE {search.FTS_TABLE} RENAME TO {OLD_TABLE}")
+    search.create_index(connection)
+    if sql is not None:
+        op.execute(f"INSERT INTO {search.FTS_TABLE} (rowid, {COLUMNS}) SELECT rowid, {COLUMNS} FROM {OLD_TABLE}")
+        op.execute(f"DROP TABLE {OLD_TABLE}")
+
+
+def downgrade():
+    # Прежняя таблица хранит тексты сама: они распаковываются из chapter
+    connection = op.get_bind()
+    op.execute(f"DROP TABLE IF EXISTS {search.FTS_TABLE}")
+    op.execute(
+        f"CREATE VIRTUAL TABLE {search.FTS_TABLE} USING fts5("
+        f"{COLUMNS}, ranobe_id UNINDEXED, tokenize='unicode61 remove_diacritics 2')"
+    )
+    insert = sa.text(
+        f"INSERT INTO {search.FTS_TABLE} (rowid, {COLUMNS}, ranobe_id) "
+        f"VALUES (:id, {', '.join(':' + column for column in search.FTS_COLUMNS)}, :ranobe_id)"
+    )
+    rows = connection.execution_options(yield_per=200).execute(
+        sa.text(f"SELECT id, ranobe_id, {COLUMNS} FROM chapter ORDER BY id")
+    )
+    for partition in rows.partitions():
+        connection.execute(insert, [
+            {
+                'id': row.id,
+                'ranobe_id': row.ranobe_id,
+                'title_en': row.title_en or '',
+                'title_ru': row.title_ru or '',
+                'content_en': codec.decompress(row.content_en) or '',
+                'content_ru': codec.decompress(row.content_ru) or '',
+            }
+            for row in partition
+        ])
@@ -0,0 +1,26 @@
+"""bookmark position inside the chapter
+
+Revision ID: a9d3e6f1c428
+Revises: f7a2c4e9b153
+Create Date: 2026-10-18 21:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a9d3e6f1c428'
+down_revision = 'f7a2c4e9b153'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('bookmark', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('position', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade():
+    with op.batch_alter_table('bookmark', schema=None) as batch_op:
+        batch_op.drop_column('position')
@@ -0,0 +1,54 @@
+"""unique chapter keys
+
+Revision ID: b3f6a9d2e417
+Revises: 8e4b1f2c9d61
+Create Date: 2026-10-18 16:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b3f6a9d2e417'
+down_revision = '8e4b1f2c9d61'
+branch_labels = None
+depends_on = None
+
+
+KEYS = ('chapter_id', 'chapter_number_origin')
+
+
+def duplicate_groups(connection, key):
+    return connection.execute(sa.text(
+        f"SELECT ranobe_id, {key}, GROUP_CONCAT(id) FROM chapter "
+        f"GROUP BY ranobe_id, {key} HAVING COUNT(*) > 1 ORDER BY ranobe_id, {key}"
+    )).all()
+
+
+def upgrade():
+    # ChapterList.post без индекса мог создать дубли. Какую из глав оставить, решает
+    # человек: миграция ничего не удаляет и останавливается со списком конфликтов
+    connection = op.get_bind()
+    conflicts = [
+        f'  ranobe_id={ranobe_id} {key}={value}: chapter.id {ids}'
+        for key in KEYS
+        for ranobe_id, value, ids in duplicate_groups(connection, key)
+    ]
+    if conflicts:
+        raise RuntimeError(
+            'Duplicate chapters block the unique indexes; delete or renumber the extra rows and rerun '
+            '"flask db upgrade":\n' + '\n'.join(conflicts)
+        )
+
+    with op.batch_alter_table('chapter', schema=None) as batch_op:
+        batch_op.drop_index('ix_chapter_ranobe_id_chapter_id')
+        batch_op.create_index('uix_chapter_ranobe_id_chapter_id', ['ranobe_id', 'chapter_id'], unique=True)
+        batch_op.create_index('uix_chapter_ranobe_id_chapter_number_origin', ['ranobe_id', 'chapter_number_origin'], unique=True)
+
+
+def downgrade():
+    with op.batch_alter_table('chapter', schema=None) as batch_op:
+        batch_op.drop_index('uix_chapter_ranobe_id_chapter_number_origin')
+        batch_op.drop_index('uix_chapter_ranobe_id_chapter_id')
+        batch_op.create_index('ix_chapter_ranobe_id_chapter_id', ['ranobe_id', 'chapter_id'], unique=False)
@@ -0,0 +1,30 @@
+"""chapter paragraph offsets
+
+Revision ID: c62e8b0d4f17
+Revises: a9d3e6f1c428
+Create Date: 2026-10-19 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c62e8b0d4f17'
+down_revision = 'a9d3e6f1c428'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Смещения существующих глав заполняет `flask --app app index-paragraphs`:
+    # тексты сжаты словарями, в SQL их не разобрать. До этого абзацы режутся при чтении.
+    with op.batch_alter_table('chapter', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('paragraphs_ru', sa.LargeBinary(), nullable=True))
+        batch_op.add_column(sa.Column('paragraphs_en', sa.LargeBinary(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('chapter', schema=None) as batch_op:
+        batch_op.drop_column('paragraphs_en')
+        batch_op.drop_column('paragraphs_ru')
@@ -0,0 +1,31 @@
+"""chapter translation status
+
+Revision ID: d41c7e5a9b28
+Revises: b3f6a9d2e417
+Create Date: 2026-10-18 16:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd41c7e5a9b28'
+down_revision = 'b3f6a9d2e417'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('chapter', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('translation_status', sa.String(length=16), nullable=True))
+        batch_op.add_column(sa.Column('translation_parts', sa.Integer(), nullable=True))
+
+    # Уже сохранённые переводы записаны целиком
+    op.execute("UPDATE chapter SET translation_status = 'complete' WHERE content_ru IS NOT NULL")
+
+
+def downgrade():
+    with op.batch_alter_table('chapter', schema=None) as batch_op:
+        batch_op.drop_column('translation_parts')
+        batch_op.drop_column('translation_status')
@@ -0,0 +1,29 @@
+"""search index table
+
+Revision ID: e1b7f3a05c92
+Revises: c62e8b0d4f17
+Create Date: 2026-10-20 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+import search
+
+
+# revision identifiers, used by Alembic.
+revision = 'e1b7f3a05c92'
+down_revision = 'c62e8b0d4f17'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Раньше таблицу создавал импорт app.py, так что в рабочих базах она обычно уже есть.
+    # Новая пустая таблица в базе с главами заполняется `flask --app app search-backfill`.
+    search.create_index(op.get_bind())
+
+
+def downgrade():
+    # Таблица старше этой миграции, удалять её при откате нельзя
+    pass
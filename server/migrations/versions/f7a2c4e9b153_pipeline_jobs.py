@@ -0,0 +1,47 @@
+"""pipeline jobs
+
+Revision ID: f7a2c4e9b153
+Revises: d41c7e5a9b28
+Create Date: 2026-10-18 19:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f7a2c4e9b153'
+down_revision = 'd41c7e5a9b28'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('job',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('stage', sa.String(length=16), nullable=False),
+    sa.Column('ranobe_id', sa.Integer(), nullable=False),
+    sa.Column('chapter_number_origin', sa.Integer(), nullable=False),
+    sa.Column('chapter_id', sa.Integer(), nullable=True),
+    sa.Column('status', sa.String(length=16), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('payload', sa.Text(), nullable=True),
+    sa.Column('result', sa.String(length=16), nullable=True),
+    sa.Column('error', sa.Text(), nullable=True),
+    sa.Column('worker', sa.String(length=100), nullable=True),
+    sa.Column('available_at', sa.DateTime(), nullable=False),
+    sa.Column('lease_until', sa.DateTime(), nullable=True),
+    sa.Column('started_at', sa.DateTime(), nullable=True),
+    sa.Column('finished_at', sa.DateTime(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['ranobe_id'], ['ranobe.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('job', schema=None) as batch_op:
+        batch_op.create_index('uix_job_stage_ranobe_id_chapter_number_origin', ['stage', 'ranobe_id', 'chapter_number_origin'], unique=True)
+        batch_op.create_index('ix_job_stage_status_available_at', ['stage', 'status', 'available_at'], unique=False)
+        batch_op.create_index('ix_job_stage_finished_at', ['stage', 'finished_at'], unique=False)
+
+
+def downgrade():
+    op.drop_table('job')
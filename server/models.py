@@ -0,0 +1,250 @@
+"""Модели базы данных и запись глав, общие для app.py и ingest.py.
+
+Модуль не создаёт Flask-приложение: app.py подключает db через
+db.init_app, а ingest.py работает с теми же таблицами через обычную
+сессию SQLAlchemy, не поднимая веб-приложение.
+"""
+import json
+
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import case, event, func, select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
+import search
+from compression import CompressedText
+from paragraphs import paragraph_offsets
+from storage import RoutingSession
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+# Модели базы данных
+class Ranobe(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    title = db.Column(db.String(100), nullable=False)
+    # Растёт при любой записи в ранобэ или его главы
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    updated_at = db.Column(db.DateTime, default=db.func.current_timestamp(), onupdate=db.func.current_timestamp())
+    chapters = db.relationship('Chapter', backref='ranobe', lazy=True)
+
+class Chapter(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    ranobe_id = db.Column(db.Integer, db.ForeignKey('ranobe.id'), nullable=False)
+    chapter_id = db.Column(db.Integer, nullable=False)  # New field
+    chapter_number_origin = db.Column(db.Integer, nullable=False)  # Renamed from chapter_number
+    title_ru = db.Column(db.String(200))
+    title_en = db.Column(db.String(200))
+    # Тела глав хранятся сжатыми и грузятся только по явному запросу (см. chapter_query)
+    content_ru = db.deferred(db.Column(CompressedText('ru')), group='content')
+    content_en = db.deferred(db.Column(CompressedText('en')), group='content')
+    # Начало текста для оглавления, обновляется при записи content_*
+    content_preview_ru = db.Column(db.String(101))
+    content_preview_en = db.Column(db.String(101))
+    # Смещения абзацев в content_* (paragraphs.py), тоже обновляются при записи
+    paragraphs_ru = db.deferred(db.Column(db.LargeBinary), group='paragraphs')
+    paragraphs_en = db.deferred(db.Column(db.LargeBinary), group='paragraphs')
+    # None, in_progress (перевод дописывается частями) или complete
+    translation_status = db.Column(db.String(16))
+    translation_parts = db.Column(db.Integer)  # Сколько частей перевода уже дописано
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    updated_at = db.Column(db.DateTime, default=db.func.current_timestamp(), onupdate=db.func.current_timestamp())
+
+    __table_args__ = (
+        db.Index('uix_chapter_ranobe_id_chapter_id', 'ranobe_id', 'chapter_id', unique=True),
+        db.Index('uix_chapter_ranobe_id_chapter_number_origin', 'ranobe_id', 'chapter_number_origin', unique=True),
+    )
+
+class CompressionDictionary(db.Model):
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)  # zstd dict_id
+    lang = db.Column(db.String(2), nullable=False)
+    ranobe_id = db.Column(db.Integer, db.ForeignKey('ranobe.id'))  # None - обучен на всех ранобэ
+    data = db.Column(db.LargeBinary, nullable=False)
+    created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
+
+class Bookmark(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    ranobe_id = db.Column(db.Integer, db.ForeignKey('ranobe.id'), nullable=False)
+    chapter_id = db.Column(db.Integer, nullable=False)
+    # Позиция внутри главы (абзац или смещение прокрутки, решает фронтенд), см. progress.py
+    position = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
+    updated_at = db.Column(db.DateTime, default=db.func.current_timestamp(), onupdate=db.func.current_timestamp())
+
+    ranobe = db.relationship('Ranobe', backref=db.backref('bookmarks', lazy=True))
+
+    __table_args__ = (db.UniqueConstraint('ranobe_id', name='uix_1'),)
+
+class Job(db.Model):
+    '''One pipeline stage (scrape, ingest, translate) for one chapter, see jobs.py'''
+    id = db.Column(db.Integer, primary_key=True)
+    stage = db.Column(db.String(16), nullable=False)
+    ranobe_id = db.Column(db.Integer, db.ForeignKey('ranobe.id'), nullable=False)
+    chapter_number_origin = db.Column(db.Integer, nullable=False)
+    chapter_id = db.Column(db.Integer)  # Известен после scrape
+    # pending, leased, done или failed (попытки кончились)
+    status = db.Column(db.String(16), nullable=False, default='pending')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    payload = db.Column(db.Text)  # JSON для обработчика стадии, очищается после выполнения
+    result = db.Column(db.String(16))
+    error = db.Column(db.Text)
+    worker = db.Column(db.String(100))
+    available_at = db.Column(db.DateTime, nullable=False)  # Повтор не раньше этого времени
+    lease_until = db.Column(db.DateTime)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
+
+    __table_args__ = (
+        db.Index('uix_job_stage_ranobe_id_chapter_number_origin', 'stage', 'ranobe_id', 'chapter_number_origin', unique=True),
+        db.Index('ix_job_stage_status_available_at', 'stage', 'status', 'available_at'),
+        db.Index('ix_job_stage_finished_at', 'stage', 'finished_at'),
+    )
+
+
+def create_schema(engine):
+    '''All model tables plus the search index, for a new database'''
+    db.metadata.create_all(engine)
+    with engine.begin() as connection:
+        search.create_index(connection)
+
+
+def drop_schema(engine):
+    '''Drop the search index and all model tables, so create_schema starts from scratch'''
+    with engine.begin() as connection:
+        search.drop_index(connection)
+    db.metadata.drop_all(engine)
+
+
+# Проекции глав
+CONTENT_LANGS = ('ru', 'en')
+PREVIEW_LENGTH = 100
+
+def content_preview(content, max_length=PREVIEW_LENGTH):
+    '''Stored preview: one extra character tells that the content is longer'''
+    return content[:max_length + 1] if content is not None else None
+
+@event.listens_for(Chapter.content_ru, 'set')
+def update_preview_ru(target, value, oldvalue, initiator):
+    target.content_preview_ru = content_preview(value)
+
+@event.listens_for(Chapter.content_en, 'set')
+def update_preview_en(target, value, oldvalue, initiator):
+    target.content_preview_en = content_preview(value)
+
+@event.listens_for(Chapter.content_ru, 'set')
+def update_paragraphs_ru(target, value, oldvalue, initiator):
+    target.paragraphs_ru = paragraph_offsets(value)
+
+@event.listens_for(Chapter.content_en, 'set')
+def update_paragraphs_en(target, value, oldvalue, initiator):
+    target.paragraphs_en = paragraph_offsets(value)
+
+TRANSLATION_IN_PROGRESS = 'in_progress'
+TRANSLATION_COMPLETE = 'complete'
+
+@event.listens_for(Chapter.content_ru, 'set')
+def update_translation_status(target, value, oldvalue, initiator):
+    # Запись целого перевода; дозапись по частям сама выставляет in_progress
+    target.translation_status = TRANSLATION_COMPLETE if value is not None else None
+    target.translation_parts = None
+
+def ranobe_version_bump(ranobe_id):
+    '''UPDATE that marks a ranobe as changed'''
+    return (
+        update(Ranobe)
+        .where(Ranobe.id == ranobe_id)
+        .values(version=Ranobe.version + 1, updated_at=func.current_timestamp())
+    )
+
+
+# Пакетная запись глав
+CHAPTER_FIELDS = ('ranobe_id', 'chapter_id', 'chapter_number_origin', 'title_ru', 'title_en', 'content_ru', 'content_en')
+
+def validate_chapter_item(item):
+    if isinstance(item, ValueError):
+        return f'Invalid JSON: {item}'
+    if not isinstance(item, dict):
+        return 'Item must be an object'
+    for key in ('ranobe_id', 'chapter_id', 'chapter_number_origin'):
+        if type(item.get(key)) is not int:
+            return f"'{key}' must be an integer"
+    for key in ('title_ru', 'title_en', 'content_ru', 'content_en'):
+        if item.get(key) is not None and not isinstance(item[key], str):
+            return f"'{key}' must be a string"
+    return None
+
+def chapter_upsert_statement(item):
+    '''INSERT ... ON CONFLICT (ranobe_id, chapter_id) DO UPDATE for one chapter'''
+    table = Chapter.__table__
+    values = {key: item.get(key) for key in CHAPTER_FIELDS}
+    for lang in CONTENT_LANGS:
+        values[f'content_preview_{lang}'] = content_preview(values[f'content_{lang}'])
+        values[f'paragraphs_{lang}'] = paragraph_offsets(values[f'content_{lang}'])
+    values['translation_status'] = TRANSLATION_COMPLETE if values['content_ru'] is not None else None
+    statement = sqlite_insert(table).values(**values)
+    # Как в ChapterList.post: отсутствующие поля не затирают сохранённые
+    updates = {
+        key: func.coalesce(statement.excluded[key], table.c[key])
+        for key in values if key not in ('ranobe_id', 'chapter_id')
+    }
+    updates.update(
+        # Новый целый перевод сбрасывает счётчик дописанных частей
+        translation_parts=case((statement.excluded.content_ru.is_(None), table.c.translation_parts), else_=None),
+        version=table.c.version + 1,
+        updated_at=func.current_timestamp()
+    )
+    return statement.on_conflict_do_update(
+        index_elements=['ranobe_id', 'chapter_id'], set_=updates
+    ).returning(
+        table.c.id, table.c.ranobe_id, table.c.version,
+        table.c.title_en, table.c.title_ru, table.c.content_en, table.c.content_ru
+    )
+
+def write_chapter_batch(session, batch):
+    '''Upsert (index, item) pairs into the session's transaction, one savepoint per item.
+
+    Does not commit. Returns (results, touched), where touched maps every
+    changed ranobe_id to True when a new chapter was created in it.
+    '''
+    results = []
+    valid = []
+    for index, item in batch:
+        error = validate_chapter_item(item)
+        if error:
+            results.append({'index': index, 'status': 'error', 'error': error})
+        else:
+            valid.append((index, item))
+
+    ranobe_ids = {item['ranobe_id'] for _, item in valid}
+    existing = set(session.scalars(select(Ranobe.id).where(Ranobe.id.in_(ranobe_ids))))
+    touched = {}
+    for index, item in valid:
+        result = {'index': index, 'ranobe_id': item['ranobe_id'], 'chapter_id': item['chapter_id']}
+        if item['ranobe_id'] not in existing:
+            result.update(status='error', error='Ranobe not found')
+        else:
+            try:
+                with session.begin_nested():
+                    # Старая запись индекса удаляется по тексту, который ещё не перезаписан
+                    search.unindex_chapters(session, Chapter, Chapter.ranobe_id == item['ranobe_id'],
+                                            Chapter.chapter_id == item['chapter_id'])
+                    row = session.execute(chapter_upsert_statement(item)).one()
+                    search.index_chapter(session, row)
+            except IntegrityError:
+                result.update(status='error', error='chapter_number_origin is taken by another chapter')
+            else:
+                created = row.version == 1
+                result.update(id=row.id, status='created' if created else 'updated')
+                touched[row.ranobe_id] = touched.get(row.ranobe_id, False) or created
+        results.append(result)
+
+    for ranobe_id in touched:
+        session.execute(ranobe_version_bump(ranobe_id))
+    return sorted(results, key=lambda result: result['index']), touched
+
+def iter_ndjson(stream):
+    for line in stream:
+        if line.strip():
+            try:
+                yield json.loads(line)
+            except ValueError as e:
+                yield e
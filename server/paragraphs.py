@@ -0,0 +1,92 @@
+"""Абзацы глав: смещения считаются при записи, чтение диапазона не сканирует текст.
+
+Абзац - кусок текста между '\\n', как их выдаёт parser.py. Для каждого
+языка в колонке paragraphs_<lang> хранится упакованный массив uint32
+little-endian (4 байта на смещение, без заголовка): смещение начала
+каждого абзаца в UTF-8 байтах текста и в конце длина текста + 1. Абзацы
+offset..offset+limit - это один срез байтов между двумя смещениями,
+распаковывается текст только до конца среза, декодируется только срез.
+"""
+import struct
+import sys
+from array import array
+
+OFFSET_TYPECODE = 'I'  # uint32 в памяти; в базе всегда little-endian (OFFSET_FORMAT)
+OFFSET_FORMAT = '<I'
+OFFSET_SIZE = struct.calcsize(OFFSET_FORMAT)
+# На big-endian массив переворачивается при упаковке и распаковке
+SWAP_BYTES = sys.byteorder != 'little'
+
+
+def paragraph_offsets(text):
+    '''Packed start offsets of the paragraphs of text (plus the end sentinel), or None for no text'''
+    if text is None:
+        return None
+    raw = text.encode('utf-8')
+    offsets = array(OFFSET_TYPECODE, [0])
+    position = raw.find(b'\n')
+    while position != -1:
+        offsets.append(position + 1)
+        position = raw.find(b'\n', position + 1)
+    offsets.append(len(raw) + 1)
+    if SWAP_BYTES:
+        offsets.byteswap()
+    return offsets.tobytes()
+
+
+def unpack_offsets(packed):
+    offsets = array(OFFSET_TYPECODE)
+    offsets.frombytes(packed)
+    if SWAP_BYTES:
+        offsets.byteswap()
+    return offsets
+
+
+def paragraph_count(packed):
+    return len(packed) // OFFSET_SIZE - 1 if packed else 0
+
+
+def range_size(packed, offset=0, limit=None):
+    '''Bytes at the start of the body that the range needs, or None when the whole body is needed'''
+    if packed is None:
+        return None
+    start, end, total = _bounds(paragraph_count(packed), offset, limit)
+    if start >= end:
+        return 0
+    return struct.unpack_from(OFFSET_FORMAT, packed, end * OFFSET_SIZE)[0] - 1
+
+
+def paragraph_range(raw, packed, offset=0, limit=None):
+    '''Paragraphs offset..offset+limit of the UTF-8 body raw, using its stored offsets.
+
+    Returns (paragraphs, total). Without stored offsets (rows written
+    before they existed) the body is split instead.
+    '''
+    if packed is None:
+        paragraphs = raw.decode('utf-8').split('\n')
+        end = len(paragraphs) if limit is None else offset + limit
+        return paragraphs[offset:end], len(paragraphs)
+
+    offsets = unpack_offsets(packed)
+    start, end, total = _bounds(len(offsets) - 1, offset, limit)
+    if start >= end:
+        return [], total
+    # Последний абзац среза заканчивается перед '\n' следующего (или перед концом текста)
+    return raw[offsets[start]:offsets[end] - 1].decode('utf-8').split('\n'), total
+
+
+def iter_paragraphs(raw, packed, offset=0, limit=None):
+    '''(total, iterator) over the same range, decoding one paragraph at a time for streaming'''
+    if packed is None:
+        paragraphs, total = paragraph_range(raw, packed, offset, limit)
+        return total, iter(paragraphs)
+
+    offsets = unpack_offsets(packed)
+    start, end, total = _bounds(len(offsets) - 1, offset, limit)
+    return total, (raw[offsets[i]:offsets[i + 1] - 1].decode('utf-8') for i in range(start, end))
+
+
+def _bounds(total, offset, limit):
+    start = min(offset, total)
+    end = total if limit is None else min(start + limit, total)
+    return start, end, total
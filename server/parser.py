@@ -1,7 +1,17 @@
-import requests
-from bs4 import BeautifulSoup
-import json
+import argparse
+import asyncio
+import os
 import re
+import sqlite3
+import time
+from contextlib import asynccontextmanager
+from urllib.parse import urlsplit
+
+import httpx
+import requests
+
+from extractors import DEFAULT_CHAIN, EXTRACTORS, extract_chapter_data
+from ratelimit import backoff_delay, parse_duration
 
 # Parser settings
 BASE_URL = "https://wtr-lab.com/en/serie-619/losing-money-to-be-a-tycoon/chapter-{}"
@@ -12,58 +22,64 @@ RANOBE_ID = 1  # ID of the existing ranobe in the database
 # URL of your API for creating a new chapter
 API_URL = "http://127.0.0.1:3000/chapters/"  # Updated to match your Flask API endpoint
 
+# Crawler settings (--crawl)
+CONCURRENCY = 8  # pages in flight overall
+PER_HOST_CONCURRENCY = 4
+POLITENESS_DELAY = 0.25  # seconds between request starts to one host
+MAX_ATTEMPTS = 5
+BACKOFF_BASE = 1  # seconds
+BACKOFF_CAP = 30  # seconds
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+SAVE_BATCH_SIZE = 20  # chapters per POST /chapters/bulk or per transaction with --output db
+STATE_PATH = os.getenv("PARSER_STATE_PATH", "parser_state.db")
+USER_AGENT = "Mozilla/5.0 (compatible; ranoberead-parser)"
+# Extractors tried in order on every page, see extractors.py
+EXTRACTOR_CHAIN = DEFAULT_CHAIN
+
 def fetch_chapter_content(chapter_number_origin):
     url = BASE_URL.format(chapter_number_origin)
     response = requests.get(url)
     if response.status_code != 200:
         print(f"Failed to fetch chapter {chapter_number_origin}")
         return None
-    
-    soup = BeautifulSoup(response.text, 'html.parser')
-    
-    script_tag = soup.find('script', id='__NEXT_DATA__')
-    if not script_tag:
+    return parse_chapter_page(response.content, chapter_number_origin)
+
+def parse_chapter_page(page, chapter_number_origin):
+    chapter_data = extract_chapter_data(page, EXTRACTOR_CHAIN)
+    if chapter_data is None:
         print(f"Could not find JSON data for chapter {chapter_number_origin}")
         return None
-    
-    json_data = json.loads(script_tag.string)
-    
-    try:
-        full_title = json_data['props']['pageProps']['serie']['chapter_data']['data']['title']
-        
-        chapter_id_match = re.match(r'Chapter (\d+)', full_title)
-        if not chapter_id_match:
-            print(f"Could not extract chapter ID from title: {full_title}")
-            return None
-        
-        chapter_id = int(chapter_id_match.group(1))
-        title_en = full_title.replace(f"Chapter {chapter_id}", "").strip()
 
-        chapter_body = json_data['props']['pageProps']['serie']['chapter_data']['data']['body']
-        content_en = '\n'.join(chapter_body)
-        
-        return {
-            'chapter_id': chapter_id,
-            'chapter_number_origin': chapter_number_origin,
-            'title_en': title_en,
-            'content_en': content_en
-        }
-    except KeyError as e:
-        print(f"Error extracting chapter content: {e}")
-        print("JSON structure:")
-        print(json.dumps(json_data, indent=2))
+    full_title = chapter_data['title']
+    chapter_id_match = re.match(r'Chapter (\d+)', full_title)
+    if not chapter_id_match:
+        print(f"Could not extract chapter ID from title: {full_title}")
         return None
 
-def save_chapter_to_api(chapter_data):
-    print(f"Saving chapter {chapter_data['chapter_number_origin']} to API...")
-    
-    data = {
+    chapter_id = int(chapter_id_match.group(1))
+    title_en = full_title.replace(f"Chapter {chapter_id}", "").strip()
+    content_en = '\n'.join(chapter_data['body'])
+
+    return {
+        'chapter_id': chapter_id,
+        'chapter_number_origin': chapter_number_origin,
+        'title_en': title_en,
+        'content_en': content_en
+    }
+
+def chapter_payload(chapter_data):
+    return {
         "ranobe_id": RANOBE_ID,
         "chapter_id": chapter_data['chapter_id'],
         "chapter_number_origin": chapter_data['chapter_number_origin'],
         "title_en": chapter_data['title_en'],
         "content_en": chapter_data['content_en']
     }
+
+def save_chapter_to_api(chapter_data):
+    print(f"Saving chapter {chapter_data['chapter_number_origin']} to API...")
+    
+    data = chapter_payload(chapter_data)
     
     try:
         response = requests.post(API_URL, json=data)
@@ -76,14 +92,246 @@ def save_chapter_to_api(chapter_data):
     except requests.RequestException as e:
         print(f"Error occurred while saving chapter {chapter_data['chapter_number_origin']}: {e}")
 
-def main():
+def save_chapters_to_db(ingest, batch):
+    """Write parsed chapters straight into the database (ingest.py), one transaction per batch"""
+    results = ingest.write_batch([chapter_payload(chapter) for chapter in batch])
+    for chapter, result in zip(batch, results):
+        if result['status'] == 'error':
+            print(f"Failed to save chapter {chapter['chapter_number_origin']}: {result['error']}")
+        else:
+            print(f"Successfully saved/updated chapter {chapter['chapter_number_origin']}")
+    return results
+
+class CrawlState:
+    """Per-chapter outcome of crawler runs (saved, failed, missing), so a run resumes where the last one stopped"""
+
+    def __init__(self, path=STATE_PATH):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS chapter (
+                base_url TEXT NOT NULL,
+                chapter_number_origin INTEGER NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (base_url, chapter_number_origin)
+            )
+        ''')
+        self.conn.commit()
+
+    def pending(self, base_url, chapter_numbers, retry_failed=True):
+        skip = ('saved', 'missing') if retry_failed else ('saved', 'missing', 'failed')
+        done = {
+            number for number, status in self.conn.execute(
+                'SELECT chapter_number_origin, status FROM chapter WHERE base_url = ?', (base_url,))
+            if status in skip
+        }
+        return [number for number in chapter_numbers if number not in done]
+
+    def mark(self, base_url, chapter_number_origin, status, error=None):
+        with self.conn:
+            self.conn.execute(
+                'INSERT INTO chapter (base_url, chapter_number_origin, status, attempts, error, updated_at) '
+                'VALUES (?, ?, ?, 1, ?, ?) ON CONFLICT (base_url, chapter_number_origin) DO UPDATE SET '
+                'status = excluded.status, attempts = attempts + 1, error = excluded.error, updated_at = excluded.updated_at',
+                (base_url, chapter_number_origin, status, error, time.time())
+            )
+
+    def summary(self, base_url):
+        return dict(self.conn.execute(
+            'SELECT status, COUNT(*) FROM chapter WHERE base_url = ? GROUP BY status', (base_url,)))
+
+class HostLimiter:
+    """At most per_host requests in flight per host, and request starts at least delay seconds apart"""
+
+    def __init__(self, per_host=PER_HOST_CONCURRENCY, delay=POLITENESS_DELAY):
+        self.per_host = per_host
+        self.delay = delay
+        self.slots = {}
+        self.locks = {}
+        self.next_start = {}
+
+    @asynccontextmanager
+    async def slot(self, url):
+        host = urlsplit(url).netloc
+        async with self.slots.setdefault(host, asyncio.Semaphore(self.per_host)):
+            async with self.locks.setdefault(host, asyncio.Lock()):
+                wait = self.next_start.get(host, 0) - time.monotonic()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                self.next_start[host] = time.monotonic() + self.delay
+            yield
+
+async def fetch_page(http, hosts, url, label):
+    """(html, status, error): status is ok, missing (the page does not exist) or failed (retries exhausted)"""
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        retry_after = None
+        try:
+            async with hosts.slot(url):
+                response = await http.get(url)
+            if response.status_code == 200:
+                return response.content, 'ok', None
+            error = f"HTTP {response.status_code}"
+            if response.status_code not in RETRY_STATUSES:
+                return None, 'missing' if response.status_code == 404 else 'failed', error
+            retry_after = parse_duration(response.headers.get('retry-after'))
+        except httpx.TransportError as e:
+            error = str(e) or type(e).__name__
+        if attempt == MAX_ATTEMPTS:
+            break
+        delay = max(backoff_delay(attempt, BACKOFF_BASE, BACKOFF_CAP), retry_after or 0)
+        print(f"Failed to fetch {label} ({error}), attempt {attempt}/{MAX_ATTEMPTS}. Retrying in {delay:.1f} seconds...")
+        await asyncio.sleep(delay)
+    print(f"Failed to fetch {label}: {error}")
+    return None, 'failed', error
+
+async def post_chapters(http, api_url, batch):
+    """POST /chapters/bulk with retries; per-item results or None"""
+    payload = [chapter_payload(chapter) for chapter in batch]
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        try:
+            response = await http.post(f"{api_url.rstrip('/')}/bulk", json=payload)
+            response.raise_for_status()
+            return response.json()['items']
+        except httpx.HTTPError as e:
+            if attempt == MAX_ATTEMPTS:
+                print(f"Error occurred while saving {len(batch)} chapters: {e}")
+                return None
+            delay = backoff_delay(attempt, BACKOFF_BASE, BACKOFF_CAP)
+            print(f"Error occurred while saving {len(batch)} chapters: {e}. Retrying in {delay:.1f} seconds...")
+            await asyncio.sleep(delay)
+
+async def save_chapters(http, queue, state, base_url, api_url, ingest=None):
+    """Saving stage of the pipeline: drains parsed chapters from the queue in batches, to the API or to ingest"""
+    finished = False
+    while not finished:
+        batch = [await queue.get()]
+        while len(batch) < SAVE_BATCH_SIZE and not queue.empty():
+            batch.append(queue.get_nowait())
+        if batch[-1] is None:
+            finished = True
+            batch.pop()
+        if not batch:
+            continue
+
+        if ingest is not None:
+            try:
+                # Запись в базу синхронная, цикл событий тем временем качает страницы
+                results = await asyncio.to_thread(ingest.write_batch, [chapter_payload(chapter) for chapter in batch])
+            except Exception as e:
+                print(f"Error occurred while saving {len(batch)} chapters: {e}")
+                results = None
+        else:
+            results = await post_chapters(http, api_url, batch)
+        for i, chapter in enumerate(batch):
+            result = results[i] if results else {'status': 'error', 'error': 'Saving failed'}
+            if result['status'] == 'error':
+                state.mark(base_url, chapter['chapter_number_origin'], 'failed', result.get('error'))
+            else:
+                state.mark(base_url, chapter['chapter_number_origin'], 'saved')
+        print(f"Saved {sum(1 for r in results or [] if r['status'] != 'error')} of {len(batch)} chapters "
+              f"({batch[0]['chapter_number_origin']}..{batch[-1]['chapter_number_origin']})")
+
+async def crawl(chapter_numbers, base_url=BASE_URL, api_url=API_URL, state=None,
+                concurrency=CONCURRENCY, per_host=PER_HOST_CONCURRENCY, delay=POLITENESS_DELAY, retry_failed=True,
+                ingest=None):
+    """Fetch, parse and save chapters concurrently; chapters saved by earlier runs are skipped.
+
+    With ingest (ingest.ChapterIngest) chapters go straight into the database instead of api_url.
+    """
+    state = state or CrawlState()
+    pending = state.pending(base_url, chapter_numbers, retry_failed)
+    print(f"{len(pending)} of {len(chapter_numbers)} chapters to fetch...")
+
+    # Bounded queue: fetching waits for saving instead of piling up parsed chapters
+    queue = asyncio.Queue(maxsize=SAVE_BATCH_SIZE * 2)
+    hosts = HostLimiter(per_host, delay)
+    fetch_slots = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency + 2, max_keepalive_connections=concurrency + 2)
+    async with httpx.AsyncClient(timeout=30, limits=limits, follow_redirects=True,
+                                 headers={"User-Agent": USER_AGENT}) as http:
+        async def fetch(chapter_number_origin):
+            async with fetch_slots:
+                html, status, error = await fetch_page(
+                    http, hosts, base_url.format(chapter_number_origin), f"chapter {chapter_number_origin}")
+            chapter = parse_chapter_page(html, chapter_number_origin) if html is not None else None
+            if chapter:
+                await queue.put(chapter)
+            else:
+                state.mark(base_url, chapter_number_origin, status if html is None else 'failed',
+                           error if html is None else 'Could not parse the page')
+
+        saver = asyncio.create_task(save_chapters(http, queue, state, base_url, api_url, ingest))
+        fetchers = asyncio.gather(*(fetch(number) for number in pending))
+        try:
+            # Без записи загрузка повисла бы на полной очереди: ошибка любой стороны останавливает обе.
+            # До None в очереди запись заканчивается только ошибкой
+            await asyncio.wait((saver, fetchers), return_when=asyncio.FIRST_COMPLETED)
+            if saver.done():
+                saver.result()
+            await fetchers
+            await queue.put(None)
+            await saver
+        finally:
+            saver.cancel()
+            fetchers.cancel()
+            await asyncio.gather(saver, fetchers, return_exceptions=True)
+
+    summary = state.summary(base_url)
+    print(f"Crawl finished: {summary}")
+    return summary
+
+def main(ingest=None):
+    pending = []
     for i in range(NUM_CHAPTERS):
         chapter_number_origin = START_CHAPTER + i
         print(f"Fetching chapter {chapter_number_origin}...")
         chapter_data = fetch_chapter_content(chapter_number_origin)
-        if chapter_data:
+        if chapter_data and ingest is not None:
+            pending.append(chapter_data)
+            if len(pending) >= SAVE_BATCH_SIZE:
+                save_chapters_to_db(ingest, pending)
+                pending = []
+        elif chapter_data:
             save_chapter_to_api(chapter_data)
         print("------------------------")
+    if pending:
+        save_chapters_to_db(ingest, pending)
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Scrape chapters into the API")
+    parser.add_argument("--crawl", action="store_true", help="Concurrent crawler with retries and resumable state")
+    parser.add_argument("--start", type=int, default=START_CHAPTER)
+    parser.add_argument("--count", type=int, default=NUM_CHAPTERS)
+    parser.add_argument("--base-url", default=BASE_URL)
+    parser.add_argument("--api-url", default=API_URL)
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY)
+    parser.add_argument("--per-host", type=int, default=PER_HOST_CONCURRENCY)
+    parser.add_argument("--delay", type=float, default=POLITENESS_DELAY, help="Politeness delay per host, seconds")
+    parser.add_argument("--state", default=STATE_PATH)
+    parser.add_argument("--extractor", choices=sorted(EXTRACTORS), action="append",
+                        help="Extractor to try, in order (repeatable). Default: " + ", ".join(DEFAULT_CHAIN))
+    parser.add_argument("--skip-failed", action="store_true", help="Do not retry chapters that failed in earlier runs")
+    parser.add_argument("--output", choices=("api", "db"), default="api",
+                        help="api: POST to --api-url; db: write straight into RANOBE_DATABASE_URI (ingest.py)")
+    parser.add_argument("--ranobe-id", type=int, default=RANOBE_ID)
+    args = parser.parse_args()
+    if args.extractor:
+        EXTRACTOR_CHAIN = tuple(args.extractor)
+    RANOBE_ID = args.ranobe_id
+
+    ingest = None
+    if args.output == "db":
+        from ingest import ChapterIngest
+        ingest = ChapterIngest()
+
+    if args.crawl:
+        asyncio.run(crawl(
+            range(args.start, args.start + args.count), args.base_url, args.api_url, CrawlState(args.state),
+            args.concurrency, args.per_host, args.delay, not args.skip_failed, ingest
+        ))
+    else:
+        BASE_URL, API_URL, START_CHAPTER, NUM_CHAPTERS = args.base_url, args.api_url, args.start, args.count
+        main(ingest)
@@ -0,0 +1,174 @@
+"""Resumable scrape -> ingest -> translate pipeline on top of the job queue in jobs.py.
+
+    python pipeline.py enqueue --ranobe-id 1 --start 899 --count 12 --base-url "https://.../chapter-{}"
+    python pipeline.py run --until-empty       # all stages; --stages scrape,ingest for no OpenAI
+    python pipeline.py status                  # same numbers as GET /jobs/status
+
+Stages run as producer/consumer workers in one process, each with its own
+concurrency. Several runners (or runners on different stages) can share the
+database: jobs are leased, and a lease that is not renewed expires, so jobs
+of a crashed runner are picked up again. Every handler is safe to repeat:
+scraping only reads, ingest upserts, translate skips chapters the
+translation memory already marked done.
+
+scrape fetches and parses the page (parser.py) and passes the chapter to
+ingest in the job payload; ingest writes batches straight into the
+database (ingest.py); translate runs translator.process_chapter, which
+reads and writes through the API at RANOBE_API_URL.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import socket
+
+import httpx
+
+import parser as chapter_parser
+from ingest import ChapterIngest, create_write_engine
+from jobs import STAGES, JobQueue
+
+SCRAPE_CONCURRENCY = chapter_parser.CONCURRENCY
+TRANSLATE_CONCURRENCY = 2
+INGEST_BATCH_SIZE = chapter_parser.SAVE_BATCH_SIZE
+# Аренда продлевается каждую треть срока, пока обработчик работает
+LEASE_SECONDS = {'scrape': 120, 'ingest': 120, 'translate': 600}
+MAX_ATTEMPTS = 5
+POLL_INTERVAL = 2  # seconds between looks into an empty queue
+
+logger = logging.getLogger(__name__)
+
+
+class Pipeline:
+    def __init__(self, queue, ingest=None, scrape_concurrency=SCRAPE_CONCURRENCY,
+                 translate_concurrency=TRANSLATE_CONCURRENCY, ingest_batch_size=INGEST_BATCH_SIZE):
+        self.queue = queue
+        self.ingest = ingest
+        self.concurrency = {'scrape': scrape_concurrency, 'ingest': 1, 'translate': translate_concurrency}
+        self.batch_size = {'scrape': 1, 'ingest': ingest_batch_size, 'translate': 1}
+        self.worker_prefix = f"{socket.gethostname()}:{os.getpid()}"
+        self.hosts = chapter_parser.HostLimiter()
+        self.until_empty = False
+
+    async def keep_leased(self, stage, job_ids, worker):
+        while True:
+            await asyncio.sleep(LEASE_SECONDS[stage] / 3)
+            await asyncio.to_thread(self.queue.renew, job_ids, worker, LEASE_SECONDS[stage])
+
+    async def worker(self, stage, index, handler, upstream):
+        worker = f"{self.worker_prefix}:{stage}-{index}"
+        while True:
+            jobs = await asyncio.to_thread(
+                self.queue.lease, stage, worker, self.batch_size[stage], LEASE_SECONDS[stage])
+            if not jobs:
+                # Пустая очередь - конец, только если и предыдущие стадии больше ничего не дадут
+                if self.until_empty and not await asyncio.to_thread(self.queue.active, upstream):
+                    return
+                await asyncio.sleep(POLL_INTERVAL)
+                continue
+            heartbeat = asyncio.create_task(self.keep_leased(stage, [job['id'] for job in jobs], worker))
+            try:
+                await handler(jobs, worker)
+            except Exception as e:
+                logger.exception('%s failed for %d jobs', stage, len(jobs))
+                for job in jobs:
+                    await asyncio.to_thread(self.queue.fail, job, worker, e)
+            finally:
+                heartbeat.cancel()
+
+    async def scrape(self, jobs, worker):
+        for job in jobs:
+            number = job['chapter_number_origin']
+            url = job['payload']['base_url'].format(number)
+            page, status, error = await chapter_parser.fetch_page(self.http, self.hosts, url, f"chapter {number}")
+            if status == 'missing':
+                await asyncio.to_thread(self.queue.complete, job, worker, 'missing')
+                continue
+            chapter = chapter_parser.parse_chapter_page(page, number) if page is not None else None
+            if chapter is None:
+                await asyncio.to_thread(self.queue.fail, job, worker, error or 'Could not parse the page')
+                continue
+            chapter = {'ranobe_id': job['ranobe_id'], **chapter}
+            await asyncio.to_thread(self.queue.complete, job, worker, 'ok', chapter, chapter['chapter_id'])
+            print(f"Scraped chapter {number}")
+
+    async def store(self, jobs, worker):
+        results = await asyncio.to_thread(self.ingest.write_batch, [job['payload'] for job in jobs])
+        for job, result in zip(jobs, results):
+            if result['status'] == 'error':
+                await asyncio.to_thread(self.queue.fail, job, worker, result['error'])
+            else:
+                await asyncio.to_thread(self.queue.complete, job, worker, result['status'], {}, job['chapter_id'])
+        print(f"Stored {sum(1 for result in results if result['status'] != 'error')} of {len(jobs)} chapters")
+
+    async def translate(self, jobs, worker):
+        for job in jobs:
+            status = await self.translator.process_chapter(self.api_http, job['ranobe_id'], job['chapter_id'])
+            if status == 'done':
+                await asyncio.to_thread(self.queue.complete, job, worker)
+            else:
+                await asyncio.to_thread(self.queue.fail, job, worker, f"Translation {status}")
+
+    async def run(self, stages=STAGES, until_empty=False):
+        self.until_empty = until_empty
+        handlers = {'scrape': self.scrape, 'ingest': self.store, 'translate': self.translate}
+        if 'translate' in stages:
+            # Клиент OpenAI создаётся при импорте, без ключа стадия перевода не запустится
+            import translator
+            self.translator = translator
+
+        limits = httpx.Limits(max_connections=self.concurrency['scrape'] + 2)
+        async with httpx.AsyncClient(timeout=30, limits=limits, follow_redirects=True,
+                                     headers={"User-Agent": chapter_parser.USER_AGENT}) as http, \
+                httpx.AsyncClient(timeout=60) as api_http:
+            self.http, self.api_http = http, api_http
+            workers = [
+                self.worker(stage, index, handlers[stage], STAGES[:STAGES.index(stage) + 1])
+                for stage in stages for index in range(self.concurrency[stage])
+            ]
+            await asyncio.gather(*workers)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    enqueue = commands.add_parser('enqueue', help='Add scrape jobs for a range of chapters')
+    enqueue.add_argument('--ranobe-id', type=int, default=chapter_parser.RANOBE_ID)
+    enqueue.add_argument('--start', type=int, default=chapter_parser.START_CHAPTER)
+    enqueue.add_argument('--count', type=int, default=chapter_parser.NUM_CHAPTERS)
+    enqueue.add_argument('--base-url', default=chapter_parser.BASE_URL)
+    enqueue.add_argument('--retry-failed', action='store_true', help='Put failed jobs of the range back to pending')
+
+    run = commands.add_parser('run', help='Work on queued jobs')
+    run.add_argument('--stages', default=','.join(STAGES), help='Comma-separated stages to run in this process')
+    run.add_argument('--scrape-concurrency', type=int, default=SCRAPE_CONCURRENCY)
+    run.add_argument('--translate-concurrency', type=int, default=TRANSLATE_CONCURRENCY)
+    run.add_argument('--ingest-batch', type=int, default=INGEST_BATCH_SIZE)
+    run.add_argument('--until-empty', action='store_true', help='Exit when the queue has nothing left for these stages')
+
+    commands.add_parser('status', help='Queue depth and throughput per stage')
+    args = parser.parse_args()
+
+    queue = JobQueue(create_write_engine(), MAX_ATTEMPTS)
+    if args.command == 'enqueue':
+        numbers = range(args.start, args.start + args.count)
+        added = queue.enqueue('scrape', args.ranobe_id, numbers, {'base_url': args.base_url}, args.retry_failed)
+        print(f"Queued {added} new scrape jobs of {len(numbers)}")
+    elif args.command == 'run':
+        stages = tuple(stage for stage in STAGES if stage in args.stages.split(','))
+        ingest = ChapterIngest() if 'ingest' in stages else None
+        pipeline = Pipeline(queue, ingest, args.scrape_concurrency, args.translate_concurrency, args.ingest_batch)
+        try:
+            asyncio.run(pipeline.run(stages, args.until_empty))
+        finally:
+            if ingest:
+                ingest.close()
+        print(json.dumps(queue.stats(), indent=2))
+    else:
+        print(json.dumps(queue.stats(), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,161 @@
+"""Буфер позиции чтения с отложенной записью в таблицу bookmark.
+
+Фронтенд сохраняет позицию при прокрутке и перелистывании, то есть часто.
+Вместо запроса и fsync на каждое событие позиция кладётся в словарь в
+памяти воркера: повторные обновления одной ранобэ схлопываются в одно,
+а фоновый поток раз в flush_interval секунд (и при выходе процесса)
+пишет всё накопленное одним INSERT ... ON CONFLICT в одной транзакции.
+
+Буфер у каждого процесса gunicorn свой, потоки одного процесса делят его
+под блокировкой. Чтение позиции сначала смотрит в буфер своего процесса,
+потом в базу. Запись в базу не откатывает более новую позицию: строка
+обновляется, только если событие не старше сохранённого updated_at,
+поэтому порядок сброса разных воркеров не важен. Явная закладка
+(POST /bookmarks/) пишется сразу тем же запросом и с временем от тех же
+часов (utcnow, с микросекундами), так что сравнение одинаково для обоих.
+"""
+import atexit
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+from sqlalchemy import bindparam, exists, or_, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from models import Bookmark, Ranobe
+
+COUNTERS = ('updates', 'coalesced', 'flushes', 'flushed', 'dropped', 'errors')
+
+
+def utcnow():
+    # UTC без часового пояса, как хранит DateTime в SQLite
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def bookmark_upsert_statement():
+    '''Upsert of one buffered position; rows of unknown ranobe are skipped, older events never win'''
+    table = Bookmark.__table__
+    params = {key: bindparam(key, type_=table.c[key].type) for key in ('ranobe_id', 'chapter_id', 'position', 'updated_at')}
+    values = select(
+        params['ranobe_id'], params['chapter_id'], params['position'], params['updated_at'], params['updated_at'],
+    ).where(exists().where(Ranobe.id == params['ranobe_id']))
+    statement = sqlite_insert(table).from_select(
+        ['ranobe_id', 'chapter_id', 'position', 'created_at', 'updated_at'], values)
+    return statement.on_conflict_do_update(
+        index_elements=['ranobe_id'],
+        set_={
+            'chapter_id': statement.excluded.chapter_id,
+            'position': statement.excluded.position,
+            'updated_at': statement.excluded.updated_at,
+        },
+        where=or_(table.c.updated_at.is_(None), statement.excluded.updated_at >= table.c.updated_at),
+    )
+
+
+class ProgressBuffer:
+    def __init__(self, engine, flush_interval=2.0):
+        self.engine = engine
+        self.flush_interval = flush_interval
+        self._pending = {}
+        self._lock = threading.Lock()
+        # Один сброс за раз: фоновый поток, ручной flush и atexit не пересекаются
+        self._flush_lock = threading.Lock()
+        self._counters = dict.fromkeys(COUNTERS, 0)
+        self._last_flush = {'at': None, 'rows': 0, 'seconds': None, 'error': None}
+        self._statement = bookmark_upsert_statement()
+        self._pid = None
+
+    def _ensure_started(self):
+        # Поток запускается в том процессе, который пишет: после fork его не было бы
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._pending.clear()
+        if self.flush_interval > 0:
+            threading.Thread(target=self._run, name='progress-flush', daemon=True).start()
+        atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception:
+                # Ошибка уже посчитана в flush, позиции остались в буфере до следующей попытки
+                pass
+
+    def update(self, ranobe_id, chapter_id, position=0):
+        '''Buffer a reading position; returns the entry as it will be written'''
+        self._ensure_started()
+        entry = {'ranobe_id': ranobe_id, 'chapter_id': chapter_id, 'position': position, 'updated_at': utcnow()}
+        with self._lock:
+            self._counters['updates'] += 1
+            if ranobe_id in self._pending:
+                self._counters['coalesced'] += 1
+            self._pending[ranobe_id] = entry
+        if self.flush_interval <= 0:
+            self.flush()
+        return entry
+
+    def get(self, ranobe_id):
+        '''Buffered position of the ranobe, or None when this process has nothing unsaved for it'''
+        with self._lock:
+            entry = self._pending.get(ranobe_id)
+            return dict(entry, pending=True) if entry else None
+
+    def discard(self, ranobe_id):
+        '''Forget the buffered position, e.g. after the bookmark was set explicitly'''
+        with self._lock:
+            self._pending.pop(ranobe_id, None)
+
+    def save(self, ranobe_id, chapter_id, position=0):
+        '''Write a position right away with the same upsert as flush; returns False if nothing was written'''
+        entry = {'ranobe_id': ranobe_id, 'chapter_id': chapter_id, 'position': position, 'updated_at': utcnow()}
+        # Явная позиция новее всего, что успело накопиться в буфере этого процесса
+        self.discard(ranobe_id)
+        with self.engine.begin() as connection:
+            return connection.execute(self._statement, entry).rowcount > 0
+
+    def flush(self):
+        '''Write everything buffered in one transaction; returns the number of positions written'''
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+            if not batch:
+                return 0
+            started = time.perf_counter()
+            try:
+                with self.engine.begin() as connection:
+                    written = connection.execute(self._statement, list(batch.values())).rowcount
+            except Exception as e:
+                with self._lock:
+                    # Обратно в буфер, если за это время не пришла позиция новее
+                    for ranobe_id, entry in batch.items():
+                        self._pending.setdefault(ranobe_id, entry)
+                    self._counters['errors'] += 1
+                    self._last_flush.update(error=str(e)[:200])
+                raise
+            with self._lock:
+                self._counters['flushes'] += 1
+                self._counters['flushed'] += written
+                # Неизвестная ранобэ или событие старше сохранённого
+                self._counters['dropped'] += len(batch) - written
+                self._last_flush = {
+                    'at': utcnow().isoformat(timespec='seconds'), 'rows': len(batch),
+                    'seconds': round(time.perf_counter() - started, 4), 'error': None,
+                }
+            return written
+
+    def stats(self):
+        with self._lock:
+            return {
+                'pending': len(self._pending),
+                'flush_interval': self.flush_interval,
+                **self._counters,
+                'last_flush': dict(self._last_flush),
+                'pid': os.getpid(),
+            }
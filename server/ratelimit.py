@@ -0,0 +1,107 @@
+"""Ограничение частоты запросов к OpenAI: бюджеты запросов и токенов в минуту.
+
+RateLimiter держит два token bucket'а (запросы и токены), подстраивает их по
+заголовкам x-ratelimit-* из ответов API и останавливает всех клиентов после 429.
+"""
+import asyncio
+import random
+import re
+import time
+
+DURATION_PART = re.compile(r'(\d+(?:\.\d+)?)(ms|s|m|h)')
+DURATION_UNITS = {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600}
+
+
+def parse_duration(value):
+    '''"6m0s", "1.5s", "20ms" or plain seconds -> seconds'''
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        parts = DURATION_PART.findall(value)
+        return sum(float(number) * DURATION_UNITS[unit] for number, unit in parts) if parts else None
+
+
+def backoff_delay(attempt, base=1.0, cap=60.0):
+    '''Exponential backoff with full jitter; attempt starts at 1'''
+    return random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
+
+
+class TokenBucket:
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.tokens = per_minute
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount):
+        self._refill()
+        amount = min(amount, self.capacity)
+        return 0 if self.tokens >= amount else (amount - self.tokens) / self.rate
+
+    def take(self, amount):
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+
+    def give_back(self, amount):
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+    def limit_to(self, remaining):
+        '''Trust the server: never assume more than it reports as remaining'''
+        self._refill()
+        if remaining is not None and remaining < self.tokens:
+            self.tokens = remaining
+
+
+class RateLimiter:
+    def __init__(self, requests_per_minute, tokens_per_minute):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.paused_until = 0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, tokens):
+        '''Wait until one request of the given token cost fits both budgets'''
+        async with self._lock:
+            while True:
+                delay = max(
+                    self.paused_until - time.monotonic(),
+                    self.requests.wait_time(1),
+                    self.tokens.wait_time(tokens),
+                )
+                if delay <= 0:
+                    break
+                await asyncio.sleep(delay)
+            self.requests.take(1)
+            self.tokens.take(tokens)
+
+    def settle(self, reserved, used):
+        '''Return the part of the reservation the request did not use'''
+        if used is not None and used < reserved:
+            self.tokens.give_back(reserved - used)
+
+    def update_from_headers(self, headers):
+        for bucket, kind in ((self.requests, 'requests'), (self.tokens, 'tokens')):
+            remaining = _int(headers.get(f'x-ratelimit-remaining-{kind}'))
+            bucket.limit_to(remaining)
+            reset = parse_duration(headers.get(f'x-ratelimit-reset-{kind}'))
+            if remaining == 0 and reset:
+                self.pause(reset)
+
+    def pause(self, seconds):
+        '''After a 429 nobody sends anything for seconds'''
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+def _int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
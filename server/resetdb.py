@@ -1,6 +1,8 @@
-from app import app, db
+from app import create_app, db
+from models import create_schema, drop_schema
 
+app = create_app()
 with app.app_context():
-    db.drop_all()
-    db.create_all()
+    drop_schema(db.engine)
+    create_schema(db.engine)
     print("Database tables have been recreated.")
@@ -0,0 +1,244 @@
+"""Полнотекстовый поиск по главам на SQLite FTS5.
+
+chapter_fts - contentless-таблица (content=''): в ней только сам индекс
+(rowid = chapter.id), копии текстов глав нет, тексты хранятся один раз,
+сжатыми, в chapter. Индекс обновляется в той же транзакции, что и запись
+главы. Запись из contentless-таблицы удаляется командой 'delete' с тем же
+текстом, что индексировался, поэтому unindex_chapters вызывается до
+изменения строки главы, а index_chapter - после. Подсветка заголовков и
+фрагменты текста строятся в Python по распакованной главе (highlight() и
+snippet() без хранимого текста не работают). Полная перестройка нужна
+только для старых баз (см. backfill).
+"""
+import base64
+import itertools
+import re
+import unicodedata
+
+from sqlalchemy import select, text
+from sqlalchemy.orm import undefer_group
+
+from compression import codec
+from storage import use_writer
+
+FTS_TABLE = 'chapter_fts'
+FTS_COLUMNS = ('title_en', 'title_ru', 'content_en', 'content_ru')
+SNIPPET_TOKENS = 16
+HIGHLIGHT_OPEN = '<mark>'
+HIGHLIGHT_CLOSE = '</mark>'
+ELLIPSIS = '…'
+# Токены unicode61: буквы и цифры, всё остальное - разделители
+TOKEN = re.compile(r'[^\W_]+')
+CYRILLIC = re.compile('[\u0400-\u04ff]')
+
+
+def create_index(connection):
+    '''Create the FTS5 table if it does not exist yet'''
+    connection.execute(text(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+        f"{', '.join(FTS_COLUMNS)}, content='', "
+        "tokenize='unicode61 remove_diacritics 2')"
+    ))
+
+
+def drop_index(connection):
+    # drop_all() виртуальную таблицу не видит, а старые записи без текста совпали бы с новыми rowid
+    connection.execute(text(f"DROP TABLE IF EXISTS {FTS_TABLE}"))
+
+
+def entry_values(chapter):
+    return {column: getattr(chapter, column) or '' for column in FTS_COLUMNS}
+
+
+def index_chapter(session, chapter):
+    '''Add the index entry of a chapter; its old entry must be removed first (unindex_chapters)'''
+    session.execute(
+        text(
+            f"INSERT INTO {FTS_TABLE} (rowid, {', '.join(FTS_COLUMNS)}) "
+            f"VALUES (:id, {', '.join(':' + column for column in FTS_COLUMNS)})"
+        ),
+        {'id': chapter.id, **entry_values(chapter)}
+    )
+
+
+def unindex_chapters(session, chapter_model, *criteria):
+    '''Remove the entries of matching chapters; call before their titles or texts change'''
+    columns = [getattr(chapter_model, column) for column in FTS_COLUMNS]
+    # Снимок читающего пула может быть старше записи: текст для 'delete' читается писателем
+    use_writer(session)
+    # Главы, которых нет в индексе (старая база до backfill), удалять нельзя: 'delete' испортит индекс
+    indexed = text(f"EXISTS (SELECT 1 FROM {FTS_TABLE} WHERE {FTS_TABLE}.rowid = chapter.id)")
+    rows = session.execute(
+        select(chapter_model.id, *columns).where(*criteria, indexed).execution_options(yield_per=200)
+    )
+    statement = text(
+        f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}, rowid, {', '.join(FTS_COLUMNS)}) "
+        f"VALUES ('delete', :id, {', '.join(':' + column for column in FTS_COLUMNS)})"
+    )
+    removed = 0
+    for partition in rows.partitions():
+        session.execute(statement, [{'id': row.id, **entry_values(row)} for row in partition])
+        removed += len(partition)
+    return removed
+
+
+# Подсветка совпадений
+def fold(token):
+    '''Token as unicode61 remove_diacritics 2 compares it: lower case, no diacritics on Latin letters'''
+    folded = []
+    for char in token.lower():
+        base = unicodedata.normalize('NFD', char)
+        folded.append(base[0] if len(base) > 1 and base[0] < '\u0250' else char)
+    return ''.join(folded)
+
+
+def query_terms(query):
+    return {fold(token) for token in TOKEN.findall(query)}
+
+
+def highlight(value, terms):
+    '''value with every matching token wrapped in HIGHLIGHT_OPEN/CLOSE; None stays None'''
+    if value is None:
+        return None
+    return TOKEN.sub(
+        lambda match: HIGHLIGHT_OPEN + match.group() + HIGHLIGHT_CLOSE if fold(match.group()) in terms else match.group(),
+        value
+    )
+
+
+def fragment(value, window, terms):
+    start, end = window[0].start(), window[-1].end()
+    return (
+        (ELLIPSIS if start > 0 else '') +
+        highlight(value[start:end], terms) +
+        (ELLIPSIS if end < len(value) else '')
+    )
+
+
+def snippet(value, terms, tokens=SNIPPET_TOKENS):
+    '''About `tokens` tokens around the first match, highlighted; None when nothing matches'''
+    window = []
+    found = False
+    for match in TOKEN.finditer(value):
+        window.append(match)
+        if not found:
+            if fold(match.group()) in terms:
+                # Как snippet() в FTS5: немного текста перед совпадением
+                window = window[-(tokens // 4 + 1):]
+                found = True
+            elif len(window) > tokens:
+                window.pop(0)
+        elif len(window) >= tokens:
+            break
+    return fragment(value, window, terms) if found else None
+
+
+def best_snippet(row, query, terms):
+    # Сначала текст на языке запроса: в нём совпадение почти наверняка есть
+    langs = ('ru', 'en') if CYRILLIC.search(query) else ('en', 'ru')
+    texts = [codec.decompress(getattr(row, f'content_{lang}')) for lang in langs]
+    for value in texts + [row.title_en, row.title_ru]:
+        if value:
+            found = snippet(value, terms)
+            if found is not None:
+                return found
+    # Как snippet() в FTS5 без совпадения в тексте: его начало
+    value = next((value for value in texts if value), '')
+    window = list(itertools.islice(TOKEN.finditer(value), SNIPPET_TOKENS))
+    return fragment(value, window, terms) if window else ''
+
+
+def build_match_query(query):
+    '''Turn user input into an FTS5 query: every word is a quoted term, all terms required'''
+    terms = [term.replace('"', '""') for term in query.split()]
+    return ' '.join(f'"{term}"' for term in terms if term)
+
+
+def encode_cursor(rank, rowid):
+    return base64.urlsafe_b64encode(f'{rank!r}:{rowid}'.encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        rank, rowid = base64.urlsafe_b64decode(cursor.encode()).decode().split(':')
+        return float(rank), int(rowid)
+    except ValueError:
+        raise ValueError('Invalid cursor')
+
+
+def search(session, query, ranobe_id=None, limit=20, cursor=None):
+    '''Ranked matches with highlighted snippets, paginated by (rank, rowid)'''
+    match = build_match_query(query)
+    if not match:
+        return [], None
+
+    conditions = [f"{FTS_TABLE} MATCH :match"]
+    params = {'match': match, 'limit': limit + 1}
+    if ranobe_id is not None:
+        conditions.append("chapter.ranobe_id = :ranobe_id")
+        params['ranobe_id'] = ranobe_id
+    if cursor:
+        # bm25: чем меньше rank, тем релевантнее
+        params['after_rank'], params['after_rowid'] = decode_cursor(cursor)
+        conditions.append(
+            f"({FTS_TABLE}.rank > :after_rank OR "
+            f"({FTS_TABLE}.rank = :after_rank AND {FTS_TABLE}.rowid > :after_rowid))"
+        )
+
+    rows = session.execute(
+        text(
+            f"SELECT {FTS_TABLE}.rowid AS id, {FTS_TABLE}.rank, chapter.ranobe_id, "
+            "chapter.chapter_id, chapter.chapter_number_origin, chapter.title_en, chapter.title_ru, "
+            "chapter.content_en, chapter.content_ru "
+            f"FROM {FTS_TABLE} JOIN chapter ON chapter.id = {FTS_TABLE}.rowid "
+            f"WHERE {' AND '.join(conditions)} "
+            f"ORDER BY {FTS_TABLE}.rank, {FTS_TABLE}.rowid LIMIT :limit"
+        ),
+        params
+    ).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].rank, rows[-1].id)
+    terms = query_terms(query)
+    hits = [
+        {
+            'id': row.id,
+            'ranobe_id': row.ranobe_id,
+            'chapter_id': row.chapter_id,
+            'chapter_number_origin': row.chapter_number_origin,
+            'title_en': highlight(row.title_en, terms),
+            'title_ru': highlight(row.title_ru, terms),
+            'snippet': best_snippet(row, query, terms),
+            'rank': row.rank,
+        }
+        for row in rows
+    ]
+    return hits, next_cursor
+
+
+def backfill(session, chapter_model, batch_size=200):
+    '''Rebuild the index from scratch in id order, committing once per batch'''
+    # Без хранимого текста старые записи по одной не удалить; прерванную перестройку можно запустить заново
+    session.execute(text(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('delete-all')"))
+    last_id = 0
+    indexed = 0
+    while True:
+        chapters = (
+            session.query(chapter_model)
+            .options(undefer_group('content'))
+            .filter(chapter_model.id > last_id)
+            .order_by(chapter_model.id)
+            .limit(batch_size)
+            .all()
+        )
+        if not chapters:
+            session.commit()
+            return indexed
+        for chapter in chapters:
+            index_chapter(session, chapter)
+        session.commit()
+        last_id = chapters[-1].id
+        indexed += len(chapters)
+        session.expunge_all()
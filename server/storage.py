@@ -0,0 +1,203 @@
+"""Профиль хранения SQLite для нескольких воркеров gunicorn.
+
+- WAL, busy_timeout, mmap, размер кеша и уровень synchronous на каждом соединении;
+- запись идёт через BEGIN IMMEDIATE, поэтому блокировка берётся в начале
+  транзакции и ожидание укладывается в busy_timeout, а не падает с
+  "database is locked" при повышении блокировки;
+- чтение идёт через отдельный пул соединений только для чтения
+  (RoutingSession), которые никогда не ждут писателя;
+- retry_on_busy повторяет запись, если база всё же занята дольше busy_timeout.
+"""
+import os
+import random
+import sqlite3
+import threading
+import time
+from functools import wraps
+
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine, event
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.sql.dml import UpdateBase
+from sqlalchemy.sql.elements import TextClause
+
+DEFAULT_PROFILE = {
+    'enabled': True,  # False - поведение pysqlite по умолчанию, без маршрутизации и повторов
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',  # в режиме WAL не теряет целостность, только последние транзакции при сбое ОС
+    'busy_timeout_ms': 5000,
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size_kb': 64 * 1024,
+    'read_pool_size': 4,
+    'write_retries': 3,
+}
+
+
+def _apply_pragmas(dbapi_connection, profile, readonly):
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA busy_timeout = {int(profile['busy_timeout_ms'])}")
+    cursor.execute(f"PRAGMA mmap_size = {int(profile['mmap_size'])}")
+    # Отрицательное значение - размер в КиБ, а не в страницах
+    cursor.execute(f"PRAGMA cache_size = -{int(profile['cache_size_kb'])}")
+    if readonly:
+        cursor.execute("PRAGMA query_only = 1")
+    else:
+        cursor.execute(f"PRAGMA journal_mode = {profile['journal_mode']}")
+        cursor.execute(f"PRAGMA synchronous = {profile['synchronous']}")
+    cursor.close()
+
+
+def _install_transaction_control(engine, begin_statement):
+    # pysqlite сам открывает отложенные транзакции; забираем это у драйвера
+    @event.listens_for(engine, 'connect')
+    def disable_driver_transactions(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, 'begin')
+    def begin(connection):
+        if connection.get_execution_options().get('isolation_level') != 'AUTOCOMMIT':
+            connection.exec_driver_sql(begin_statement)
+
+
+def is_sqlite(engine):
+    return engine.dialect.name == 'sqlite' and engine.url.database not in (None, '', ':memory:')
+
+
+def configure_write_engine(engine, profile):
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record):
+        _apply_pragmas(dbapi_connection, profile, readonly=False)
+
+    _install_transaction_control(engine, 'BEGIN IMMEDIATE')
+
+
+def create_read_engine(write_engine, profile):
+    path = os.path.abspath(write_engine.url.database)
+
+    def connect():
+        return sqlite3.connect(f'file:{path}?mode=ro', uri=True, check_same_thread=False)
+
+    engine = create_engine(
+        'sqlite://',
+        creator=connect,
+        poolclass=QueuePool,
+        pool_size=profile['read_pool_size'],
+        max_overflow=profile['read_pool_size'],
+    )
+
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record):
+        _apply_pragmas(dbapi_connection, profile, readonly=True)
+
+    # Все запросы одного запроса видят один снимок базы
+    _install_transaction_control(engine, 'BEGIN')
+    return engine
+
+
+class SQLiteStorage:
+    def __init__(self, profile=None):
+        self.profile = {**DEFAULT_PROFILE, **(profile or {})}
+        self._read_engines = {}
+        # id(write_engine) -> [listener(read_engine)]
+        self._read_engine_listeners = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app, db):
+        self.profile.update(app.config.get('SQLITE_PROFILE', {}))
+        app.extensions['sqlite_storage'] = self
+        with app.app_context():
+            engine = db.engine
+        # Соединения, открытые до fork (gunicorn --preload), остаются мастеру:
+        # воркер начинает с пустым пулом, не закрывая чужие соединения
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=lambda: engine.dispose(close=False))
+        if not self.profile['enabled']:
+            self.profile['write_retries'] = 0
+            return
+        if is_sqlite(engine):
+            configure_write_engine(engine, self.profile)
+
+    def read_engine(self, write_engine):
+        '''Read-only engine for the same file, created lazily once per process'''
+        if not self.profile['enabled'] or not is_sqlite(write_engine):
+            return write_engine
+        key = (id(write_engine), os.getpid())
+        engine = self._read_engines.get(key)
+        if engine is None:
+            with self._lock:
+                engine = self._read_engines.get(key)
+                if engine is None:
+                    engine = self._read_engines[key] = create_read_engine(write_engine, self.profile)
+                    for listener in self._read_engine_listeners.get(id(write_engine), ()):
+                        listener(engine)
+        return engine
+
+    def on_read_engine(self, write_engine, listener):
+        '''Call listener(engine) for every read engine of write_engine, including ones created after fork'''
+        with self._lock:
+            self._read_engine_listeners.setdefault(id(write_engine), []).append(listener)
+            engine = self._read_engines.get((id(write_engine), os.getpid()))
+        if engine is not None:
+            listener(engine)
+
+
+storage = SQLiteStorage()
+
+
+def is_write(clause):
+    if isinstance(clause, UpdateBase):
+        return True
+    if isinstance(clause, TextClause):
+        return not clause.text.lstrip().upper().startswith(('SELECT', 'WITH'))
+    return False
+
+
+class RoutingSession(Session):
+    '''Sends reads to the read-only pool until the transaction writes.
+
+    After the first flush or DML statement the rest of the transaction
+    stays on the writer, so it reads its own uncommitted changes.
+    '''
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        engine = super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+        if bind is not None:
+            return engine
+        if self.info.get('writing') or self._flushing or is_write(clause):
+            self.info['writing'] = True
+            return engine
+        return storage.read_engine(engine)
+
+
+@event.listens_for(RoutingSession, 'after_transaction_end')
+def reset_routing(session, transaction):
+    if transaction.parent is None:
+        session.info.pop('writing', None)
+
+
+def use_writer(session):
+    '''Send the rest of the transaction to the writer, for reads a write depends on'''
+    session.info['writing'] = True
+
+
+def is_busy_error(error):
+    message = str(getattr(error, 'orig', error)).lower()
+    return 'database is locked' in message or 'database is busy' in message
+
+
+def retry_on_busy(session, retries=None):
+    '''Re-run a write view when SQLite stays busy longer than busy_timeout'''
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            attempts = (retries if retries is not None else storage.profile['write_retries']) + 1
+            for attempt in range(attempts):
+                try:
+                    return func(*args, **kwargs)
+                except OperationalError as e:
+                    session.rollback()
+                    if not is_busy_error(e) or attempt == attempts - 1:
+                        raise
+                    time.sleep(0.05 * 2 ** attempt * (1 + random.random()))
+        return wrapper
+    return decorator
@@ -0,0 +1,144 @@
+"""Память переводов: готовые ответы модели и чекпоинты глав в локальном SQLite.
+
+Ключ записи - sha256 от (сообщения с исходным текстом и промптом, модель,
+температура), поэтому повторный запуск, ретрай или одинаковый фрагмент в
+другой главе не оплачиваются второй раз. Старые записи вытесняются по
+last_used_at, когда суммарный размер переводов превышает max_bytes.
+
+    python translation_memory.py [path]   # статистика
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import time
+
+DEFAULT_PATH = os.getenv("TRANSLATION_MEMORY_PATH", "translation_memory.db")
+DEFAULT_MAX_BYTES = int(os.getenv("TRANSLATION_MEMORY_MAX_BYTES", 512 * 1024 * 1024))
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS translation (
+    key TEXT PRIMARY KEY,
+    translation TEXT NOT NULL,
+    tokens INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    last_used_at REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS ix_translation_last_used_at ON translation (last_used_at);
+CREATE TABLE IF NOT EXISTS checkpoint (
+    ranobe_id INTEGER NOT NULL,
+    chapter_number INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (ranobe_id, chapter_number)
+);
+CREATE TABLE IF NOT EXISTS stats (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+'''
+
+STAT_NAMES = ('lookups', 'hits', 'misses', 'calls_avoided', 'tokens_avoided', 'evicted')
+
+
+def memory_key(messages, model, temperature):
+    '''Хеш всего, что влияет на ответ модели'''
+    payload = json.dumps([messages, model, temperature], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class TranslationMemory:
+    def __init__(self, path=DEFAULT_PATH, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(SCHEMA)
+        self.conn.executemany('INSERT OR IGNORE INTO stats (name, value) VALUES (?, 0)',
+                              [(name,) for name in STAT_NAMES])
+        self.conn.commit()
+
+    def _count(self, name, amount=1):
+        self.conn.execute('UPDATE stats SET value = value + ? WHERE name = ?', (amount, name))
+
+    def get(self, key):
+        '''Сохранённый перевод или None; попадание засчитывается в статистику'''
+        row = self.conn.execute('SELECT translation, tokens FROM translation WHERE key = ?', (key,)).fetchone()
+        with self.conn:
+            self._count('lookups')
+            if row is None:
+                self._count('misses')
+                return None
+            self.conn.execute('UPDATE translation SET last_used_at = ?, hits = hits + 1 WHERE key = ?',
+                              (time.time(), key))
+            self._count('hits')
+            self._count('calls_avoided')
+            self._count('tokens_avoided', row[1])
+        return row[0]
+
+    def put(self, key, translation, tokens=0):
+        now = time.time()
+        with self.conn:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO translation (key, translation, tokens, size, created_at, last_used_at) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (key, translation, tokens or 0, len(translation.encode('utf-8')), now, now)
+            )
+        self.evict()
+
+    def size(self):
+        return self.conn.execute('SELECT COALESCE(SUM(size), 0) FROM translation').fetchone()[0]
+
+    def evict(self):
+        '''Удаление давно не использованных записей, пока размер больше max_bytes'''
+        excess = self.size() - self.max_bytes
+        if excess <= 0:
+            return 0
+        evicted = 0
+        with self.conn:
+            rows = self.conn.execute('SELECT key, size FROM translation ORDER BY last_used_at')
+            keys = []
+            for key, size in rows:
+                if excess <= 0:
+                    break
+                keys.append((key,))
+                excess -= size
+            self.conn.executemany('DELETE FROM translation WHERE key = ?', keys)
+            evicted = len(keys)
+            self._count('evicted', evicted)
+        return evicted
+
+    def chapter_status(self, ranobe_id, chapter_number):
+        row = self.conn.execute('SELECT status FROM checkpoint WHERE ranobe_id = ? AND chapter_number = ?',
+                                (ranobe_id, chapter_number)).fetchone()
+        return row[0] if row else None
+
+    def mark_chapter(self, ranobe_id, chapter_number, status):
+        with self.conn:
+            self.conn.execute('INSERT OR REPLACE INTO checkpoint (ranobe_id, chapter_number, status, updated_at) '
+                              'VALUES (?, ?, ?, ?)', (ranobe_id, chapter_number, status, time.time()))
+
+    def reset_chapters(self, ranobe_id):
+        with self.conn:
+            self.conn.execute('DELETE FROM checkpoint WHERE ranobe_id = ?', (ranobe_id,))
+
+    def stats(self):
+        counters = dict(self.conn.execute('SELECT name, value FROM stats'))
+        entries, size = self.conn.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM translation').fetchone()
+        counters.update(entries=entries, size=size, max_bytes=self.max_bytes)
+        counters['done_chapters'] = self.conn.execute(
+            "SELECT COUNT(*) FROM checkpoint WHERE status = 'done'").fetchone()[0]
+        return counters
+
+    def close(self):
+        self.conn.close()
+
+
+if __name__ == '__main__':
+    memory = TranslationMemory(sys.argv[1] if len(sys.argv) > 1 else DEFAULT_PATH)
+    for name, value in memory.stats().items():
+        print(f"{name}: {value}")
@@ -1,179 +1,440 @@
-import requests
 import os
-import time
+import re
+import json
 import asyncio
-from openai import AsyncOpenAI
+import argparse
+import httpx
+from openai import AsyncOpenAI, APIConnectionError, APIStatusError, APITimeoutError, RateLimitError
 from dotenv import load_dotenv
 
+from chunking import chunk_content, get_token_counter, join_chunks
+from ratelimit import RateLimiter, backoff_delay, parse_duration
+from translation_memory import TranslationMemory, memory_key
+
 load_dotenv()
 
 # Настройки
 RANOBE_ID = 1
 START_CHAPTER = 691
 NUM_CHAPTERS = 206
-API_URL = "http://127.0.0.1:3000/chapters"
+API_URL = os.getenv("RANOBE_API_URL", "http://127.0.0.1:3000/chapters")
+RANOBE_URL = os.getenv("RANOBE_URL", API_URL.rsplit("/", 1)[0] + "/ranobe")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+MODEL = "gpt-4o"
+TEMPERATURE = 0.7
 MAX_TOKENS = 4096
-RETRY_DELAY = 15  # seconds
+# heuristic или tiktoken (точный подсчёт, нужен пакет tiktoken)
+TOKEN_COUNTER = os.getenv("TOKEN_COUNTER", "heuristic")
+# Сколько заголовков переводится одним запросом
+TITLE_BATCH_SIZE = int(os.getenv("TITLE_BATCH_SIZE", 50))
+TITLE_SYSTEM_PROMPT = "Вы - профессиональный переводчик с английского на русский который умеет по смыслу адаптировать текст в читабельном виде."
+
+# Параллельность и лимиты API (по умолчанию - tier 1 для gpt-4o)
+MAX_CONCURRENT_REQUESTS = int(os.getenv("MAX_CONCURRENT_REQUESTS", 4))
+CHAPTER_CONCURRENCY = int(os.getenv("CHAPTER_CONCURRENCY", 2))
+REQUESTS_PER_MINUTE = int(os.getenv("REQUESTS_PER_MINUTE", 500))
+TOKENS_PER_MINUTE = int(os.getenv("TOKENS_PER_MINUTE", 30000))
+MAX_ATTEMPTS = 6
+# Ответ приходит потоком: пауза между чанками дольше этого считается зависанием
+STREAM_IDLE_TIMEOUT = 60  # seconds
+BACKOFF_BASE = 2  # seconds
+BACKOFF_CAP = 60  # seconds
 
-# Инициализация асинхронного клиента OpenAI
-client = AsyncOpenAI(api_key=OPENAI_API_KEY)
+# Инициализация асинхронного клиента OpenAI (OPENAI_BASE_URL переключает его на локальный сервер).
+# Повторы делает chat_completion, а не клиент
+client = AsyncOpenAI(
+    api_key=OPENAI_API_KEY,
+    max_retries=0,
+    timeout=httpx.Timeout(600, connect=10, read=STREAM_IDLE_TIMEOUT)
+)
+limiter = RateLimiter(REQUESTS_PER_MINUTE, TOKENS_PER_MINUTE)
+request_slots = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+# Готовые переводы и чекпоинты глав (TRANSLATION_MEMORY_PATH)
+memory = TranslationMemory()
+count_tokens = get_token_counter(TOKEN_COUNTER, MODEL)
 
-async def get_chapter_content(ranobe_id, chapter_number):
+async def get_chapter_content(http, ranobe_id, chapter_number):
     """Получение содержания главы с API"""
     print(f"Fetching content for chapter {chapter_number}...")
     try:
-        response = requests.get(f"{API_URL}/{ranobe_id}/{chapter_number}")
+        response = await http.get(f"{API_URL}/{ranobe_id}/{chapter_number}")
         response.raise_for_status()
         data = response.json()
         content = data.get('content_en')
         title = data.get('title_en')
         print(f"Successfully fetched content for chapter {chapter_number}. Length: {len(content)} characters.")
         return content, title
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         print(f"Error fetching chapter {chapter_number}: {e}")
         return None, None
 
-def split_content(content, max_tokens=MAX_TOKENS):
-    """Разделение содержания на части, не превышающие максимальное количество токенов"""
-    words = content.split()
-    parts = []
-    current_part = []
-    current_tokens = 0
-
-    for word in words:
-        word_tokens = len(word) // 4 + 1  # Грубая оценка количества токенов
-        if current_tokens + word_tokens > max_tokens:
-            parts.append(' '.join(current_part))
-            current_part = [word]
-            current_tokens = word_tokens
-        else:
-            current_part.append(word)
-            current_tokens += word_tokens
+def is_retryable(error):
+    if isinstance(error, (RateLimitError, APIConnectionError, APITimeoutError)):
+        return True
+    return isinstance(error, APIStatusError) and error.status_code >= 500
 
-    if current_part:
-        parts.append(' '.join(current_part))
+async def chat_completion(messages, max_tokens, label):
+    """Запрос к chat completions с учётом лимитов, повторами и экспоненциальной задержкой.
+    Возвращает (текст, потраченные токены), текст None при неудаче"""
+    reserved = sum(count_tokens(message["content"]) for message in messages) + max_tokens
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        await limiter.acquire(reserved)
+        used, settled = None, False
+        try:
+            async with request_slots:
+                raw = await client.chat.completions.with_raw_response.create(
+                    model=MODEL,
+                    messages=messages,
+                    temperature=TEMPERATURE,
+                    max_tokens=max_tokens,
+                    stream=True,
+                    stream_options={"include_usage": True}
+                )
+                limiter.update_from_headers(raw.headers)
+                pieces, finish_reason = [], None
+                async for chunk in raw.parse():
+                    if chunk.usage:
+                        used = chunk.usage.total_tokens
+                    for choice in chunk.choices:
+                        if choice.delta.content:
+                            pieces.append(choice.delta.content)
+                        finish_reason = choice.finish_reason or finish_reason
+            limiter.settle(reserved, used)
+            settled = True
+            if finish_reason == "length":
+                # Обрезанный перевод не сохраняем: повтор с тем же запросом обрежется так же
+                print(f"Error during {label}: response truncated at {max_tokens} tokens.")
+                return None, used or reserved
+            if finish_reason is None:
+                raise APIConnectionError(message="Stream ended without finish_reason", request=raw.http_request)
+            return "".join(pieces).strip(), used or reserved
+        except Exception as e:
+            if not settled:
+                # Оборванная попытка возвращает резерв, кроме токенов, о которых API успел сообщить;
+                # до update_from_headers, чтобы остаток по заголовкам 429 всё равно ограничил бюджет
+                limiter.settle(reserved, used or 0)
+            print(f"Error during {label} (Attempt {attempt}/{MAX_ATTEMPTS}): {e}")
+            if not is_retryable(e) or attempt == MAX_ATTEMPTS:
+                return None, 0
+            delay = backoff_delay(attempt, BACKOFF_BASE, BACKOFF_CAP)
+            if isinstance(e, APIStatusError):
+                limiter.update_from_headers(e.response.headers)
+                retry_after = parse_duration(e.response.headers.get("retry-after"))
+                if isinstance(e, RateLimitError):
+                    # Лимит общий для всех задач: останавливаем всех, а не только себя
+                    delay = max(delay, retry_after or 0)
+                    limiter.pause(delay)
+            print(f"Retrying {label} in {delay:.1f} seconds...")
+            await asyncio.sleep(delay)
 
-    print(f"Content split into {len(parts)} parts.")
-    return parts
+async def remembered_completion(messages, max_tokens, label):
+    """chat_completion через память переводов: оплаченный ответ не запрашивается повторно"""
+    key = memory_key(messages, MODEL, TEMPERATURE)
+    remembered = memory.get(key)
+    if remembered is not None:
+        print(f"Using remembered {label}.")
+        return remembered
+    content, tokens = await chat_completion(messages, max_tokens, label)
+    if content:
+        memory.put(key, content, tokens)
+    return content
 
 async def translate_part(part, part_number, total_parts):
     """Перевод части содержания с использованием GPT-4o через асинхронный клиент OpenAI"""
     prompt = (
         "переведи на русский и пожалуйста сохраняй стиль нормального повествования и пунктуацию\n\n"
-        "а не делай тупой машинный перевод\n\nесли че там босс Пэй именно\n\n" + part
+        "а не делай тупой машинный перевод\n\nесли че там босс Пэй именно\n\n"
+        "каждый абзац оригинала - отдельная строка, сохраняй разбиение на абзацы\n\n" + part
     )
 
     print(f"Translating part {part_number}/{total_parts}. Length: {len(part)} characters.")
-    
-    attempt = 1
-    while True:
-        try:
-            completion = await client.chat.completions.create(
-                model="gpt-4o",
-                messages=[
-                    {"role": "system", "content": "Вы - профессиональный переводчик с английского на русский который умеет по смыслу адаптировать текст в читабельном виде и устроняет машинный перевод в угоду человекоподобному адаптивному переводу."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.7,
-                max_tokens=MAX_TOKENS
-            )
-            translated = completion.choices[0].message.content.strip()
-            print(f"Successfully translated part {part_number}/{total_parts}. Translated length: {len(translated)} characters.")
-            return translated
-        except Exception as e:
-            print(f"Error during translation of part {part_number}/{total_parts} (Attempt {attempt}): {e}")
-            if "rate_limit" in str(e).lower():
-                print(f"Rate limit reached. Retrying in {RETRY_DELAY} seconds...")
-                await asyncio.sleep(RETRY_DELAY)
-                attempt += 1
-            else:
-                return None
-
-async def translate_content(content):
-    """Разделение содержания на части, последовательный перевод частей и объединение результатов"""
-    parts = split_content(content)
-    translated_parts = []
-    for i, part in enumerate(parts, 1):
-        translated_part = await translate_part(part, i, len(parts))
-        if translated_part:
-            translated_parts.append(translated_part)
-        else:
-            print(f"Failed to translate part {i}/{len(parts)}. Skipping...")
-        if i < len(parts):
-            print(f"Waiting 1 second before translating the next part...")
-            await asyncio.sleep(1)  # Небольшая задержка между запросами
-    
-    full_translation = " ".join(translated_parts)
+    translated = await remembered_completion(
+        [
+            {"role": "system", "content": "Вы - профессиональный переводчик с английского на русский который умеет по смыслу адаптировать текст в читабельном виде и устроняет машинный перевод в угоду человекоподобному адаптивному переводу."},
+            {"role": "user", "content": prompt}
+        ],
+        MAX_TOKENS,
+        f"translation of part {part_number}/{total_parts}"
+    )
+    if translated:
+        print(f"Successfully translated part {part_number}/{total_parts}. Translated length: {len(translated)} characters.")
+    return translated
+
+async def translate_content(content, on_part=None):
+    """Разделение содержания на части, параллельный перевод частей и объединение результатов.
+    on_part(index, total, text) вызывается для каждой готовой части сразу, не дожидаясь остальных"""
+    parts = chunk_content(content, MAX_TOKENS, count_tokens)
+    print(f"Content split into {len(parts)} parts.")
+
+    async def translate_and_report(part, index):
+        translated = await translate_part(part, index + 1, len(parts))
+        if translated and on_part:
+            await on_part(index, len(parts), translated)
+        return translated
+
+    translated_parts = await asyncio.gather(*(
+        translate_and_report(part, i) for i, part in enumerate(parts)
+    ))
+    failed = [i for i, part in enumerate(translated_parts, 1) if not part]
+    if failed:
+        # Глава с дырой в середине хуже непереведённой
+        print(f"Failed to translate parts {failed} of {len(parts)}. Chapter is left untranslated.")
+        return None
+
+    full_translation = join_chunks(translated_parts)
     print(f"Full translation completed. Total length: {len(full_translation)} characters.")
     return full_translation
 
+def title_messages(title):
+    return [
+        {"role": "system", "content": TITLE_SYSTEM_PROMPT},
+        {"role": "user", "content": f"Переведи на русский заголовок: {title}"}
+    ]
+
 async def translate_title(title):
     """Перевод заголовка главы на русский"""
-    prompt = f"Переведи на русский заголовок: {title}"
     print(f"Translating title: {title}")
-    
-    try:
-        completion = await client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": "Вы - профессиональный переводчик с английского на русский который умеет по смыслу адаптировать текст в читабельном виде."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.7,
-            max_tokens=100  # Небольшой лимит для перевода заголовка
-        )
-        translated_title = completion.choices[0].message.content.strip()
+
+    translated_title = await remembered_completion(
+        title_messages(title),
+        100,  # Небольшой лимит для перевода заголовка
+        "title translation"
+    )
+    if translated_title:
         print(f"Successfully translated title. Translated title: {translated_title}")
-        return translated_title
-    except Exception as e:
-        print(f"Error translating title: {e}")
+    return translated_title
+
+def parse_title_batch(content, expected):
+    """JSON-массив из ответа модели; None, если это не массив из expected элементов"""
+    content = re.sub(r"^```(?:json)?\s*|\s*```$", "", content.strip())
+    try:
+        items = json.loads(content)
+    except ValueError:
+        return None
+    if not isinstance(items, list) or len(items) != expected:
         return None
+    return [item.strip() if isinstance(item, str) and item.strip() else None for item in items]
+
+async def translate_title_batch(titles):
+    """Перевод нескольких заголовков одним запросом: JSON-массив на входе и на выходе.
+    Элементы, которые модель потеряла или вернула пустыми, переводятся по одному"""
+    print(f"Translating {len(titles)} titles in one request...")
+    messages = [
+        {"role": "system", "content": TITLE_SYSTEM_PROMPT + " Отвечай только JSON-массивом строк: "
+                                      "по одному переводу на каждый заголовок, в том же порядке."},
+        {"role": "user", "content": "Переведи на русский заголовки глав:\n" + json.dumps(titles, ensure_ascii=False)}
+    ]
+    max_tokens = min(MAX_TOKENS, sum(count_tokens(title) for title in titles) * 3 + 20)
+    content, tokens = await chat_completion(messages, max_tokens, f"batch of {len(titles)} titles")
+    translated = parse_title_batch(content, len(titles)) if content else None
+    if translated is None:
+        print(f"Batch answer is not a list of {len(titles)} titles. Falling back to one request per title.")
+        translated = [None] * len(titles)
 
-def update_translation(ranobe_id, chapter_number, translated_content, translated_title=None):
+    for title, translated_title in zip(titles, translated):
+        if translated_title:
+            # Под тем же ключом, что и одиночный перевод: translate_title его найдёт
+            memory.put(memory_key(title_messages(title), MODEL, TEMPERATURE), translated_title, tokens // len(titles))
+
+    failed = [i for i, translated_title in enumerate(translated) if not translated_title]
+    if failed and len(failed) < len(titles):
+        print(f"{len(failed)} of {len(titles)} titles are missing from the batch answer. Translating them one by one.")
+    fallback = await asyncio.gather(*(translate_title(titles[i]) for i in failed))
+    for i, translated_title in zip(failed, fallback):
+        translated[i] = translated_title
+    return translated
+
+async def translate_titles(titles):
+    """Перевод списка заголовков пачками по TITLE_BATCH_SIZE; уже переведённые берутся из памяти"""
+    translated = [memory.get(memory_key(title_messages(title), MODEL, TEMPERATURE)) for title in titles]
+    pending = [i for i, translated_title in enumerate(translated) if translated_title is None]
+    batches = [pending[start:start + TITLE_BATCH_SIZE] for start in range(0, len(pending), TITLE_BATCH_SIZE)]
+    results = await asyncio.gather(*(translate_title_batch([titles[i] for i in batch]) for batch in batches))
+    for batch, batch_result in zip(batches, results):
+        for i, translated_title in zip(batch, batch_result):
+            translated[i] = translated_title
+    return translated
+
+async def get_chapter_titles(http, ranobe_id):
+    """chapter_id -> (title_en, title_ru) из оглавления ранобэ"""
+    try:
+        response = await http.get(f"{RANOBE_URL}/{ranobe_id}")
+        response.raise_for_status()
+    except httpx.HTTPError as e:
+        print(f"Error fetching table of contents of ranobe {ranobe_id}: {e}")
+        return {}
+    return {
+        chapter["chapter_id"]: (chapter.get("title_en"), chapter.get("title_ru"))
+        for chapter in response.json().get("chapters", [])
+    }
+
+async def update_translation(http, ranobe_id, chapter_number, translated_content, translated_title=None):
     """Обновление перевода главы на сервере"""
     print(f"Updating translation for chapter {chapter_number}...")
-    data = {"content_ru": translated_content}
+    data = {}
+    if translated_content is not None:
+        data["content_ru"] = translated_content
     if translated_title:
         data["title_ru"] = translated_title
 
     try:
-        response = requests.put(
+        response = await http.put(
             f"{API_URL}/{ranobe_id}/{chapter_number}/update_translation",
             json=data
         )
         response.raise_for_status()
         print(f"Successfully updated translation for chapter {chapter_number}")
-    except requests.exceptions.RequestException as e:
+        return True
+    except httpx.HTTPError as e:
         print(f"Error updating chapter {chapter_number}: {e}")
+        return False
+
+async def append_translation(http, ranobe_id, chapter_number, part, content, complete, translated_title=None):
+    """Дозапись готовой части перевода; part 0 начинает перевод главы заново"""
+    data = {"part": part, "content_ru": content, "complete": complete}
+    if translated_title:
+        data["title_ru"] = translated_title
+
+    try:
+        response = await http.post(
+            f"{API_URL}/{ranobe_id}/{chapter_number}/append_translation",
+            json=data
+        )
+        response.raise_for_status()
+        print(f"Appended part {part + 1} of chapter {chapter_number}{' (complete)' if complete else ''}")
+        return True
+    except httpx.HTTPError as e:
+        print(f"Error appending part {part + 1} of chapter {chapter_number}: {e}")
+        return False
 
-async def process_chapter(ranobe_id, chapter_number):
-    """Обработка одной главы"""
+class ChapterPublisher:
+    """Публикация готовых частей главы по порядку, пока остальные ещё переводятся:
+    читатель видит начало главы со статусом in_progress"""
+
+    def __init__(self, http, ranobe_id, chapter_number):
+        self.http = http
+        self.ranobe_id = ranobe_id
+        self.chapter_number = chapter_number
+        self.title = None
+        self.title_sent = False
+        self.ready = {}
+        self.total = None
+        self.next_part = 0
+        self.failed = False
+        self.lock = asyncio.Lock()
+
+    @property
+    def complete(self):
+        return self.total is not None and self.next_part == self.total
+
+    async def part_done(self, index, total, text):
+        self.total = total
+        self.ready[index] = text
+        async with self.lock:
+            while not self.failed and self.next_part in self.ready:
+                part = self.next_part
+                title = None if self.title_sent else self.title
+                if not await append_translation(self.http, self.ranobe_id, self.chapter_number, part,
+                                                self.ready.pop(part), part == total - 1, title):
+                    self.failed = True
+                    break
+                self.title_sent = self.title_sent or bool(title)
+                self.next_part += 1
+
+async def process_chapter(http, ranobe_id, chapter_number, translated_title=None):
+    """Обработка одной главы; translated_title - заголовок, уже переведённый пачкой.
+    Возвращает done, failed или missing (глава не нашлась на сервере)"""
+    if memory.chapter_status(ranobe_id, chapter_number) == "done":
+        print(f"Chapter {chapter_number} is already translated. Skipping...")
+        return "done"
     print(f"Starting to process chapter {chapter_number}...")
-    content, title = await get_chapter_content(ranobe_id, chapter_number)
+    status = "failed"
+    content, title = await get_chapter_content(http, ranobe_id, chapter_number)
     if content:
         print(f"Starting translation of chapter {chapter_number}...")
-        translated_content = await translate_content(content)
-        translated_title = await translate_title(title)
-        if translated_content:
+        publisher = ChapterPublisher(http, ranobe_id, chapter_number)
+        publisher.title = translated_title
+
+        async def title_task():
+            publisher.title = await translate_title(title)
+            return publisher.title
+
+        if translated_title:
+            translated_content = await translate_content(content, publisher.part_done)
+        else:
+            translated_content, translated_title = await asyncio.gather(
+                translate_content(content, publisher.part_done),
+                title_task()
+            )
+        if translated_content and publisher.complete:
+            print(f"Translation of chapter {chapter_number} completed.")
+            if publisher.title_sent or not translated_title or \
+                    await update_translation(http, ranobe_id, chapter_number, None, translated_title):
+                memory.mark_chapter(ranobe_id, chapter_number, "done")
+                status = "done"
+        elif translated_content:
+            # Дозапись не удалась (или сервер её не умеет): сохраняем главу целиком
             print(f"Translation of chapter {chapter_number} completed. Updating on server...")
-            update_translation(ranobe_id, chapter_number, translated_content, translated_title)
+            if await update_translation(http, ranobe_id, chapter_number, translated_content, translated_title):
+                memory.mark_chapter(ranobe_id, chapter_number, "done")
+                status = "done"
         else:
+            # Начало главы уже на сервере со статусом in_progress, переведённые части - в памяти:
+            # следующий запуск доплатит только за остальные
+            memory.mark_chapter(ranobe_id, chapter_number, "failed")
             print(f"Failed to translate chapter {chapter_number}. Skipping update...")
     else:
         print(f"No content found for chapter {chapter_number}. Skipping...")
+        status = "missing"
     print(f"Finished processing chapter {chapter_number}")
     print("------------------------")
+    return status
+
+async def translate_chapters(ranobe_id, chapter_numbers):
+    """Параллельная обработка глав: не больше CHAPTER_CONCURRENCY глав одновременно,
+    запросы к OpenAI ограничены request_slots и limiter"""
+    chapter_slots = asyncio.Semaphore(CHAPTER_CONCURRENCY)
+    # Один пул соединений с локальным сервером на весь запуск
+    async with httpx.AsyncClient(timeout=60, limits=httpx.Limits(max_connections=CHAPTER_CONCURRENCY * 2)) as http:
+        # Заголовки всех оставшихся глав переводятся заранее, пачками, а не запросом на главу
+        pending = [n for n in chapter_numbers if memory.chapter_status(ranobe_id, n) != "done"]
+        toc = await get_chapter_titles(http, ranobe_id)
+        titled = [n for n in pending if toc.get(n, (None,))[0]]
+        translated_titles = dict(zip(titled, await translate_titles([toc[n][0] for n in titled])))
+
+        async def run(chapter_number):
+            async with chapter_slots:
+                await process_chapter(http, ranobe_id, chapter_number, translated_titles.get(chapter_number))
 
-async def main():
-    """Основная асинхронная функция, последовательно обрабатывающая главы"""
-    for i in range(NUM_CHAPTERS):
-        chapter_number = START_CHAPTER + i
-        await process_chapter(RANOBE_ID, chapter_number)
-        if i < NUM_CHAPTERS - 1:
-            print(f"Waiting 5 seconds before processing the next chapter...")
-            await asyncio.sleep(5)  # Задержка между обработкой глав
+        await asyncio.gather(*(run(chapter_number) for chapter_number in chapter_numbers))
+
+async def backfill_titles(ranobe_id):
+    """Перевод title_ru для глав, у которых его нет"""
+    async with httpx.AsyncClient(timeout=60) as http:
+        toc = await get_chapter_titles(http, ranobe_id)
+        missing = [n for n, (title_en, title_ru) in sorted(toc.items()) if title_en and not title_ru]
+        print(f"{len(missing)} of {len(toc)} chapters have no Russian title.")
+        translated_titles = await translate_titles([toc[n][0] for n in missing])
+        updated = 0
+        for chapter_number, translated_title in zip(missing, translated_titles):
+            if translated_title and await update_translation(http, ranobe_id, chapter_number, None, translated_title):
+                updated += 1
+        print(f"Backfilled {updated} of {len(missing)} titles.")
+
+async def main(backfill=False, ranobe_id=RANOBE_ID):
+    """Основная асинхронная функция"""
+    if backfill:
+        await backfill_titles(ranobe_id)
+    else:
+        await translate_chapters(ranobe_id, range(START_CHAPTER, START_CHAPTER + NUM_CHAPTERS))
+    stats = memory.stats()
+    print(f"Translation memory: {stats['hits']}/{stats['lookups']} hits, "
+          f"{stats['calls_avoided']} API calls and {stats['tokens_avoided']} tokens avoided in total.")
     print("All chapters processed. Script execution completed.")
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    parser = argparse.ArgumentParser(description="Перевод глав ранобэ через OpenAI")
+    parser.add_argument("--backfill-titles", action="store_true", help="Только перевести недостающие title_ru")
+    parser.add_argument("--ranobe-id", type=int, default=RANOBE_ID)
+    args = parser.parse_args()
+    asyncio.run(main(args.backfill_titles, args.ranobe_id))